@@ -0,0 +1,157 @@
+# BumpHunter scan of many spectra at once.
+#
+# Every window of minWidth to maxWidth consecutive bins is tested for
+# an excess: its p-value is P(N >= d|b) for the data d and expectation
+# b summed over the window (1 if d <= b), and the BumpHunter statistic
+# is -log of the smallest one. Window sums come from prefix sums, so
+# each width costs one subtraction over a (spectra x positions) array.
+#
+# Exact Poisson tails are slow for large counts, so the scan runs in
+# two passes over each chunk of spectra. The first ranks all windows
+# by the Wilson-Hilferty approximation to the tail (a closed form);
+# the second evaluates exact p-values only for windows that come
+# within a safety margin of each spectrum's best, and for windows with
+# few counts where the approximation is rough. Memory is bounded by
+# chunkSize spectra at a time.
+#
+# Bin arrays hold only the bins scanned, e.g. the fit range; edges,
+# if given, are their nBins+1 edges and turn window bins into the
+# bumpLowEdge / bumpHighEdge values of the search output.
+
+import numpy as np
+from analysisScripts import statfunctions
+
+class BumpHunter(object) :
+
+  # Margin in approximate significance within which windows are
+  # checked exactly, and counts below which they always are
+  approximationMargin = 0.5
+  exactBelow = 50
+
+  def __init__(self,expected,edges=None,minWidth=1,maxWidth=None,chunkSize=2000) :
+
+    self.expected = np.asarray(expected,dtype=np.float64)
+    self.nBins = len(self.expected)
+    self.edges = None if edges is None else np.asarray(edges,dtype=np.float64)
+    self.minWidth = minWidth
+    self.maxWidth = min(self.nBins,max(minWidth,self.nBins//2) if maxWidth is None else maxWidth)
+    self.chunkSize = chunkSize
+    self.expectedSums = np.concatenate(([0.],np.cumsum(self.expected)))
+
+  ## ----------------------------------------------------
+  ## User-accessible functions
+
+  @property
+  def widths(self) :
+    return range(self.minWidth,self.maxWidth+1)
+
+  def scan(self,counts) :
+    '''Statistic, smallest p-value and first and last bin (0-based) of
+    the most significant window, for each row of counts. For a single
+    spectrum, numbers rather than arrays. A spectrum with no excess
+    anywhere gets p-value 1 and window bins -1.'''
+
+    counts = np.asarray(counts,dtype=np.float64)
+    single = counts.ndim == 1
+    counts = np.atleast_2d(counts)
+    nSpectra = counts.shape[0]
+    smallest = np.ones(nSpectra)
+    first = np.full(nSpectra,-1,dtype=np.int64)
+    last = np.full(nSpectra,-1,dtype=np.int64)
+    for start in range(0,nSpectra,self.chunkSize) :
+      chunk = slice(start,min(start+self.chunkSize,nSpectra))
+      smallest[chunk], first[chunk], last[chunk] = self._scanChunk(counts[chunk])
+    statistic = -np.log(np.maximum(smallest,1e-300))
+    if single :
+      return float(statistic[0]), float(smallest[0]), int(first[0]), int(last[0])
+    return statistic, smallest, first, last
+
+  def statistic(self,counts) :
+    return self.scan(counts)[0]
+
+  def bumpEdges(self,firstBins,lastBins) :
+    '''Low and high edges of windows given by their first and last bins.'''
+    if self.edges is None :
+      raise ValueError("BumpHunter needs bin edges to give bump edges")
+    firstBins = np.asarray(firstBins)
+    lastBins = np.asarray(lastBins)
+    found = firstBins >= 0
+    low = np.where(found,self.edges[np.clip(firstBins,0,self.nBins-1)],np.nan)
+    high = np.where(found,self.edges[np.clip(lastBins+1,0,self.nBins)],np.nan)
+    if low.ndim == 0 :
+      return float(low), float(high)
+    return low, high
+
+  def windowTable(self,counts) :
+    '''Exact p-values of every window of one spectrum, with their first
+    and last bins: the table a tomography plot is drawn from.'''
+
+    counts = np.asarray(counts,dtype=np.float64)
+    dataSums = np.concatenate(([0.],np.cumsum(counts)))
+    firstBins, lastBins, pValues = [], [], []
+    for width in self.widths :
+      d = dataSums[width:]-dataSums[:-width]
+      b = self.expectedSums[width:]-self.expectedSums[:-width]
+      p = np.ones(len(d))
+      excess = d > b
+      p[excess] = statfunctions.poissonPValue(d[excess],b[excess])
+      firstBins.append(np.arange(len(d)))
+      lastBins.append(np.arange(len(d))+width-1)
+      pValues.append(p)
+    return np.concatenate(firstBins), np.concatenate(lastBins), np.concatenate(pValues)
+
+  def tomographyGraph(self,counts,name="bumpHunterTomography") :
+    '''Window p-values of one spectrum as a TGraphErrors: points at
+    the window centres, x errors spanning the windows.'''
+
+    import ROOT
+    firstBins, lastBins, pValues = self.windowTable(counts)
+    low, high = self.bumpEdges(firstBins,lastBins)
+    centres = np.ascontiguousarray(0.5*(low+high))
+    halfWidths = np.ascontiguousarray(0.5*(high-low))
+    graph = ROOT.TGraphErrors(len(pValues),centres,np.ascontiguousarray(pValues),halfWidths,np.zeros(len(pValues)))
+    graph.SetName(name)
+    return graph
+
+  ## ----------------------------------------------------
+  ## Internal functions
+
+  def _approximateZ(self,d,b) :
+    # Wilson-Hilferty: P(N >= d|b) = P(chi2 with 2d dof <= 2b) ~ Phi(z)
+    with np.errstate(divide="ignore",invalid="ignore") :
+      nineD = 9.*d
+      return (np.cbrt(b/d)-(1.-1./nineD))*np.sqrt(nineD)
+
+  def _scanChunk(self,counts) :
+    nSpectra = counts.shape[0]
+    dataSums = np.concatenate((np.zeros((nSpectra,1)),np.cumsum(counts,axis=1)),axis=1)
+
+    # First pass: the most significant window of each spectrum by the approximation
+    bestZ = np.full(nSpectra,np.inf)
+    for width in self.widths :
+      d = dataSums[:,width:]-dataSums[:,:-width]
+      b = self.expectedSums[width:]-self.expectedSums[:-width]
+      z = np.where(d > b,self._approximateZ(d,b),np.inf)
+      bestZ = np.minimum(bestZ,z.min(axis=1))
+
+    # Second pass: exact p-values for the candidates
+    smallest = np.ones(nSpectra)
+    first = np.full(nSpectra,-1,dtype=np.int64)
+    last = np.full(nSpectra,-1,dtype=np.int64)
+    threshold = bestZ[:,np.newaxis]+self.approximationMargin
+    for width in self.widths :
+      d = dataSums[:,width:]-dataSums[:,:-width]
+      b = np.broadcast_to(self.expectedSums[width:]-self.expectedSums[:-width],d.shape)
+      excess = d > b
+      candidates = excess & ((self._approximateZ(d,b) <= threshold) | (d < self.exactBelow))
+      if not np.any(candidates) :
+        continue
+      p = np.ones(d.shape)
+      p[candidates] = statfunctions.poissonPValue(d[candidates],b[candidates])
+      position = np.argmin(p,axis=1)
+      best = p[np.arange(nSpectra),position]
+      better = best < smallest
+      smallest = np.where(better,best,smallest)
+      first = np.where(better,position,first)
+      last = np.where(better,position+width-1,last)
+    return smallest, first, last
@@ -1,43 +1,140 @@
 import ROOT
+import numpy as np
+from art import keyindex
 
 def GetKeyNames( self, dir = "" ):
   self.cd(dir)
-  return [[key.GetName(),key.GetClassName()] for key in ROOT.gDirectory.GetListOfKeys()]
+  return keyindex.indexOpenFile(self).namesAndClasses(dir)
 ROOT.TFile.GetKeyNames = GetKeyNames
 
 def GetZVal (p, excess) :
-  #the function normal_quantile converts a p-value into a significance,
-  #i.e. the number of standard deviations corresponding to the right-tail of 
-  #a Gaussian
-  if excess :
-    zval = ROOT.Math.normal_quantile(1-p,1);
-  else :
-    zval = ROOT.Math.normal_quantile(p,1);
+  #converts a p-value into a significance, i.e. the number of standard
+  #deviations corresponding to the right-tail of a Gaussian. Taken from
+  #the tail itself (not 1-p), so it holds for tiny p; p may be an array
+  from analysisScripts.statfunctions import pToZ
+  return pToZ(p,excess)
 
-  return zval
 
+# Binnings MakeHistoFromStats can choose:
+#   default - nentries/10 equal bins, as it has always done
+#   fd      - Freedman-Diaconis width 2*IQR/n^(1/3)
+#   width   - equal bins of binWidth
+#   tail    - Freedman-Diaconis bins up to the (1-tailFraction) quantile,
+#             then bins tailRefinement times finer, to resolve small p-values
+statBinnings = ["default","fd","width","tail"]
 
-def MakeHistoFromStats(statistics) :
+def _statChunks(statistics,chunkSize) :
+  statistics = np.asarray(statistics,dtype=np.float64).ravel()
+  return [statistics[start:start+chunkSize] for start in range(0,len(statistics),chunkSize)]
 
-  nentries = len(statistics)
-  nBins = int(float(nentries)/10.0)
+def _freedmanDiaconisWidth(accumulator,thismin,thismax) :
+  # Quartiles from the streaming histogram are good to a fine bin, plenty for a bin width
+  lower, upper = accumulator.quantile([0.25,0.75])
+  width = 2.*(upper-lower)/accumulator.count**(1./3.)
+  if not upper-lower > accumulator.width :
+    # No spread between the quartiles that the fine bins resolve
+    # (e.g. constant statistics)
+    width = (thismax-thismin)/max(1.,accumulator.count**(1./3.))
+  return width
 
-  maxVal = max(statistics)
-  minVal = min(statistics)
-  axisrange = maxVal - minVal;
+def StatBinEdges(statistics,binning="default",binWidth=None,tailFraction=0.1,tailRefinement=10,\
+                 maxBins=100000,chunkSize=1000000) :
+  '''Bin edges MakeHistoFromStats uses for statistics, or just
+  (nBins,low,high) for equal bins.'''
 
-  thismin = minVal-0.05*axisrange;
-  thismax = maxVal+0.05*axisrange;
+  if binning not in statBinnings :
+    raise ValueError("Unknown binning {0}: choose from {1}".format(binning,statBinnings))
+  chunks = _statChunks(statistics,chunkSize)
+  nentries = sum(len(chunk) for chunk in chunks)
+  if nentries == 0 :
+    raise ValueError("No statistics to histogram")
 
-  statPlot = ROOT.TH1D("statPlot","",nBins,thismin,thismax)
-  for val in range(len(statistics)) :
-    statPlot.Fill(statistics[val])
+  accumulator = None
+  if binning in ["fd","tail"] :
+    from analysisScripts.stataccumulator import StatAccumulator
+    accumulator = StatAccumulator()
+    for chunk in chunks :
+      accumulator.add(chunk)
+    minVal, maxVal = accumulator.minimum, accumulator.maximum
+  else :
+    minVal = min(chunk.min() for chunk in chunks)
+    maxVal = max(chunk.max() for chunk in chunks)
+  axisrange = maxVal - minVal
+  thismin = minVal-0.05*axisrange
+  thismax = maxVal+0.05*axisrange
+  if axisrange == 0 :
+    thismin, thismax = minVal-0.5, maxVal+0.5
 
-  return statPlot
+  if binning == "default" :
+    return int(float(nentries)/10.0), thismin, thismax
+  if binning == "width" :
+    if not binWidth or binWidth <= 0 :
+      raise ValueError("Binning 'width' needs a positive binWidth")
+    nBins = max(1,int(np.ceil((thismax-thismin)/binWidth)))
+    if nBins > maxBins :
+      return maxBins, thismin, thismax
+    return nBins, thismin, thismin+nBins*binWidth
 
-def rms(x):
-  mean = np.mean(x)
-  sumvec = [(val-mean)*(val-mean) for val in x]
-  stddev = np.sqrt(np.sum(sumvec)/np.size(x))
-  return stddev
+  width = _freedmanDiaconisWidth(accumulator,thismin,thismax)
+  if binning == "fd" :
+    nBins = max(1,min(int(np.ceil((thismax-thismin)/width)),maxBins))
+    return nBins, thismin, thismax
 
+  # Tail-refined: coarse bins below the cut, fine ones above it
+  cut = float(accumulator.quantile(1.-tailFraction))
+  nBulk = max(1,int(np.ceil((cut-thismin)/width)))
+  nTail = max(1,int(np.ceil((thismax-cut)*tailRefinement/width)))
+  if nBulk+nTail > maxBins :
+    scale = float(maxBins)/(nBulk+nTail)
+    nBulk = max(1,int(nBulk*scale))
+    nTail = max(1,maxBins-nBulk)
+  return np.concatenate((np.linspace(thismin,cut,nBulk+1)[:-1],np.linspace(cut,thismax,nTail+1)))
+
+def MakeHistoFromStats(statistics,binning="default",binWidth=None,tailFraction=0.1,tailRefinement=10,\
+                       maxBins=100000,name="statPlot",chunkSize=1000000) :
+  '''Histogram of pseudo-experiment statistics (a list, array or
+  memory-mapped array), filled in one go. Bins are counted a chunk at
+  a time, so memory use beyond the input is bounded by chunkSize and
+  the number of bins. See statBinnings for the choice of binning;
+  maxBins does not limit the default one.'''
+
+  from art import histarrays
+  binningResult = StatBinEdges(statistics,binning,binWidth,tailFraction,tailRefinement,maxBins,chunkSize)
+  if isinstance(binningResult,tuple) :
+    nBins, thismin, thismax = binningResult
+    statPlot = ROOT.TH1D(name,"",nBins,thismin,thismax)
+    edges = None
+  else :
+    edges = np.asarray(binningResult,dtype=np.float64)
+    statPlot = ROOT.TH1D(name,"",len(edges)-1,edges)
+  nBins = statPlot.GetNbinsX()
+
+  # Same bin finding as TAxis::FindBin; stats as Fill would have kept them
+  counts = np.zeros(nBins+2)
+  stats = np.zeros(4)
+  for chunk in _statChunks(statistics,chunkSize) :
+    if edges is None :
+      bins = np.floor(nBins*(chunk-thismin)/(thismax-thismin))+1
+      bins = np.clip(bins,0,nBins+1).astype(np.int64)
+      bins[chunk < thismin] = 0
+    else :
+      bins = np.searchsorted(edges,chunk,side="right")
+    counts += np.bincount(bins,minlength=nBins+2)
+    inRange = chunk[(bins > 0) & (bins <= nBins)]
+    stats += [len(inRange),len(inRange),np.sum(inRange),np.sum(np.square(inRange))]
+
+  histarrays.setContents(statPlot,counts)
+  statPlot.PutStats(stats)
+  statPlot.SetEntries(float(np.sum(counts)))
+  return statPlot
+
+def rms(x,weights=None,chunkSize=1000000):
+  # Spread about the mean, accumulated a chunk at a time: x may be
+  # a list, an array, a memory-mapped array or any iterable
+  from analysisScripts.runningvariance import RunningVariance
+  spread = RunningVariance()
+  if weights is None :
+    spread.update(x,chunkSize)
+  else :
+    spread.add(x,weights)
+  return spread.rms
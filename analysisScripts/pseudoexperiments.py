@@ -0,0 +1,170 @@
+# Null-case pseudo-experiments for the search phase, generated locally.
+#
+# The fitted background (basicBkgFromFit) is taken as the expected
+# count in each bin. Poisson toys are drawn a batch at a time as a
+# (toys x bins) array and the three test statistics of the search
+# phase are computed for the whole batch at once:
+#   chi2       - sum of (d-b)^2/b over bins with data
+#   logL       - minus the Poisson log-likelihood, -sum log P(d|b)
+#   bumpHunter - -log of the smallest Poisson p-value P(N >= d|b) of
+#                any window of consecutive bins with an excess
+# Larger values are less background-like for all three, so p-values
+# are the fraction of toys at or above the observed value, as the
+# survival functions in searchFileData take them.
+#
+# Batches are spread over a process pool. Batch i always draws from
+# RandomState([seed,i]), so results depend only on the seed and the
+# batch size, not on the number of workers.
+#
+# nullCaseHistograms gives the statistics as the TH1Ds the search
+# output holds (logLikelihoodStatHistNullCase, chi2StatHistNullCase,
+# bumpHunterStatHistNullCase), ready for searchFileData and
+# drawPseudoExperimentsWithObservedStat.
+
+import multiprocessing
+import numpy as np
+from analysisScripts import statfunctions
+
+statisticNames = ["chi2","logL","bumpHunter"]
+
+# Statistic -> name of its histogram in the search output
+nullCaseHistogramNames = {
+  "chi2" : "chi2StatHistNullCase",
+  "logL" : "logLikelihoodStatHistNullCase",
+  "bumpHunter" : "bumpHunterStatHistNullCase",
+}
+
+## ----------------------------------------------------
+## Test statistics
+
+def chi2Statistic(counts,expected) :
+  '''chi2 of each row of counts against expected, skipping bins with
+  no data or no expectation.'''
+  counts = np.atleast_2d(np.asarray(counts,dtype=np.float64))
+  expected = np.asarray(expected,dtype=np.float64)
+  used = (counts != 0) & (expected > 0)
+  with np.errstate(divide="ignore",invalid="ignore") :
+    terms = np.square(counts-expected)/expected
+  return np.sum(np.where(used,terms,0.),axis=1)
+
+def logLStatistic(counts,expected) :
+  '''Minus the Poisson log-likelihood of each row of counts.'''
+  counts = np.atleast_2d(np.asarray(counts,dtype=np.float64))
+  expected = np.asarray(expected,dtype=np.float64)
+  with np.errstate(divide="ignore",invalid="ignore") :
+    logTerms = np.where(counts > 0,counts*np.log(np.where(expected > 0,expected,1.)),0.)
+  return -np.sum(logTerms-expected-statfunctions.logFactorial(counts),axis=1)
+
+def bumpHunterStatistic(counts,expected,minWidth=1,maxWidth=None) :
+  '''-log of the smallest p-value of an excess in any window of
+  minWidth to maxWidth (default half the bins) consecutive bins.'''
+  from analysisScripts.bumphunter import BumpHunter
+  return BumpHunter(expected,minWidth=minWidth,maxWidth=maxWidth).statistic(np.atleast_2d(counts))
+
+def toyStatistics(counts,expected,minWidth=1,maxWidth=None) :
+  '''All three statistics for each row of counts, by name.'''
+  return {"chi2" : chi2Statistic(counts,expected),\
+          "logL" : logLStatistic(counts,expected),\
+          "bumpHunter" : bumpHunterStatistic(counts,expected,minWidth,maxWidth)}
+
+## ----------------------------------------------------
+## Generation
+
+def generateToys(expected,nToys,seed,batch) :
+  '''Poisson toys of batch number batch: a (nToys x bins) array.'''
+  state = np.random.RandomState([seed,batch])
+  return state.poisson(np.asarray(expected,dtype=np.float64),size=(nToys,len(expected))).astype(np.float64)
+
+def _runBatch(task) :
+  expected, nToys, seed, batch, minWidth, maxWidth = task
+  return toyStatistics(generateToys(expected,nToys,seed,batch),expected,minWidth,maxWidth)
+
+def generateNullStatistics(expected,nToys,seed=0,nWorkers=1,batchSize=10000,minWidth=1,maxWidth=None,firstBatch=0) :
+  '''Statistics of nToys null-case pseudo-experiments around the
+  expected counts, as a dictionary of arrays. Batches are numbered
+  from firstBatch, so further toys can be added without repeats.'''
+
+  expected = np.asarray(expected,dtype=np.float64)
+  tasks = []
+  for batch, start in enumerate(range(0,nToys,batchSize)) :
+    tasks.append((expected,min(batchSize,nToys-start),seed,firstBatch+batch,minWidth,maxWidth))
+
+  if nWorkers > 1 and len(tasks) > 1 :
+    pool = multiprocessing.Pool(min(nWorkers,len(tasks)))
+    try :
+      results = pool.map(_runBatch,tasks,1)
+    finally :
+      pool.close()
+      pool.join()
+  else :
+    results = [_runBatch(task) for task in tasks]
+
+  statistics = {}
+  for name in statisticNames :
+    statistics[name] = np.concatenate([result[name] for result in results]) if results else np.zeros(0)
+  return statistics
+
+def expectationFromSearchFile(filename,permitWindow=False) :
+  '''Expected counts (basicBkgFromFit) of a search output in its fit
+  range, and the numbers of the first and last bins used.'''
+
+  from art import histarrays
+  from analysisScripts.searchphase import searchFileData
+  data = searchFileData(filename,permitWindow,lazy=True)
+  try :
+    background = data.basicBkgFromFit
+    contents = np.array(histarrays.contents(background),dtype=np.float64)
+    edges = np.array(histarrays.edges(background),dtype=np.float64)
+    fitLow, fitHigh = data.fitLow, data.fitHigh
+  finally :
+    data.close()
+  # Bins lying within the fit range
+  bins = np.arange(1,len(edges))
+  inRange = (edges[:-1] >= fitLow-1e-6*abs(fitLow)) & (edges[1:] <= fitHigh+1e-6*abs(fitHigh)) & (contents[bins] > 0)
+  if not np.any(inRange) :
+    raise ValueError("No background in the fit range of {0}".format(filename))
+  firstBin, lastBin = bins[inRange][0], bins[inRange][-1]
+  return contents[firstBin:lastBin+1], firstBin, lastBin
+
+## ----------------------------------------------------
+## Output
+
+def nullCaseHistograms(statistics,binning="default",**binningOptions) :
+  '''The statistics as TH1Ds named as in the search output.'''
+  from analysisScripts.generalfunctions import MakeHistoFromStats
+  histograms = {}
+  for name in statisticNames :
+    histograms[name] = MakeHistoFromStats(statistics[name],binning,name=nullCaseHistogramNames[name],**binningOptions)
+  return histograms
+
+def writeNullCaseHistograms(filename,statistics,binning="default",mode="UPDATE",**binningOptions) :
+  import ROOT
+  outfile = ROOT.TFile.Open(filename,mode)
+  try :
+    for name, hist in nullCaseHistograms(statistics,binning,**binningOptions).items() :
+      outfile.cd()
+      hist.Write(hist.GetName(),ROOT.TObject.kOverwrite)
+  finally :
+    outfile.Close()
+
+if __name__ == "__main__" :
+
+  import sys
+  import time
+  import argparse
+  parser = argparse.ArgumentParser(description="Generate null-case pseudo-experiments around the fit in a search output.")
+  parser.add_argument("searchfile",help="search-phase output holding basicBkgFrom4ParamFit")
+  parser.add_argument("outfile",help="ROOT file the null-case histograms are written to")
+  parser.add_argument("-n","--nToys",type=int,default=10000,help="number of pseudo-experiments")
+  parser.add_argument("-s","--seed",type=int,default=0,help="random seed")
+  parser.add_argument("-j","--jobs",type=int,default=1,help="number of worker processes")
+  parser.add_argument("--batchSize",type=int,default=10000,help="pseudo-experiments per batch")
+  parser.add_argument("--binning",default="default",choices=["default","fd","width","tail"],help="histogram binning")
+  options = parser.parse_args()
+
+  start = time.time()
+  expected, firstBin, lastBin = expectationFromSearchFile(options.searchfile)
+  statistics = generateNullStatistics(expected,options.nToys,options.seed,options.jobs,options.batchSize)
+  writeNullCaseHistograms(options.outfile,statistics,options.binning,"RECREATE")
+  print("{0} pseudo-experiments over bins {1}-{2} in {3:.1f} s".format(options.nToys,firstBin,lastBin,time.time()-start))
+  sys.exit(0)
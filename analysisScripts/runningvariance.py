@@ -0,0 +1,126 @@
+# Mean, variance and rms without holding the values.
+#
+# A RunningVariance takes values a chunk at a time: each chunk's
+# weighted mean and sum of squared deviations are computed from the
+# chunk alone and combined with the running ones by the pairwise
+# update of Chan, Golub and LeVeque (Welford's update when chunks are
+# single values). Nothing like sum(x^2) - n*mean^2 is ever formed, so
+# the result stays accurate when the spread is tiny compared with the
+# mean. Accumulators filled in different processes merge the same way.
+#
+# With axis=None every value goes into one mean and variance. With an
+# axis, chunks are stacks reduced along that axis: e.g. axis=0 over
+# arrays of shape (nToys,nBins) gives a per-bin spread across toys.
+
+import numpy as np
+
+class RunningVariance(object) :
+
+  def __init__(self,axis=None) :
+
+    self.axis = axis
+    self.count = 0      # entries, whatever their weights
+    self.weight = 0.    # sum of weights; mean and m2 are arrays if axis is set
+    self.mean = 0.
+    self.m2 = 0.        # weighted sum of squared deviations from mean
+
+  ## ----------------------------------------------------
+  ## User-accessible functions
+
+  def add(self,values,weights=None) :
+    '''Add a chunk of values, optionally weighted. Weights have the
+    shape of values, or with an axis may be one per slice along it.'''
+
+    values = np.asarray(values,dtype=np.float64)
+    if self.axis is None :
+      values = values.ravel()
+      axis = 0
+    else :
+      axis = self.axis
+    if values.size == 0 :
+      return
+
+    if weights is None :
+      weight = float(values.shape[axis])
+      mean = np.mean(values,axis=axis)
+      m2 = np.sum(np.square(values-np.expand_dims(mean,axis)),axis=axis)
+    else :
+      weights = np.asarray(weights,dtype=np.float64)
+      if self.axis is None :
+        weights = np.broadcast_to(weights,values.shape).ravel() if weights.ndim == 0 else weights.ravel()
+      elif weights.ndim == 1 and values.ndim > 1 :
+        # One weight per slice along the axis
+        shape = [1]*values.ndim
+        shape[axis] = len(weights)
+        weights = weights.reshape(shape)
+      weights = np.broadcast_to(weights,values.shape)
+      weight = np.sum(weights,axis=axis)
+      with np.errstate(divide="ignore",invalid="ignore") :
+        mean = np.where(weight > 0,np.sum(weights*values,axis=axis)/weight,0.)
+      m2 = np.sum(weights*np.square(values-np.expand_dims(mean,axis)),axis=axis)
+
+    self._combine(values.shape[axis],weight,mean,m2)
+
+  def update(self,source,chunkSize=1000000) :
+    '''Add everything in source: an array (memory-mapped arrays are
+    read chunkSize entries along the axis at a time), or any iterable
+    of numbers or of arrays. Returns self.'''
+
+    if isinstance(source,np.ndarray) :
+      axis = 0 if self.axis is None else self.axis
+      flat = source.reshape(-1) if self.axis is None else source
+      for start in range(0,flat.shape[axis],chunkSize) :
+        index = [slice(None)]*flat.ndim
+        index[axis] = slice(start,start+chunkSize)
+        self.add(flat[tuple(index)])
+      return self
+
+    pending = []
+    for item in source :
+      if np.ndim(item) > 0 and self.axis is None :
+        self.add(item)
+        continue
+      pending.append(item)
+      if len(pending) == chunkSize :
+        self.add(pending)
+        pending = []
+    if pending :
+      self.add(pending)
+    return self
+
+  def merge(self,other) :
+    '''Add everything other has seen to this accumulator.'''
+    if other.count :
+      self._combine(other.count,other.weight,other.mean,other.m2)
+
+  def variance(self,ddof=0) :
+    '''Weighted variance. ddof=1 treats the weights as frequencies.'''
+    with np.errstate(divide="ignore",invalid="ignore") :
+      result = np.where(np.asarray(self.weight)-ddof > 0,self.m2/(np.asarray(self.weight)-ddof),np.nan)
+    return float(result) if result.ndim == 0 else result
+
+  def std(self,ddof=0) :
+    return np.sqrt(self.variance(ddof))
+
+  @property
+  def rms(self) :
+    # Spread about the mean, as generalfunctions.rms has always defined it
+    return self.std()
+
+  ## ----------------------------------------------------
+  ## Internal functions
+
+  def _combine(self,count,weight,mean,m2) :
+    if self.count == 0 :
+      self.count, self.weight, self.mean, self.m2 = count, weight, mean, m2
+      return
+    total = self.weight+weight
+    delta = mean-self.mean
+    with np.errstate(divide="ignore",invalid="ignore") :
+      fraction = np.where(total > 0,weight/np.where(total > 0,total,1.),0.)
+    self.mean = self.mean+delta*fraction
+    self.m2 = self.m2+m2+np.square(delta)*self.weight*fraction
+    self.weight = total
+    self.count += count
+    if self.axis is None :
+      self.weight, self.mean, self.m2 = float(self.weight), float(self.mean), float(self.m2)
@@ -1,8 +1,21 @@
 #!/usr/bin/env python
 
 import os
+import glob
+import json
+import time
+import traceback
+import multiprocessing
 import ROOT
 from art.morisot import Morisot
+from art import histarrays
+from art import ratios
+from art import plotcache
+from art import plotfarm
+from art import keyindex
+from analysisScripts.windowscan import RemainderChi2Scan
+from analysisScripts.survivalfunction import SurvivalFunction
+from analysisScripts import searchsnapshot
 from array import array
 import sys
 import numpy as np
@@ -10,261 +23,533 @@ import math
 
 def GetKeyNames( self, dir = "" ):
         self.cd(dir)
-        return [key.GetName() for key in ROOT.gDirectory.GetListOfKeys()]
+        return keyindex.indexOpenFile(self).names(dir)
 ROOT.TFile.GetKeyNames = GetKeyNames
 
-class searchFileData :
-
-  def __init__(self,filename,permitWindow=False) :
+# Objects read straight from the search output: attribute -> key
+_searchObjects = {
+  "basicData" : "basicData",
+  "basicBkgFromFit" : "basicBkgFrom4ParamFit",
+  "residualHist" : "residualHist",
+  "relativeDiffHist" : "relativeDiffHist",
+  "sigOfDiffHist" : "sigOfDiffHist",
+  "logLikelihoodPseudoStatHist" : "logLikelihoodStatHistNullCase",
+  "chi2PseudoStatHist" : "chi2StatHistNullCase",
+  "bumpHunterStatHist" : "bumpHunterStatHistNullCase",
+  "bumpHunterTomographyPlot" : "bumpHunterTomographyFromPseudoexperiments",
+}
+
+# Numbers stored in vectors: attribute -> (key, index[, conversion])
+_searchNumbers = {
+  "fitLow" : ("FitRange",0),
+  "fitHigh" : ("FitRange",1),
+  "logLOfFitToData" : ("logLOfFitToData",0),
+  "logLPVal" : ("logLOfFitToData",1),
+  "chi2OfFitToData" : ("chi2OfFitToData",0),
+  "chi2PVal" : ("chi2OfFitToData",1),
+  "bumpHunterStatFitToData" : ("bumpHunterPLowHigh",0),
+  "bumpLowEdge" : ("bumpHunterPLowHigh",1),
+  "bumpHighEdge" : ("bumpHunterPLowHigh",2),
+  "bumpHunterPVal" : ("bumpHunterStatOfFitToData",1),
+  "bumpHunterStatFitToDataInitial" : ("bumpHunterStatOfFitToDataInitial",0),
+  "bumpHunterPValInitial" : ("bumpHunterStatOfFitToDataInitial",1),
+  "bumpHunterStatFitToDataRefined" : ("bumpHunterStatOfFitToDataRefined",0),
+  "bumpHunterPValRefined" : ("bumpHunterStatOfFitToDataRefined",1),
+  "NDF" : ("NDF",0),
+  "excludeWindow" : ("excludeWindowNums",0,lambda value : int(value+0.5)),
+  "bottomWindowEdge" : ("excludeWindowNums",1),
+  "topWindowEdge" : ("excludeWindowNums",2),
+}
+
+# Everything else, grouped by the function that sets it
+_searchGroups = {
+  "_readRemainderStats" : ["BHPValRemainder","LogLPValRemainder","Chi2PValRemainder"],
+  "_readStatUncertainty" : ["nominalPlus1Stat","nominalMinus1Stat"],
+  "_makeStatRatios" : ["plusNomRatio","minusNomRatio"],
+  "_readAlternateFit" : ["alternateFit","nomFit_symmetricFitChoiceErr",\
+                         "asymmFitUncertainty","asymmFitUncertainty_averageDir"],
+  "_makeAlternateRatio" : ["altFuncRatio"],
+  "_makeRemainderChi2Scan" : ["remainderChi2Scan"],
+  "_makeBumpHunterSurvival" : ["bumpHunterSurvival"],
+  "_makeChi2Survival" : ["chi2Survival"],
+  "_makeLogLikelihoodSurvival" : ["logLikelihoodSurvival"],
+}
+
+# Groups that can be worked out from a snapshot alone
+_snapshotGroups = ["_makeRemainderChi2Scan","_makeBumpHunterSurvival","_makeChi2Survival","_makeLogLikelihoodSurvival"]
+
+def _snapshotNames() :
+  # Everything a snapshot holds
+  names = list(_searchObjects)+list(_searchNumbers)
+  for loader, attributes in _searchGroups.items() :
+    if loader not in _snapshotGroups :
+      names += attributes
+  return names
+
+# Marks an attribute not read yet
+_unset = object()
+
+class searchFileData(object) :
+
+  # One slot per quantity rather than a __dict__ per instance, so
+  # thousands of instances stay small
+  __slots__ = ["permitWindow","filename","snapshot","_file","_keys"]+\
+              sorted(set(list(_searchObjects)+list(_searchNumbers)+sum(_searchGroups.values(),[])))
+
+  def __init__(self,filename,permitWindow=False,lazy=False,snapshot=False) :
+
+    # With lazy=True nothing is read until it is first used:
+    # each attribute is read from the file (or derived) on first
+    # access. The file stays open until close() is called and is
+    # reopened if anything else is needed after that.
+    #
+    # With snapshot=True everything is read from the sidecar
+    # snapshot (see searchsnapshot.py) if the file has not changed
+    # since it was written; otherwise the file is read in full and
+    # a new snapshot is written.
 
     self.permitWindow = permitWindow
+    self.filename = filename
+    self._file = None
+    self._keys = None
+    self.snapshot = None
+    if snapshot :
+      self.snapshot = searchsnapshot.SearchSnapshot.load(filename)
+      if self.snapshot is not None :
+        return
 
     #print "opening",filename
-    searchInputFile = ROOT.TFile.Open(filename,"READ")
+    searchInputFile = self._openFile()
 
     # Check if readable and return None if not.
     bit = searchInputFile.TestBit(ROOT.TFile.kRecovered)
     if bit :
-      print "File",file,"not closed, skipping..."
+      print "File",filename,"not closed, skipping..."
+      self.close()
       raise ValueError
-    
-    keys = searchInputFile.GetKeyNames()
-
-    # Retrieve search phase inputs
-    self.basicData = searchInputFile.Get("basicData")
-    self.basicData.SetDirectory(0)
-    self.basicBkgFromFit = searchInputFile.Get("basicBkgFrom4ParamFit")
-    self.basicBkgFromFit.SetDirectory(0)
-    self.residualHist = searchInputFile.Get("residualHist")
-    self.residualHist.SetDirectory(0)
-    self.relativeDiffHist = searchInputFile.Get("relativeDiffHist")
-    self.relativeDiffHist.SetDirectory(0)
-    self.sigOfDiffHist = searchInputFile.Get("sigOfDiffHist")
-    self.sigOfDiffHist.SetDirectory(0)
-    self.logLikelihoodPseudoStatHist = searchInputFile.Get("logLikelihoodStatHistNullCase")
-    self.logLikelihoodPseudoStatHist.SetDirectory(0)
-    self.chi2PseudoStatHist = searchInputFile.Get("chi2StatHistNullCase")
-    self.chi2PseudoStatHist.SetDirectory(0)
-    self.bumpHunterStatHist = searchInputFile.Get("bumpHunterStatHistNullCase")
-    self.bumpHunterStatHist.SetDirectory(0)
-    self.bumpHunterTomographyPlot = searchInputFile.Get('bumpHunterTomographyFromPseudoexperiments')
-
-    fitRange = searchInputFile.Get("FitRange")
-    self.fitLow = fitRange[0]
-    self.fitHigh = fitRange[1]
-
-    bumpHunterStatOfFitToData = searchInputFile.Get('bumpHunterStatOfFitToData')
-    bumpHunterStatOfFitToDataInitial = searchInputFile.Get('bumpHunterStatOfFitToDataInitial')
-    bumpHunterStatOfFitToDataRefined = searchInputFile.Get('bumpHunterStatOfFitToDataRefined')
-    logLOfFitToDataVec = searchInputFile.Get('logLOfFitToData')
-    chi2OfFitToDataVec = searchInputFile.Get('chi2OfFitToData')
-    statOfFitToData = searchInputFile.Get('bumpHunterPLowHigh')
-    self.logLOfFitToData = logLOfFitToDataVec[0]
-    self.logLPVal = logLOfFitToDataVec[1]
-    self.chi2OfFitToData = chi2OfFitToDataVec[0]
-    self.chi2PVal = chi2OfFitToDataVec[1]
-    self.bumpHunterStatFitToData = statOfFitToData[0]
-    self.bumpHunterPVal = bumpHunterStatOfFitToData[1]
-    self.bumpLowEdge = statOfFitToData[1]
-    self.bumpHighEdge = statOfFitToData[2]
-    self.bumpHunterStatFitToDataInitial = bumpHunterStatOfFitToDataInitial[0]
-    self.bumpHunterPValInitial = bumpHunterStatOfFitToDataInitial[1]
-    self.bumpHunterStatFitToDataRefined = bumpHunterStatOfFitToDataRefined[0]
-    self.bumpHunterPValRefined = bumpHunterStatOfFitToDataRefined[1]
-
-    self.NDF = searchInputFile.Get('NDF')[0]
-
-    excludeWindowNums = searchInputFile.Get('excludeWindowNums')
-    self.excludeWindow = int(excludeWindowNums[0]+0.5)
-    self.bottomWindowEdge = excludeWindowNums[1]
-    self.topWindowEdge = excludeWindowNums[2]
 
+    if snapshot :
+      self.writeSnapshot()
+      self.close()
+    elif not lazy :
+      self.loadAll()
+      self.close()
+
+  def __getattr__(self,name) :
+
+    # Only called for attributes not yet read
+    if name.startswith("__") :
+      raise AttributeError(name)
+    snapshot = self._peek("snapshot")
+    if snapshot is not _unset and snapshot is not None :
+      self._readSnapshot(name)
+    elif name in _searchObjects :
+      self._readObject(name)
+    elif name in _searchNumbers :
+      self._readNumbers(_searchNumbers[name][0])
+    else :
+      for loader, attributes in _searchGroups.items() :
+        if name in attributes :
+          getattr(self,loader)()
+          break
+    value = self._peek(name)
+    if value is _unset :
+      raise AttributeError(name)
+    return value
+
+  def _peek(self,name) :
+    # Value of an attribute if it has been set, without reading anything
+    try :
+      return object.__getattribute__(self,name)
+    except AttributeError :
+      return _unset
+
+  def loadAll(self) :
+    if self.snapshot is not None :
+      for name in _snapshotNames() :
+        if self.snapshot.has(name) :
+          getattr(self,name)
+      return
+    for name in _searchObjects :
+      getattr(self,name)
+    for key in set(entry[0] for entry in _searchNumbers.values()) :
+      self._readNumbers(key)
+    for loader in ["_readRemainderStats","_readStatUncertainty","_makeStatRatios",\
+                   "_readAlternateFit","_makeAlternateRatio"] :
+      getattr(self,loader)()
+
+  def close(self) :
+    if self._file is not None :
+      self._file.Close()
+      self._file = None
+
+  def writeSnapshot(self) :
+    # Read everything and store it in the sidecar snapshot
+    self.loadAll()
+    scalars = {}
+    histograms = {}
+    graphs = {}
+    missing = []
+    for name in _snapshotNames() :
+      value = self._peek(name)
+      if value is _unset :
+        continue
+      if value is None :
+        missing.append(name)
+      elif isinstance(value,(int,long,float)) :
+        scalars[name] = value
+      elif value.InheritsFrom("TH1") :
+        histograms[name] = value
+      elif value.InheritsFrom("TGraph") :
+        graphs[name] = value
+    # Remainder stats are stored whenever the file has them, so the
+    # snapshot serves any permitWindow
+    if self.excludeWindow and self._hasKey("BHLogLAndChi2OfRemainderAfterWindow") :
+      scalars.update(zip(_searchGroups["_readRemainderStats"],self._remainderStats()))
+    return searchsnapshot.writeSnapshot(self.filename,scalars,histograms,graphs,missing)
+
+  def _readSnapshot(self,name) :
+    if name in _searchGroups["_readRemainderStats"] and not (self.excludeWindow and self.permitWindow) :
+      return
+    if self.snapshot.has(name) :
+      value = self.snapshot.value(name)
+      if name in _searchNumbers and len(_searchNumbers[name]) > 2 :
+        value = _searchNumbers[name][2](value)
+      setattr(self,name,value)
+      return
+    for loader in _snapshotGroups :
+      if name in _searchGroups[loader] :
+        getattr(self,loader)()
+
+  # Arrays of a histogram, from the snapshot if there is one
+  def _contents(self,name) :
+    if self.snapshot is not None :
+      return self.snapshot.contents(name)
+    return histarrays.contents(getattr(self,name))
+
+  def _errors(self,name) :
+    if self.snapshot is not None :
+      return self.snapshot.errors(name)
+    return histarrays.errors(getattr(self,name))
+
+  def _edges(self,name) :
+    if self.snapshot is not None :
+      return self.snapshot.edges(name)
+    return histarrays.edges(getattr(self,name))
+
+  def _binLowEdges(self,name) :
+    if self.snapshot is not None :
+      return self.snapshot.binLowEdges(name)
+    return histarrays.binLowEdges(getattr(self,name))
+
+  ## Reading from the file
+
+  def _openFile(self) :
+    if self._file is None or not self._file.IsOpen() :
+      self._file = ROOT.TFile.Open(self.filename,"READ")
+    return self._file
+
+  def _hasKey(self,key) :
+    if self._keys is None :
+      self._keys = set(keyindex.indexOpenFile(self._openFile()).names())
+    return key in self._keys
+
+  def _get(self,key) :
+    item = self._openFile().Get(key)
+    if hasattr(item,"SetDirectory") :
+      item.SetDirectory(0)
+    return item
+
+  def _readObject(self,name) :
+    setattr(self,name,self._get(_searchObjects[name]))
+
+  def _readNumbers(self,key) :
+    # One read sets every attribute stored in this vector. Older
+    # outputs lack some vectors: their attributes are left unset,
+    # so asking for them raises AttributeError.
+    vector = self._openFile().Get(key)
+    if not vector :
+      return
+    for name, entry in _searchNumbers.items() :
+      if entry[0] != key :
+        continue
+      value = vector[entry[1]]
+      if len(entry) > 2 :
+        value = entry[2](value)
+      setattr(self,name,value)
+
+  def _readRemainderStats(self) :
     if (self.excludeWindow and self.permitWindow) :
-      statsOfRemainingSpectrum = searchInputFile.Get("BHLogLAndChi2OfRemainderAfterWindow")
-      self.BHPValRemainder = statsOfRemainingSpectrum[0]
-      self.LogLPValRemainder = statsOfRemainingSpectrum[1]
-      self.Chi2PValRemainder = statsOfRemainingSpectrum[2]
+      self.BHPValRemainder, self.LogLPValRemainder, self.Chi2PValRemainder = self._remainderStats()
 
-    # Stat uncertainty on fit: only available sometimes
-    if "nominalBkgFromFit_plus1Sigma" in keys :
-      self.nominalPlus1Stat = searchInputFile.Get('nominalBkgFromFit_plus1Sigma')
-      self.nominalPlus1Stat.SetDirectory(0)
-      self.nominalMinus1Stat = searchInputFile.Get('nominalBkgFromFit_minus1Sigma')
-      self.nominalMinus1Stat.SetDirectory(0)
-    
-      # Make ratio plots for stat uncertainty
-      self.plusNomRatio = self.nominalPlus1Stat.Clone()
-      self.plusNomRatio.SetName("ratioPlot_fitUncertainty_plus1Sigma")
-      self.plusNomRatio.Reset(); self.plusNomRatio.SetDirectory(0)
-      self.minusNomRatio = self.nominalMinus1Stat.Clone()
-      self.minusNomRatio.SetName("ratioPlot_fitUncertainty_minus1Sigma")
-      self.minusNomRatio.Reset(); self.minusNomRatio.SetDirectory(0)
-      for bin in range(0,self.basicBkgFromFit.GetNbinsX()+1) :
-        if self.basicBkgFromFit.GetBinContent(bin) == 0 :
-          self.plusNomRatio.SetBinContent(bin,0)
-          self.minusNomRatio.SetBinContent(bin,0)
-        else :
-          upVal = (self.nominalPlus1Stat.GetBinContent(bin)-self.basicBkgFromFit.GetBinContent(bin))/self.basicBkgFromFit.GetBinContent(bin)
-          downVal = (self.nominalMinus1Stat.GetBinContent(bin)-self.basicBkgFromFit.GetBinContent(bin))/self.basicBkgFromFit.GetBinContent(bin)
-          self.plusNomRatio.SetBinContent(bin,upVal)
-          self.minusNomRatio.SetBinContent(bin,downVal)
+  def _remainderStats(self) :
+    statsOfRemainingSpectrum = self._openFile().Get("BHLogLAndChi2OfRemainderAfterWindow")
+    return statsOfRemainingSpectrum[0], statsOfRemainingSpectrum[1], statsOfRemainingSpectrum[2]
 
+  def _readStatUncertainty(self) :
+    # Stat uncertainty on fit: only available sometimes
+    if self._hasKey("nominalBkgFromFit_plus1Sigma") :
+      self.nominalPlus1Stat = self._get('nominalBkgFromFit_plus1Sigma')
+      self.nominalMinus1Stat = self._get('nominalBkgFromFit_minus1Sigma')
+
+  def _makeStatRatios(self) :
+    # Make ratio plots for stat uncertainty
+    if not self._hasKey("nominalBkgFromFit_plus1Sigma") :
+      return
+    self.plusNomRatio, self.minusNomRatio = ratios.createRelativeDifferences(self.basicBkgFromFit,\
+      [self.nominalPlus1Stat,self.nominalMinus1Stat],\
+      ["ratioPlot_fitUncertainty_plus1Sigma","ratioPlot_fitUncertainty_minus1Sigma"])
+
+  def _readAlternateFit(self) :
     # Alternate function things: only available sometimes
-    if "alternateFitOnRealData" in keys :
-      self.alternateFit = searchInputFile.Get('alternateFitOnRealData')
-      self.alternateFit.SetDirectory(0)
-      self.nomFit_symmetricFitChoiceErr = searchInputFile.Get('nomOnDataWithSymmetricRMSScaleFuncChoiceErr')
-      self.nomFit_symmetricFitChoiceErr.SetDirectory(0)
-      if "nomOnDataWithDirectedRMSScaleFuncChoiceErr" in keys :
-        self.asymmFitUncertainty = searchInputFile.Get('nomOnDataWithDirectedRMSScaleFuncChoiceErr')
+    if self._hasKey("alternateFitOnRealData") :
+      self.alternateFit = self._get('alternateFitOnRealData')
+      self.nomFit_symmetricFitChoiceErr = self._get('nomOnDataWithSymmetricRMSScaleFuncChoiceErr')
+      if self._hasKey("nomOnDataWithDirectedRMSScaleFuncChoiceErr") :
+        self.asymmFitUncertainty = self._get('nomOnDataWithDirectedRMSScaleFuncChoiceErr')
       else :
-        self.asymmFitUncertainty = searchInputFile.Get('nomPlusDirectedRMSScaleFuncChoiceErr')
-      self.asymmFitUncertainty.SetDirectory(0)
-      if "nomPlusRMSScaleFuncChoiceErr_averageDirection" in keys :
-        self.asymmFitUncertainty_averageDir = searchInputFile.Get('nomPlusRMSScaleFuncChoiceErr_averageDirection')
-        self.asymmFitUncertainty_averageDir.SetDirectory(0)
+        self.asymmFitUncertainty = self._get('nomPlusDirectedRMSScaleFuncChoiceErr')
+      if self._hasKey("nomPlusRMSScaleFuncChoiceErr_averageDirection") :
+        self.asymmFitUncertainty_averageDir = self._get('nomPlusRMSScaleFuncChoiceErr_averageDirection')
       else :
         self.asymmFitUncertainty_averageDir = None
-
-      # Make ratio plot for alternate function.
-      self.altFuncRatio = self.alternateFit.Clone()
-      self.altFuncRatio.SetName("ratioPlot_functionChoiceUncertainty")
-      self.altFuncRatio.Reset(); self.altFuncRatio.SetDirectory(0)
-      for bin in range(0,self.basicBkgFromFit.GetNbinsX()+1) :
-        if self.basicBkgFromFit.GetBinContent(bin) == 0 :
-          self.altFuncRatio.SetBinContent(bin,0)
-        else :
-          val = (self.asymmFitUncertainty.GetBinContent(bin)-self.basicBkgFromFit.GetBinContent(bin))/self.basicBkgFromFit.GetBinContent(bin)
-          self.altFuncRatio.SetBinContent(bin,val)
-
     else :
       self.alternateFit = None
       self.nomFit_symmetricFitChoiceErr = None
       self.asymmFitUncertainty = None
       self.asymmFitUncertainty_averageDir = None
-    
-    
 
-    searchInputFile.Close()
+  def _makeAlternateRatio(self) :
+    # Make ratio plot for alternate function.
+    if self.alternateFit :
+      self.altFuncRatio, = ratios.createRelativeDifferences(self.basicBkgFromFit,\
+        [self.asymmFitUncertainty],["ratioPlot_functionChoiceUncertainty"],[self.alternateFit])
+
+  def _makeRemainderChi2Scan(self) :
+    self.remainderChi2Scan = RemainderChi2Scan(self._contents("basicData"),\
+      self._contents("basicBkgFromFit"),self._errors("basicBkgFromFit"),self._binLowEdges("basicBkgFromFit"))
+
+  # p-values from the pseudo-experiments, cumulated once per histogram
+  def _makeBumpHunterSurvival(self) :
+    self.bumpHunterSurvival = SurvivalFunction(self._contents("bumpHunterStatHist"),self._edges("bumpHunterStatHist"))
+
+  def _makeChi2Survival(self) :
+    self.chi2Survival = SurvivalFunction(self._contents("chi2PseudoStatHist"),self._edges("chi2PseudoStatHist"))
+
+  def _makeLogLikelihoodSurvival(self) :
+    self.logLikelihoodSurvival = SurvivalFunction(self._contents("logLikelihoodPseudoStatHist"),self._edges("logLikelihoodPseudoStatHist"))
 
   def getPValErrs(self) :
 
     # (DeltaX/X)^2 = (1/DeltaX)^2 = 1/X: set errors
-    nRightBH = self.bumpHunterStatHist.Integral(self.bumpHunterStatHist.FindBin(self.bumpHunterStatFitToData),self.bumpHunterStatHist.GetNbinsX())
-    nLeftBH = self.bumpHunterStatHist.Integral() - nRightBH
-    if nRightBH > 0 and nLeftBH > 0 : deltaPvalBH = self.bumpHunterPVal * math.sqrt(1/nRightBH + 1/nLeftBH)
-    else : deltaPvalBH = 0
-    nRightChi2 = self.chi2PseudoStatHist.Integral(self.chi2PseudoStatHist.FindBin(self.chi2OfFitToData),self.chi2PseudoStatHist.GetNbinsX())
-    nLeftChi2 = self.chi2PseudoStatHist.Integral() - nRightChi2
-    if nRightChi2 > 0 and nLeftChi2 > 0 : deltaPvalChi2 = self.chi2PVal * math.sqrt(1/nRightChi2 + 1/nLeftChi2)
-    else : deltaPvalChi2 = 0
-    nRightLogL = self.logLikelihoodPseudoStatHist.Integral(self.logLikelihoodPseudoStatHist.FindBin(self.logLOfFitToData),self.logLikelihoodPseudoStatHist.GetNbinsX())
-    nLeftLogL = self.logLikelihoodPseudoStatHist.Integral() - nRightLogL
-    if nRightLogL > 0 and nLeftLogL > 0 : deltaPvalLogL = self.logLPVal * math.sqrt(1/nRightLogL + 1/nLeftLogL)
-    else : deltaPvalLogL = 0
+    deltaPvalBH = self.bumpHunterSurvival.pValueErrors(self.bumpHunterStatFitToData,self.bumpHunterPVal)
+    deltaPvalChi2 = self.chi2Survival.pValueErrors(self.chi2OfFitToData,self.chi2PVal)
+    deltaPvalLogL = self.logLikelihoodSurvival.pValueErrors(self.logLOfFitToData,self.logLPVal)
 
     return deltaPvalBH,deltaPvalChi2,deltaPvalLogL
 
   def calculateRemainingChi2(self) :
 
-    firstBin = 0
-    for bin in range(1,self.basicBkgFromFit.GetNbinsX()+2) :
-      firstBin = bin
-      if self.basicBkgFromFit.GetBinContent(bin) > 0 :
-        break
-    lastBin = 0
-    for bin in range(self.basicBkgFromFit.GetNbinsX()+1,0,-1) :
-      lastBin = bin
-      if self.basicBkgFromFit.GetBinContent(bin) > 0 :
-        break
-    firstWindowBin = 0
-    lastWindowBin = 0
+    # p-value of the chi2 of the spectrum outside the excluded window
+    scan = self.remainderChi2Scan
     if self.excludeWindow :
-      for bin in range(1,self.basicBkgFromFit.GetNbinsX()+2) :
-        if math.fabs(self.basicBkgFromFit.GetBinLowEdge(bin) - self.bottomWindowEdge) < 0.1 :
-          firstWindowBin = bin
-        if math.fabs(self.basicBkgFromFit.GetBinLowEdge(bin)+self.basicBkgFromFit.GetBinWidth(bin) - self.topWindowEdge) < 0.1 :
-          lastWindowBin = bin
-
-    answer = 0
-    for bin in range(firstBin,lastBin+1) :
-
-      if self.excludeWindow and bin >= firstWindowBin and bin <= lastWindowBin : continue
-
-      d = self.basicData.GetBinContent(bin)
-      if (d==0) : continue
-      b = self.basicBkgFromFit.GetBinContent(bin)
-      deltaB = self.basicBkgFromFit.GetBinError(bin)
-
-      term = (d - b) / math.sqrt(b+deltaB*deltaB)
-      answer = answer + (term*term)
+      answer = scan.remainderChi2([self.bottomWindowEdge],[self.topWindowEdge])[0]
+    else :
+      answer = scan.total
+    return self.chi2Survival.pValue(answer)
+
+  def scanExclusionWindows(self,lowEdges,highEdges,tolerance=0.1) :
+
+    # Remainder chi2 and its pseudo-experiment p-value for every
+    # window [lowEdges[i],highEdges[i]] in one go
+    chi2 = self.remainderChi2Scan.remainderChi2(lowEdges,highEdges,tolerance)
+    return chi2, self.chi2Survival.pValue(chi2)
+
+  def makeSearchPhasePlots(self,myPainter,lowX,highX,luminosity,folder,ext,extraLegendLines=[],suppressText=False,nWorkers=1,incremental=True) :
+
+    # Figures are declared in _searchPhaseFigures. With nWorkers > 1
+    # they are drawn in parallel worker processes, each reading this
+    # file again. With incremental=True a figure whose inputs, options
+    # and painter settings are unchanged since the last run (and whose
+    # output is still there) is not redrawn. Returns, and prints, the
+    # time spent on each figure.
+
+    options = {"lowX" : lowX, "highX" : highX, "luminosity" : luminosity, "folder" : folder,\
+               "ext" : ext, "extraLegendLines" : list(extraLegendLines), "suppressText" : suppressText}
+    self._preparePainter(myPainter,options)
+    settings = plotcache.painterSettings(myPainter)
+
+    stampname = os.path.join(folder,".searchPhasePlots.json")
+    stamps = {}
+    if incremental and os.path.exists(stampname) :
+      with open(stampname) as infile :
+        stamps = json.load(infile)
+
+    # Work out what needs drawing
+    results = []
+    toDraw = []
+    for name, method, inputs, condition in _searchPhaseFigures :
+      if condition and not getattr(self,condition) :
+        continue
+      outputname = "{0}/{1}".format(folder,name)+ext
+      callargs = {"inputs" : [getattr(self,item) for item in inputs], "options" : options, "output" : outputname}
+      key = plotcache.contentKey(getattr(self,method),callargs,settings)
+      if incremental and stamps.get(name) == key and glob.glob(outputname+".*") :
+        results.append({"name" : name, "seconds" : 0., "skipped" : True, "key" : key, "error" : None})
+        continue
+      toDraw.append((name,method,key))
+
+    if nWorkers > 1 and len(toDraw) > 1 :
+      painterName = myPainter.__class__.__name__
+      tasks = [(self.filename,self.permitWindow,self.snapshot is not None,painterName,settings,name,method,options)\
+               for name, method, key in toDraw]
+      pool = multiprocessing.Pool(min(nWorkers,len(tasks)),plotfarm.initialiseWorker)
+      try :
+        drawn = pool.map(_drawSearchPhaseFigure,tasks,1)
+      finally :
+        pool.close()
+        pool.join()
+    else :
+      drawn = []
+      for name, method, key in toDraw :
+        # A failing figure is reported, as from the workers, and the rest still drawn
+        result = {"name" : name, "seconds" : 0., "skipped" : False, "error" : None}
+        start = time.time()
+        try :
+          getattr(self,method)(myPainter,options)
+        except Exception :
+          result["error"] = traceback.format_exc()
+        result["seconds"] = time.time()-start
+        drawn.append(result)
+      myPainter.flushOutput()
+
+    for (name, method, key), result in zip(toDraw,drawn) :
+      result["key"] = key
+      results.append(result)
+      if result["error"] is None :
+        stamps[name] = key
+      else :
+        stamps.pop(name,None)
+    with open(stampname,"w") as outfile :
+      json.dump(stamps,outfile,indent=1,sort_keys=True)
+
+    order = [figure[0] for figure in _searchPhaseFigures]
+    results.sort(key=lambda result : order.index(result["name"]))
+    for result in results :
+      status = "skipped" if result["skipped"] else ("FAILED" if result["error"] else "drawn")
+      print "{0:<50} {1:>8.2f} s  {2}".format(result["name"],result["seconds"],status)
+      if result["error"] :
+        print result["error"]
+    return results
+
+  def _preparePainter(self,myPainter,options) :
+    myPainter.dodrawUsersText = not options["suppressText"]
+    myPainter.luminosity = options["luminosity"]
+    myPainter.CME = 13
+    if hasattr(myPainter,"lumInFb") :
+      myPainter.lumInFb = round(float(myPainter.luminosity)/float(1000),myPainter.nLumiSigFigs)
+
+  ## Search phase figures: see _searchPhaseFigures
+
+  def _figureBins(self,options) :
+    return self.basicData.FindBin(options["lowX"]), self.basicData.FindBin(options["highX"])
+
+  def _drawFigure1(self,myPainter,options) :
+
+    firstBin, lastBin = self._figureBins(options)
+    outputname = '{0}/figure1'.format(options["folder"])+options["ext"]
+    if self.excludeWindow and self.permitWindow :
+      myPainter.drawDataAndFitOverSignificanceHist(self.basicData,self.basicBkgFromFit,self.residualHist,\
+         'm_{jj} [GeV]','Events','Significance',outputname,\
+         options["lowX"],options["highX"],firstBin,lastBin,True,self.bumpLowEdge,self.bumpHighEdge,doWindowLimits=self.excludeWindow,windowLow=self.bottomWindowEdge,windowHigh=self.topWindowEdge,extraLegendLines=options["extraLegendLines"],writeOnpval=True,pval=self.bumpHunterPVal)
+    else :
+      myPainter.drawDataAndFitOverSignificanceHist(self.basicData,self.basicBkgFromFit,self.residualHist,\
+         'm_{jj} [GeV]','Events','Significance',outputname,\
+         options["lowX"],options["highX"],firstBin,lastBin,True,self.bumpLowEdge,self.bumpHighEdge,extraLegendLines=options["extraLegendLines"],writeOnpval=True,pval=self.bumpHunterPVal)
 
-    nRightChi2 = self.chi2PseudoStatHist.Integral(self.chi2PseudoStatHist.FindBin(answer),self.chi2PseudoStatHist.GetNbinsX())
-    nTotal = self.chi2PseudoStatHist.Integral()
-    return float(nRightChi2)/float(nTotal)
+  def _drawLogLStatPlot(self,myPainter,options) :
+    myPainter.drawPseudoExperimentsWithObservedStat(self.logLikelihoodPseudoStatHist,float(self.logLOfFitToData),self.logLPVal,0,\
+       'logL statistic','Pseudo-exeperiments',"{0}/logLStatPlot".format(options["folder"])+options["ext"])
 
+  def _drawChi2StatPlot(self,myPainter,options) :
+    myPainter.drawPseudoExperimentsWithObservedStat(self.chi2PseudoStatHist,float(self.chi2OfFitToData),self.chi2PVal,0,\
+       "#chi^{2}",'Pseudo-exeperiments',"{0}/chi2StatPlot".format(options["folder"])+options["ext"])
 
-  def makeSearchPhasePlots(self,myPainter,lowX,highX,luminosity,folder,ext,extraLegendLines=[],suppressText=False) :
- 
-    firstBin = self.basicData.FindBin(lowX)
-    lastBin = self.basicData.FindBin(highX)
+  def _drawBumpHunterStatPlot(self,myPainter,options) :
+    myPainter.drawPseudoExperimentsWithObservedStat(self.bumpHunterStatHist,float(self.bumpHunterStatFitToData),self.bumpHunterPVal,0,\
+       'BumpHunter','Pseudo-exeperiments',"{0}/bumpHunterStatPlot".format(options["folder"])+options["ext"])
 
-    myPainter.dodrawUsersText = not suppressText
+  def _drawTomographyPlot(self,myPainter,options) :
+    myPainter.drawBumpHunterTomographyPlot(self.bumpHunterTomographyPlot,"{0}/bumpHunterTomographyPlot".format(options["folder"])+options["ext"])
 
-    if self.excludeWindow and self.permitWindow :
-      myPainter.drawDataAndFitOverSignificanceHist(self.basicData,self.basicBkgFromFit,self.residualHist,\
-         'm_{jj} [GeV]','Events','Significance','{0}/figure1'.format(folder)+ext,\
-         luminosity,13,lowX,highX,firstBin,lastBin,True,self.bumpLowEdge,self.bumpHighEdge,doWindowLimits=self.excludeWindow,windowLow=self.bottomWindowEdge,windowHigh=self.topWindowEdge,extraLegendLines=extraLegendLines,writeOnpval=True,pval=self.bumpHunterPVal)
-    else :
-      myPainter.drawDataAndFitOverSignificanceHist(self.basicData,self.basicBkgFromFit,self.residualHist,\
-         'm_{jj} [GeV]','Events','Significance','{0}/figure1'.format(folder)+ext,\
-         luminosity,13,lowX,highX,firstBin,lastBin,True,self.bumpLowEdge,self.bumpHighEdge,extraLegendLines=extraLegendLines,writeOnpval=True,pval=self.bumpHunterPVal)
-    
-    myPainter.drawPseudoExperimentsWithObservedStat(self.logLikelihoodPseudoStatHist,float(self.logLOfFitToData),self.logLPVal,0,luminosity,13,\
-       'logL statistic','Pseudo-exeperiments',"{0}/logLStatPlot".format(folder)+ext)
-    myPainter.drawPseudoExperimentsWithObservedStat(self.chi2PseudoStatHist,float(self.chi2OfFitToData),self.chi2PVal,0,luminosity,13,\
-       "#chi^{2}",'Pseudo-exeperiments',"{0}/chi2StatPlot".format(folder)+ext)
-    myPainter.drawPseudoExperimentsWithObservedStat(self.bumpHunterStatHist,float(self.bumpHunterStatFitToData),self.bumpHunterPVal,0,luminosity,13,\
-       'BumpHunter','Pseudo-exeperiments',"{0}/bumpHunterStatPlot".format(folder)+ext)
-    myPainter.drawBumpHunterTomographyPlot(self.bumpHunterTomographyPlot,"{0}/bumpHunterTomographyPlot".format(folder)+ext)
+  def _drawFunctionChoicePlot(self,myPainter,options) :
 
     # Plots with alternate function
-    if self.alternateFit :
-    
-      # Make lines I can use for function choice uncertainty plot
-      # Need this to round out a pair.
-      placeHolderNom = self.basicBkgFromFit.Clone()
-      placeHolderNom.SetName("placeHolderNom")
-    
-      # Find y range to use for residuals
-      ylow = 0.0
-      yhigh = 0.0
-      lowPoint = 1e10
-      highPoint = -1e10
-      for residual in [self.altFuncRatio,self.minusNomRatio,self.plusNomRatio] :
-        for bin in range(firstBin,lastBin+1) :
-          val = residual.GetBinContent(bin)
-          if val < lowPoint :
-            lowPoint = val
-          if val > highPoint :
-            highPoint = val
-      if lowPoint < 0 :
-        ylow = lowPoint*1.2
-        yhigh = highPoint*(1.2)
-      else :
-        ylow = lowPoint - 0.9*(highPoint - lowPoint)
-        yhigh = highPoint + 0.9*(highPoint - lowPoint)
-      # symmetrise
-      if abs(ylow) < yhigh :
-        ylow = -1 * yhigh
-      else :
-        yhigh = -1 * ylow
-    
-      myPainter.drawDataWithFitAsHistogramAndResidualPaper(self.basicData,self.basicBkgFromFit,luminosity,13,\
-         "m_{jj} [GeV]","Events",["Data","Fit","Statistical uncertainty on fit","Function choice"],\
-         "{0}/compareFitQualityAndFitChoice_Asymm_WithRatio".format(folder)+ext,drawError=True,\
-         errors = [[self.nominalPlus1Stat,self.nominalMinus1Stat],[placeHolderNom,self.asymmFitUncertainty]],\
-         residualList = [self.altFuncRatio,self.minusNomRatio,self.plusNomRatio],residYRange = [ylow,yhigh],\
-         binlow = firstBin, binhigh = lastBin, doLogY = True, doLogX = True, drawAsSmoothCurve = True,\
-         doRectangular = False, doLegTopRight = False)
-
+    firstBin, lastBin = self._figureBins(options)
+
+    # Make lines I can use for function choice uncertainty plot
+    # Need this to round out a pair.
+    placeHolderNom = self.basicBkgFromFit.Clone()
+    placeHolderNom.SetName("placeHolderNom")
+
+    # Find y range to use for residuals
+    residuals = [self.altFuncRatio,self.minusNomRatio,self.plusNomRatio]
+    values = np.concatenate([histarrays.contents(residual)[firstBin:lastBin+1] for residual in residuals])
+    lowPoint = min(1e10,values.min()) if len(values) else 1e10
+    highPoint = max(-1e10,values.max()) if len(values) else -1e10
+    if lowPoint < 0 :
+      ylow = lowPoint*1.2
+      yhigh = highPoint*(1.2)
+    else :
+      ylow = lowPoint - 0.9*(highPoint - lowPoint)
+      yhigh = highPoint + 0.9*(highPoint - lowPoint)
+    # symmetrise
+    if abs(ylow) < yhigh :
+      ylow = -1 * yhigh
+    else :
+      yhigh = -1 * ylow
+
+    myPainter.drawDataWithFitAsHistogramAndResidualPaper(self.basicData,self.basicBkgFromFit,\
+       "m_{jj} [GeV]","Events",["Data","Fit","Statistical uncertainty on fit","Function choice"],\
+       "{0}/compareFitQualityAndFitChoice_Asymm_WithRatio".format(options["folder"])+options["ext"],drawError=True,\
+       errors = [[self.nominalPlus1Stat,self.nominalMinus1Stat],[placeHolderNom,self.asymmFitUncertainty]],\
+       residualList = residuals,residYRange = [ylow,yhigh],\
+       binlow = firstBin, binhigh = lastBin, doLogY = True, doLogX = True, drawAsSmoothCurve = True,\
+       doLegTopRight = False)
+
+# Search phase figures, in drawing order:
+# (output name, drawing method, attributes it draws, attribute that must be set for it)
+_searchPhaseFigures = [
+  ("figure1","_drawFigure1",["basicData","basicBkgFromFit","residualHist","bumpLowEdge","bumpHighEdge",\
+   "excludeWindow","bottomWindowEdge","topWindowEdge","bumpHunterPVal"],None),
+  ("logLStatPlot","_drawLogLStatPlot",["logLikelihoodPseudoStatHist","logLOfFitToData","logLPVal"],None),
+  ("chi2StatPlot","_drawChi2StatPlot",["chi2PseudoStatHist","chi2OfFitToData","chi2PVal"],None),
+  ("bumpHunterStatPlot","_drawBumpHunterStatPlot",["bumpHunterStatHist","bumpHunterStatFitToData","bumpHunterPVal"],None),
+  ("bumpHunterTomographyPlot","_drawTomographyPlot",["bumpHunterTomographyPlot"],None),
+  ("compareFitQualityAndFitChoice_Asymm_WithRatio","_drawFunctionChoicePlot",["basicData","basicBkgFromFit",\
+   "altFuncRatio","minusNomRatio","plusNomRatio","nominalPlus1Stat","nominalMinus1Stat","asymmFitUncertainty"],"alternateFit"),
+]
+
+# Per-process search data for figure workers
+_workerData = {}
+
+def _drawSearchPhaseFigure(task) :
+
+  filename, permitWindow, snapshot, painterName, settings, name, method, options = task
+  result = {"name" : name, "seconds" : 0., "skipped" : False, "error" : None}
+  start = time.time()
+  try :
+    if filename not in _workerData :
+      _workerData[filename] = searchFileData(filename,permitWindow,lazy=True,snapshot=snapshot)
+    data = _workerData[filename]
+    palette = settings.get("colourpalette")
+    painter = plotfarm.getPainter(painterName,dict((item,settings[item]) for item in settings if item != "colourpalette"))
+    if palette is not None and painter.colourpalette.getColourPalette() != palette :
+      painter.setColourPalette(palette)
+    data._preparePainter(painter,options)
+    getattr(data,method)(painter,options)
+    painter.flushOutput()
+  except Exception :
+    result["error"] = traceback.format_exc()
+  result["seconds"] = time.time()-start
+  return result
@@ -0,0 +1,169 @@
+# Columnar summary of many search-phase output files.
+#
+# Signal-injection and spurious-signal studies leave thousands of
+# search-phase ROOT files behind. scanDirectory reads the scalar
+# results of every file under a directory in a pool of worker
+# processes and stores them as one table of columns in a .npz file:
+# one array per quantity, one row per file. Running it again only
+# reads files that are new, whose size or modification time has
+# changed, or that were read with the other permitWindow setting;
+# rows for files that have disappeared are dropped.
+#
+# Usage: python -m analysisScripts.searchscanner topdir table.npz [-j nWorkers] [--pattern "*.root"] [--permitWindow]
+
+import os
+import sys
+import time
+import fnmatch
+import traceback
+import multiprocessing
+import numpy as np
+
+# Scalar attributes of searchFileData stored in the table
+scalarColumns = ["bumpHunterPVal","bumpHunterPValInitial","bumpHunterPValRefined",\
+                 "bumpHunterStatFitToData","bumpHunterStatFitToDataInitial","bumpHunterStatFitToDataRefined",\
+                 "chi2PVal","chi2OfFitToData","logLPVal","logLOfFitToData",\
+                 "bumpLowEdge","bumpHighEdge","fitLow","fitHigh","NDF",\
+                 "excludeWindow","bottomWindowEdge","topWindowEdge",\
+                 "BHPValRemainder","LogLPValRemainder","Chi2PValRemainder"]
+
+# Columns describing each file, used to decide what needs rescanning
+fileColumns = ["path","size","mtime","permitWindow","error"]
+
+def initialiseWorker() :
+
+  import ROOT
+  ROOT.gROOT.SetBatch(True)
+
+def findSearchFiles(topdir,pattern="*.root") :
+  '''All files below topdir matching pattern, sorted.'''
+
+  found = []
+  for dirpath, dirnames, filenames in os.walk(topdir) :
+    for filename in fnmatch.filter(filenames,pattern) :
+      found.append(os.path.join(dirpath,filename))
+  return sorted(found)
+
+def scanFile(task) :
+  '''One row of the table for one file. Quantities a file does not
+  hold are NaN; a file that cannot be read gets its error message.'''
+
+  path, permitWindow = task
+  from analysisScripts.searchphase import searchFileData
+  row = {"path" : path, "error" : "", "permitWindow" : bool(permitWindow)}
+  status = os.stat(path)
+  row["size"] = status.st_size
+  row["mtime"] = status.st_mtime
+  try :
+    data = searchFileData(path,permitWindow,lazy=True)
+    try :
+      for column in scalarColumns :
+        try :
+          row[column] = float(getattr(data,column))
+        except AttributeError :
+          row[column] = np.nan
+    finally :
+      data.close()
+  except Exception :
+    row["error"] = traceback.format_exc().strip().splitlines()[-1] or "unreadable"
+  return row
+
+def loadTable(tablename) :
+  '''Columns of a stored table as a dictionary of arrays.'''
+
+  with np.load(tablename,allow_pickle=False) as stored :
+    return dict((column,stored[column]) for column in stored.files)
+
+def saveTable(table,tablename) :
+  # Write next to the target and rename, so readers never see half a table
+  temporary = tablename+".tmp"
+  with open(temporary,"wb") as outfile :
+    np.savez(outfile,**table)
+  os.rename(temporary,tablename)
+
+def _emptyTable() :
+  table = {"path" : np.zeros(0,dtype=str), "error" : np.zeros(0,dtype=str),\
+           "size" : np.zeros(0,dtype=np.int64), "mtime" : np.zeros(0),\
+           "permitWindow" : np.zeros(0,dtype=bool)}
+  for column in scalarColumns :
+    table[column] = np.zeros(0)
+  return table
+
+def _rowsToTable(rows) :
+  table = {"path" : np.array([row["path"] for row in rows],dtype=str),\
+           "error" : np.array([row["error"] for row in rows],dtype=str),\
+           "size" : np.array([row["size"] for row in rows],dtype=np.int64),\
+           "mtime" : np.array([row["mtime"] for row in rows],dtype=np.float64),\
+           "permitWindow" : np.array([row["permitWindow"] for row in rows],dtype=bool)}
+  for column in scalarColumns :
+    table[column] = np.array([row.get(column,np.nan) for row in rows],dtype=np.float64)
+  return table
+
+def scanDirectory(topdir,tablename,nWorkers=None,pattern="*.root",permitWindow=False) :
+  '''Bring the table in tablename up to date with the files below
+  topdir and return it, along with the number of files read.'''
+
+  table = _emptyTable()
+  if os.path.exists(tablename) :
+    table = loadTable(tablename)
+    if not set(scalarColumns+fileColumns).issubset(table) :
+      # Written with other columns: start again
+      table = _emptyTable()
+
+  # Keep rows whose file is unchanged and was read the same way
+  known = {}
+  for row, path in enumerate(table["path"]) :
+    known[str(path)] = row
+  keep = []
+  toScan = []
+  for path in findSearchFiles(topdir,pattern) :
+    status = os.stat(path)
+    row = known.get(path)
+    if row is not None and table["size"][row] == status.st_size and table["mtime"][row] == status.st_mtime \
+       and bool(table["permitWindow"][row]) == bool(permitWindow) :
+      keep.append(row)
+    else :
+      toScan.append(path)
+
+  rows = []
+  if toScan :
+    if not nWorkers :
+      nWorkers = multiprocessing.cpu_count()
+    nWorkers = max(1,min(nWorkers,len(toScan)))
+    pool = multiprocessing.Pool(nWorkers,initialiseWorker)
+    try :
+      for row in pool.imap_unordered(scanFile,[(path,permitWindow) for path in toScan],8) :
+        rows.append(row)
+    finally :
+      pool.close()
+      pool.join()
+
+  keep = np.array(keep,dtype=np.int64)
+  scanned = _rowsToTable(rows)
+  merged = {}
+  for column in scanned :
+    merged[column] = np.concatenate((table[column][keep],scanned[column]))
+  order = np.argsort(merged["path"],kind="mergesort")
+  for column in merged :
+    merged[column] = merged[column][order]
+
+  saveTable(merged,tablename)
+  return merged, len(toScan)
+
+if __name__ == "__main__" :
+
+  import argparse
+  parser = argparse.ArgumentParser(description="Summarise search-phase output files into a table of columns.")
+  parser.add_argument("topdir",help="directory searched recursively for output files")
+  parser.add_argument("table",help=".npz file holding the table; updated in place")
+  parser.add_argument("-j","--jobs",type=int,default=None,help="number of worker processes (default: all cores)")
+  parser.add_argument("--pattern",default="*.root",help="file name pattern (default: *.root)")
+  parser.add_argument("--permitWindow",action="store_true",help="also read results for the spectrum outside an excluded window")
+  options = parser.parse_args()
+
+  start = time.time()
+  table, nScanned = scanDirectory(options.topdir,options.table,options.jobs,options.pattern,options.permitWindow)
+  nFailed = int(np.sum(table["error"] != ""))
+  print("{0} files in table, {1} read this time, {2} unreadable, {3:.1f} s".format(\
+        len(table["path"]),nScanned,nFailed,time.time()-start))
+  sys.exit(0)
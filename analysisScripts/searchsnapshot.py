@@ -0,0 +1,207 @@
+# Compact on-disk snapshots of what searchFileData reads.
+#
+# A snapshot is a sidecar directory next to the search output,
+# <file>.snapshot/, holding one .npy file per array (bin contents,
+# sums of squared weights and bin edges of every histogram; x, y and
+# any errors of graphs) and a meta.json with the scalar results and a
+# record of the source file's size and modification time. Snapshots
+# are only used while the source is unchanged.
+#
+# Histograms and graphs are rebuilt with their class, name, title,
+# axis titles, entries and line, fill and marker style. Anything else
+# on them is not kept: attached functions, bin labels, axis ranges
+# and display options. Graphs other than TGraphErrors and
+# TGraphAsymmErrors come back as plain TGraphs.
+#
+# Arrays are memory-mapped when loaded, so opening a snapshot costs
+# almost nothing and only the pages actually used are read. A
+# SearchSnapshot keeps its scalars in one array and uses __slots__,
+# so thousands of them stay small in memory.
+
+import os
+import json
+import shutil
+import numpy as np
+
+snapshotVersion = 2
+
+# Style kept for histograms and graphs: (getter, setter)
+_styleAttributes = [("GetLineColor","SetLineColor"),("GetLineStyle","SetLineStyle"),("GetLineWidth","SetLineWidth"),\
+                    ("GetFillColor","SetFillColor"),("GetFillStyle","SetFillStyle"),\
+                    ("GetMarkerColor","SetMarkerColor"),("GetMarkerStyle","SetMarkerStyle"),("GetMarkerSize","SetMarkerSize")]
+
+# Error arrays kept for each graph class; other graphs come back as TGraph
+_graphErrorGetters = {
+  "TGraphErrors" : ["GetEX","GetEY"],
+  "TGraphAsymmErrors" : ["GetEXlow","GetEXhigh","GetEYlow","GetEYhigh"],
+}
+
+def snapshotDirectory(sourcename) :
+  return sourcename+".snapshot"
+
+def _sourceStamp(sourcename) :
+  status = os.stat(sourcename)
+  return {"size" : status.st_size, "mtime" : status.st_mtime}
+
+def _description(item) :
+  return {"class" : item.ClassName(), "name" : item.GetName(), "title" : item.GetTitle(),\
+          "xTitle" : item.GetXaxis().GetTitle(), "yTitle" : item.GetYaxis().GetTitle(),\
+          "style" : [getattr(item,getter)() for getter, setter in _styleAttributes]}
+
+def _describe(item,info) :
+  item.SetName(str(info["name"]))
+  item.SetTitle(str(info["title"]))
+  item.GetXaxis().SetTitle(str(info["xTitle"]))
+  item.GetYaxis().SetTitle(str(info["yTitle"]))
+  for (getter, setter), value in zip(_styleAttributes,info["style"]) :
+    getattr(item,setter)(value)
+
+def writeSnapshot(sourcename,scalars,histograms,graphs,missing=()) :
+  '''Write the snapshot of sourcename.
+
+  scalars maps names to numbers, histograms names to 1D histograms
+  and graphs names to graphs. Names in missing are recorded as
+  present but None. Returns the snapshot directory.'''
+
+  from art import histarrays
+  directory = snapshotDirectory(sourcename)
+  temporary = directory+".tmp{0}".format(os.getpid())
+  if os.path.exists(temporary) :
+    shutil.rmtree(temporary)
+  os.makedirs(temporary)
+
+  meta = {"version" : snapshotVersion, "source" : _sourceStamp(sourcename),\
+          "scalars" : {}, "histograms" : {}, "graphs" : {}, "missing" : list(missing)}
+  for name, value in scalars.items() :
+    meta["scalars"][name] = float(value)
+  for name, hist in histograms.items() :
+    np.save(os.path.join(temporary,name+".contents.npy"),np.ascontiguousarray(histarrays.contents(hist)))
+    np.save(os.path.join(temporary,name+".edges.npy"),np.ascontiguousarray(histarrays.edges(hist)))
+    weights = histarrays.sumw2(hist)
+    if weights is not None :
+      np.save(os.path.join(temporary,name+".sumw2.npy"),np.ascontiguousarray(weights))
+    meta["histograms"][name] = _description(hist)
+    meta["histograms"][name].update({"sumw2" : weights is not None, "entries" : hist.GetEntries()})
+  for name, graph in graphs.items() :
+    np.save(os.path.join(temporary,name+".x.npy"),np.array(histarrays.graphX(graph)))
+    np.save(os.path.join(temporary,name+".y.npy"),np.array(histarrays.graphY(graph)))
+    errors = []
+    for getter in _graphErrorGetters.get(graph.ClassName(),[]) :
+      if getattr(graph,getter)() :
+        np.save(os.path.join(temporary,name+"."+getter[3:]+".npy"),\
+                np.array(histarrays.bufferView(getattr(graph,getter)(),graph.GetN(),np.float64)))
+        errors.append(getter[3:])
+    meta["graphs"][name] = _description(graph)
+    meta["graphs"][name]["errors"] = errors
+  with open(os.path.join(temporary,"meta.json"),"w") as outfile :
+    json.dump(meta,outfile,indent=1,sort_keys=True)
+
+  # Swap the new snapshot in
+  if os.path.exists(directory) :
+    shutil.rmtree(directory)
+  os.rename(temporary,directory)
+  return directory
+
+class SearchSnapshot(object) :
+
+  __slots__ = ["directory","scalarNames","scalarValues","histograms","graphs","missing","_arrays"]
+
+  def __init__(self,directory,meta) :
+
+    self.directory = directory
+    names = sorted(meta["scalars"])
+    self.scalarNames = dict((name,index) for index, name in enumerate(names))
+    self.scalarValues = np.array([meta["scalars"][name] for name in names],dtype=np.float64)
+    self.histograms = meta["histograms"]
+    self.graphs = meta["graphs"]
+    self.missing = frozenset(meta["missing"])
+    self._arrays = {}
+
+  @classmethod
+  def load(cls,sourcename) :
+    '''The snapshot of sourcename, or None if there is none or
+    the source has changed since it was written.'''
+
+    directory = snapshotDirectory(sourcename)
+    try :
+      with open(os.path.join(directory,"meta.json")) as infile :
+        meta = json.load(infile)
+      stamp = _sourceStamp(sourcename)
+    except (IOError,OSError,ValueError) :
+      return None
+    if meta.get("version") != snapshotVersion or meta.get("source") != stamp :
+      return None
+    return cls(directory,meta)
+
+  def has(self,name) :
+    return name in self.scalarNames or name in self.histograms or name in self.graphs or name in self.missing
+
+  def scalar(self,name) :
+    return float(self.scalarValues[self.scalarNames[name]])
+
+  def array(self,name,part) :
+    '''Memory-mapped array part ("contents", "sumw2", "edges", "x",
+    "y" or an error such as "EYlow") of a histogram or graph.'''
+    key = name+"."+part
+    if key not in self._arrays :
+      self._arrays[key] = np.load(os.path.join(self.directory,key+".npy"),mmap_mode="r")
+    return self._arrays[key]
+
+  def contents(self,name) :
+    return self.array(name,"contents")
+
+  def errors(self,name) :
+    if self.histograms[name]["sumw2"] :
+      return np.sqrt(self.array(name,"sumw2"))
+    return np.sqrt(np.abs(self.contents(name)))
+
+  def edges(self,name) :
+    return self.array(name,"edges")
+
+  def binLowEdges(self,name) :
+    # Same convention as histarrays.binLowEdges
+    binEdges = self.edges(name)
+    averageWidth = (binEdges[-1]-binEdges[0])/float(len(binEdges)-1)
+    return np.concatenate(([binEdges[0]-averageWidth],binEdges))
+
+  def value(self,name) :
+    '''Scalar, histogram (as a TH1D) or graph (as a TGraph) by name.'''
+    if name in self.missing :
+      return None
+    if name in self.scalarNames :
+      return self.scalar(name)
+    if name in self.graphs :
+      return self.toGraph(name)
+    return self.toHist(name)
+
+  def toHist(self,name) :
+    import ROOT
+    from art import histarrays
+    info = self.histograms[name]
+    edges = np.array(self.edges(name),dtype=np.float64)
+    hist = getattr(ROOT,str(info["class"]))(str(info["name"]),str(info["title"]),len(edges)-1,edges)
+    hist.SetDirectory(0)
+    _describe(hist,info)
+    histarrays.contents(hist)[...] = self.contents(name)
+    if info["sumw2"] :
+      hist.Sumw2()
+      histarrays.sumw2(hist)[...] = self.array(name,"sumw2")
+    hist.SetEntries(info["entries"])
+    return hist
+
+  def toGraph(self,name) :
+    import ROOT
+    info = self.graphs[name]
+    x = np.array(self.array(name,"x"),dtype=np.float64)
+    y = np.array(self.array(name,"y"),dtype=np.float64)
+    errors = dict((part,np.array(self.array(name,part),dtype=np.float64)) for part in info["errors"])
+    zeros = np.zeros(len(x))
+    if info["class"] == "TGraphAsymmErrors" :
+      graph = ROOT.TGraphAsymmErrors(len(x),x,y,errors.get("EXlow",zeros),errors.get("EXhigh",zeros),\
+                                     errors.get("EYlow",zeros),errors.get("EYhigh",zeros))
+    elif info["class"] == "TGraphErrors" :
+      graph = ROOT.TGraphErrors(len(x),x,y,errors.get("EX",zeros),errors.get("EY",zeros))
+    else :
+      graph = ROOT.TGraph(len(x),x,y)
+    _describe(graph,info)
+    return graph
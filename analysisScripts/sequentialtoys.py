@@ -0,0 +1,196 @@
+# Pseudo-experiments generated only until the p-values are precise enough.
+#
+# A fixed number of toys is wasted when the observed statistic sits in
+# the bulk of its null distribution: a few hundred toys already pin
+# its p-value down. SequentialToys generates batches of null-case
+# pseudo-experiments (see pseudoexperiments) and stops as soon as the
+# relative error of every p-value it tracks,
+#   sqrt(1/nRight + 1/nLeft)
+# with nRight toys at or above the observed value and nLeft below (the
+# error getPValErrs puts on the p-value, divided by it), reaches the
+# target, or when the toy budget is spent.
+#
+# The toy statistics themselves go into StatAccumulators, so memory
+# does not grow with the number of toys and null-case histograms can
+# still be made at the end. With a checkpoint file the state is saved
+# after every round and an interrupted run picks up where it stopped;
+# batches are numbered, so the resumed run draws the same toys the
+# uninterrupted one would have.
+
+import os
+import numpy as np
+from analysisScripts import pseudoexperiments
+from analysisScripts.stataccumulator import StatAccumulator
+
+class SequentialToys(object) :
+
+  def __init__(self,expected,observed,targetRelativeError=0.1,maxToys=1000000,batchSize=10000,\
+               seed=0,nWorkers=1,checkpoint=None,minWidth=1,maxWidth=None) :
+
+    # observed: statistic name -> observed value, for the statistics to track
+    self.expected = np.asarray(expected,dtype=np.float64)
+    self.observed = dict((name,float(value)) for name, value in observed.items())
+    for name in self.observed :
+      if name not in pseudoexperiments.statisticNames :
+        raise ValueError("Unknown statistic {0}: choose from {1}".format(name,pseudoexperiments.statisticNames))
+    self.targetRelativeError = targetRelativeError
+    self.maxToys = maxToys
+    self.batchSize = batchSize
+    self.seed = seed
+    self.nWorkers = nWorkers
+    self.checkpoint = checkpoint
+    self.minWidth = minWidth
+    self.maxWidth = maxWidth
+
+    self.nToys = 0
+    self.nBatches = 0
+    self.nRight = dict((name,0) for name in self.observed)
+    self.accumulators = dict((name,StatAccumulator()) for name in pseudoexperiments.statisticNames)
+    if checkpoint is not None and os.path.exists(checkpoint) :
+      self._resume()
+
+  @classmethod
+  def fromObservedCounts(cls,expected,counts,statistics=None,**options) :
+    '''Track the statistics (default all) of the observed counts.'''
+    observed = pseudoexperiments.toyStatistics(counts,expected,options.get("minWidth",1),options.get("maxWidth"))
+    names = pseudoexperiments.statisticNames if statistics is None else statistics
+    return cls(expected,dict((name,observed[name][0]) for name in names),**options)
+
+  ## ----------------------------------------------------
+  ## User-accessible functions
+
+  def pValue(self,name) :
+    return self.nRight[name]/float(self.nToys) if self.nToys else np.nan
+
+  def pValueError(self,name) :
+    return self.pValue(name)*self.relativeError(name)
+
+  def relativeError(self,name) :
+    nRight = self.nRight[name]
+    nLeft = self.nToys-nRight
+    if nRight == 0 or nLeft == 0 :
+      return np.inf
+    return np.sqrt(1./nRight+1./nLeft)
+
+  @property
+  def converged(self) :
+    return all(self.relativeError(name) <= self.targetRelativeError for name in self.observed)
+
+  @property
+  def finished(self) :
+    return self.converged or self.nToys >= self.maxToys
+
+  def run(self,verbose=False) :
+    '''Generate rounds of nWorkers batches until finished. Returns self.'''
+
+    while not self.finished :
+      nToys = min(self.batchSize*max(1,self.nWorkers),self.maxToys-self.nToys)
+      statistics = pseudoexperiments.generateNullStatistics(self.expected,nToys,self.seed,self.nWorkers,\
+                                                            self.batchSize,self.minWidth,self.maxWidth,self.nBatches)
+      for name, values in statistics.items() :
+        self.accumulators[name].add(values)
+        if name in self.nRight :
+          self.nRight[name] += int(np.count_nonzero(values >= self.observed[name]))
+      self.nToys += nToys
+      self.nBatches += (nToys+self.batchSize-1)//self.batchSize
+      if self.checkpoint is not None :
+        self._save()
+      if verbose :
+        print(self.summary())
+    return self
+
+  def toysSaved(self,referenceToys) :
+    '''Toys saved compared with a fixed run of referenceToys, and the
+    fraction of that run's compute it represents.'''
+    saved = max(0,referenceToys-self.nToys)
+    return saved, saved/float(referenceToys) if referenceToys else 0.
+
+  def summary(self,referenceToys=None) :
+    lines = ["{0} pseudo-experiments, {1}".format(self.nToys,"converged" if self.converged else "not converged")]
+    for name in sorted(self.observed) :
+      lines.append("  {0}: observed {1:.4g}, p-value {2:.4g} +- {3:.2g} (relative error {4:.3g}, target {5:.3g})".format(\
+                   name,self.observed[name],self.pValue(name),self.pValueError(name),self.relativeError(name),self.targetRelativeError))
+    if referenceToys is not None :
+      saved, fraction = self.toysSaved(referenceToys)
+      lines.append("  {0} fewer than a fixed run of {1} ({2:.0%} of its compute saved)".format(saved,referenceToys,fraction))
+    return "\n".join(lines)
+
+  def nullCaseHistograms(self,rebin=1) :
+    '''Statistics of all toys so far as TH1Ds named as in the search output.'''
+    histograms = {}
+    for name in pseudoexperiments.statisticNames :
+      histograms[name] = self.accumulators[name].toTH1D(pseudoexperiments.nullCaseHistogramNames[name],rebin=rebin)
+    return histograms
+
+  ## ----------------------------------------------------
+  ## Internal functions
+
+  def _settings(self) :
+    names = sorted(self.observed)
+    return {"expected" : self.expected, "observedNames" : np.array(names,dtype=str),\
+            "observedValues" : np.array([self.observed[name] for name in names]),\
+            "settings" : np.array([self.seed,self.batchSize,self.minWidth,-1 if self.maxWidth is None else self.maxWidth])}
+
+  def _save(self) :
+    arrays = self._settings()
+    arrays["progress"] = np.array([self.nToys,self.nBatches]+[self.nRight[name] for name in sorted(self.observed)],dtype=np.int64)
+    for name, accumulator in self.accumulators.items() :
+      for key, value in accumulator.state().items() :
+        arrays[name+"."+key] = value
+    # Write next to the checkpoint and rename, so it is never left half written
+    temporary = self.checkpoint+".tmp"
+    with open(temporary,"wb") as outfile :
+      np.savez(outfile,**arrays)
+    os.rename(temporary,self.checkpoint)
+
+  def _resume(self) :
+    with np.load(self.checkpoint,allow_pickle=False) as stored :
+      settings = self._settings()
+      for key in settings :
+        if key not in stored.files or not np.array_equal(stored[key],settings[key]) :
+          raise ValueError("Checkpoint {0} was written with different {1}".format(self.checkpoint,key))
+      progress = stored["progress"]
+      self.nToys, self.nBatches = int(progress[0]), int(progress[1])
+      for index, name in enumerate(sorted(self.observed)) :
+        self.nRight[name] = int(progress[2+index])
+      for name in pseudoexperiments.statisticNames :
+        self.accumulators[name] = StatAccumulator.fromState({"counts" : stored[name+".counts"],\
+                                                             "state" : stored[name+".state"]})
+
+if __name__ == "__main__" :
+
+  import sys
+  import time
+  import argparse
+  parser = argparse.ArgumentParser(description="Null-case pseudo-experiments for a search output, until its p-values are precise enough.")
+  parser.add_argument("searchfile",help="search-phase output with the fit and the observed statistics")
+  parser.add_argument("-t","--target",type=float,default=0.1,help="target relative error on the p-values")
+  parser.add_argument("-n","--maxToys",type=int,default=1000000,help="toy budget")
+  parser.add_argument("--reference",type=int,default=None,help="toys in the fixed-count run to compare with (default: the budget)")
+  parser.add_argument("-s","--seed",type=int,default=0,help="random seed")
+  parser.add_argument("-j","--jobs",type=int,default=1,help="number of worker processes")
+  parser.add_argument("--batchSize",type=int,default=10000,help="pseudo-experiments per batch")
+  parser.add_argument("--checkpoint",default=None,help=".npz file to save progress in and resume from")
+  parser.add_argument("--outfile",default=None,help="ROOT file to write the null-case histograms to")
+  options = parser.parse_args()
+
+  from analysisScripts.searchphase import searchFileData
+  start = time.time()
+  expected, firstBin, lastBin = pseudoexperiments.expectationFromSearchFile(options.searchfile)
+  data = searchFileData(options.searchfile,lazy=True)
+  try :
+    observed = {"chi2" : data.chi2OfFitToData, "logL" : data.logLOfFitToData, "bumpHunter" : data.bumpHunterStatFitToData}
+  finally :
+    data.close()
+  toys = SequentialToys(expected,observed,options.target,options.maxToys,options.batchSize,\
+                        options.seed,options.jobs,options.checkpoint)
+  toys.run(verbose=True)
+  if options.outfile is not None :
+    import ROOT
+    outfile = ROOT.TFile.Open(options.outfile,"RECREATE")
+    for hist in toys.nullCaseHistograms().values() :
+      hist.Write()
+    outfile.Close()
+  print(toys.summary(options.reference if options.reference is not None else options.maxToys))
+  print("{0:.1f} s".format(time.time()-start))
+  sys.exit(0)
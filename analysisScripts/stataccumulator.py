@@ -0,0 +1,195 @@
+# Streaming histogram of pseudo-experiment statistics.
+#
+# MakeHistoFromStats needs every statistic in memory before it can
+# choose a binning. A StatAccumulator instead takes the statistics a
+# chunk at a time and keeps a fixed number of fine bins. When new
+# values fall outside the current range the bin width is doubled
+# (neighbouring bins merge) until everything fits, so memory stays
+# constant however many values go in.
+#
+# Bin widths are always powers of two and bin edges multiples of the
+# width. Any two accumulators therefore have nested binnings and can
+# be merged exactly, whichever values each has seen: fill one per
+# worker or batch job and merge() them at the end.
+#
+# Quantiles come from the fine bins and are good to within one bin
+# width.
+
+import math
+import numpy as np
+
+class StatAccumulator(object) :
+
+  def __init__(self,nBins=4096) :
+
+    if nBins < 2 :
+      raise ValueError("Need at least two bins")
+    self.nBins = nBins
+    self.counts = np.zeros(nBins,dtype=np.float64)
+    self.exponent = None     # bin width is 2**exponent
+    self.firstIndex = 0.     # first bin covers [firstIndex,firstIndex+1)*width
+    self.count = 0
+    self.nNaN = 0
+    self.total = 0.
+    self.minimum = np.inf
+    self.maximum = -np.inf
+
+  ## ----------------------------------------------------
+  ## User-accessible functions
+
+  def add(self,values) :
+    '''Add a chunk of values (any array-like).'''
+
+    values = np.asarray(values,dtype=np.float64).ravel()
+    finite = np.isfinite(values)
+    self.nNaN += int(len(values)-np.count_nonzero(finite))
+    values = values[finite]
+    if len(values) == 0 :
+      return
+    low = min(self.minimum,values.min())
+    high = max(self.maximum,values.max())
+    self._cover(low,high)
+    self.counts += np.bincount(self._index(values),minlength=self.nBins)
+    self.count += len(values)
+    self.total += float(values.sum())
+    self.minimum = low
+    self.maximum = high
+
+  def merge(self,other) :
+    '''Add everything other has seen to this accumulator.'''
+
+    self.nNaN += other.nNaN
+    if other.count == 0 :
+      return
+    # Bins no finer than other's, so each of its bins lands in one bin here
+    self._cover(min(self.minimum,other.minimum),max(self.maximum,other.maximum),minimumExponent=other.exponent)
+    self.counts += self._regrid(other.counts,other.firstIndex,other.exponent,self.firstIndex,self.exponent)
+    self.count += other.count
+    self.total += other.total
+    self.minimum = min(self.minimum,other.minimum)
+    self.maximum = max(self.maximum,other.maximum)
+
+  @property
+  def width(self) :
+    return 2.**self.exponent if self.exponent is not None else 0.
+
+  @property
+  def edges(self) :
+    return (self.firstIndex+np.arange(self.nBins+1))*self.width
+
+  @property
+  def mean(self) :
+    return self.total/self.count if self.count else np.nan
+
+  def histogram(self,trim=True) :
+    '''Bin counts and edges, by default only from the first to the
+    last filled bin.'''
+    counts = self.counts
+    edges = self.edges
+    if trim and self.count :
+      filled = np.flatnonzero(counts)
+      counts = counts[filled[0]:filled[-1]+1]
+      edges = edges[filled[0]:filled[-1]+2]
+    return counts.copy(), edges
+
+  def quantile(self,fractions) :
+    '''Approximate quantiles, interpolating linearly within bins.'''
+    fractions = np.asarray(fractions,dtype=np.float64)
+    if self.count == 0 :
+      return np.full(fractions.shape,np.nan)
+    cumulative = np.concatenate(([0.],np.cumsum(self.counts)))/self.count
+    result = np.interp(fractions,cumulative,self.edges)
+    return np.clip(result,self.minimum,self.maximum)
+
+  def toTH1D(self,name,title="",rebin=1) :
+    '''The filled range as a TH1D in one go. rebin merges that many
+    fine bins into each histogram bin.'''
+
+    import ROOT
+    from art import histarrays
+    counts, edges = self.histogram()
+    if len(counts) == 0 :
+      hist = ROOT.TH1D(name,title,1,0.,1.)
+      hist.SetDirectory(0)
+      return hist
+    if rebin > 1 :
+      nKept = int(math.ceil(len(counts)/float(rebin)))*rebin
+      counts = np.concatenate((counts,np.zeros(nKept-len(counts)))).reshape(-1,rebin).sum(axis=1)
+      edges = edges[0]+np.arange(len(counts)+1)*self.width*rebin
+    hist = ROOT.TH1D(name,title,len(counts),edges[0],edges[-1])
+    hist.SetDirectory(0)
+    histarrays.setContents(hist,np.concatenate(([0.],counts,[0.])),np.sqrt(np.concatenate(([0.],counts,[0.]))))
+    hist.SetEntries(self.count)
+    return hist
+
+  def state(self) :
+    '''Everything needed to rebuild the accumulator, as arrays.'''
+    return {"counts" : self.counts,\
+            "state" : np.array([self.nBins,self.exponent if self.exponent is not None else np.nan,self.firstIndex,\
+                                self.count,self.nNaN,self.total,self.minimum,self.maximum])}
+
+  @classmethod
+  def fromState(cls,stored) :
+    state = np.asarray(stored["state"])
+    accumulator = cls(int(state[0]))
+    accumulator.counts = np.array(stored["counts"],dtype=np.float64)
+    accumulator.exponent = None if np.isnan(state[1]) else int(state[1])
+    accumulator.firstIndex = float(state[2])
+    accumulator.count = int(state[3])
+    accumulator.nNaN = int(state[4])
+    accumulator.total = float(state[5])
+    accumulator.minimum = float(state[6])
+    accumulator.maximum = float(state[7])
+    return accumulator
+
+  def save(self,filename) :
+    np.savez(filename,**self.state())
+
+  @classmethod
+  def load(cls,filename) :
+    with np.load(filename) as stored :
+      return cls.fromState(stored)
+
+  ## ----------------------------------------------------
+  ## Internal functions
+
+  def _index(self,values) :
+    return (np.floor(values/self.width)-self.firstIndex).astype(np.int64)
+
+  def _fits(self,low,high,exponent) :
+    width = 2.**exponent
+    return math.floor(high/width)-math.floor(low/width) < self.nBins
+
+  def _cover(self,low,high,minimumExponent=None) :
+    # Coarsen (never refine) the binning until [low,high] fits,
+    # then place it with the spare bins shared on both sides.
+    if self.exponent is None :
+      span = high-low
+      if span <= 0 :
+        span = max(abs(low),1.)*1e-6
+      exponent = int(math.floor(math.log(span/self.nBins,2)))
+    else :
+      exponent = self.exponent
+    if minimumExponent is not None :
+      exponent = max(exponent,minimumExponent)
+    while not self._fits(low,high,exponent) :
+      exponent += 1
+    if exponent == self.exponent and self._index(np.array([low,high])).min() >= 0 \
+       and self._index(np.array([low,high])).max() < self.nBins :
+      return
+
+    width = 2.**exponent
+    firstFilled = math.floor(low/width)
+    spare = self.nBins-1-(math.floor(high/width)-firstFilled)
+    firstIndex = firstFilled-spare//2
+    if self.exponent is not None and self.count :
+      self.counts = self._regrid(self.counts,self.firstIndex,self.exponent,firstIndex,exponent)
+    self.exponent = exponent
+    self.firstIndex = float(firstIndex)
+
+  def _regrid(self,counts,firstIndex,exponent,newFirstIndex,newExponent) :
+    # Bin i of the old binning lies inside bin floor((firstIndex+i)/2^shift) of the new one
+    filled = np.flatnonzero(counts)
+    factor = 2.**(newExponent-exponent)
+    newIndex = (np.floor((firstIndex+filled)/factor)-newFirstIndex).astype(np.int64)
+    return np.bincount(newIndex,weights=counts[filled],minlength=self.nBins)
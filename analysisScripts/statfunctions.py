@@ -0,0 +1,181 @@
+# Conversions between p-values and significances, for whole arrays.
+#
+# GetZVal used ROOT.Math.normal_quantile(1-p), one value at a time;
+# below p ~ 1e-16, 1-p rounds to 1 and the significance is lost.
+# Here the Gaussian quantile is taken from whichever tail holds p, so
+# nothing of the form 1-p is formed for small p. The starting value is
+# Acklam's rational approximation (relative error ~1e-9), polished by
+# one Halley step against the exact tail probability from erfc, which
+# leaves the result good to near double precision for p down to 1e-300.
+#
+# Conventions:
+#   one-sided  - p is the probability of a fluctuation at least as
+#                large in the direction of interest
+#   two-sided  - p covers both directions, so Z is found from p/2
+#   excess     - significance counted positive for small p, as GetZVal
+#                gave with excess=True; otherwise it is negative
+
+import math
+import numpy as np
+
+# Acklam's coefficients for the inverse of the standard normal CDF
+_a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,\
+      1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+_b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,\
+      6.680131188771972e+01, -1.328068155288572e+01]
+_c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,\
+      -2.549671010229528e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+_d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,\
+      3.754408661907416e+00]
+_pLow = 0.02425
+
+_erfcObjects = np.frompyfunc(math.erfc,1,1)
+
+def _erfc(x) :
+  return np.asarray(_erfcObjects(x),dtype=np.float64)
+
+def _asResult(result) :
+  return float(result) if np.ndim(result) == 0 else result
+
+def _polynomial(coefficients,x) :
+  result = np.zeros_like(x)
+  for coefficient in coefficients :
+    result = result*x+coefficient
+  return result
+
+def _lowerQuantile(p) :
+  # Quantile x <= 0 of the lower tail, for 0 < p <= 0.5
+  x = np.empty_like(p)
+  tail = p < _pLow
+  q = np.sqrt(-2.*np.log(p[tail]))
+  x[tail] = _polynomial(_c,q)/(_polynomial(_d,q)*q+1.)
+  central = ~tail
+  q = p[central]-0.5
+  r = q*q
+  x[central] = _polynomial(_a,r)*q/(_polynomial(_b,r)*r+1.)
+  # Halley step using the exact lower-tail probability
+  error = 0.5*_erfc(-x/math.sqrt(2.))-p
+  u = error*math.sqrt(2.*math.pi)*np.exp(0.5*x*x)
+  return x-u/(1.+0.5*x*u)
+
+def normalQuantile(p,upper=False) :
+  '''x with P(X < x) = p for a standard normal X, or P(X > x) = p if
+  upper. Exact tails: p is never subtracted from 1 when it is small.'''
+
+  p = np.asarray(p,dtype=np.float64)
+  flat = np.atleast_1d(p).ravel()
+  result = np.full(flat.shape,np.nan)
+  result[flat == 0] = -np.inf
+  result[flat == 1] = np.inf
+  lower = (flat > 0) & (flat <= 0.5)
+  result[lower] = _lowerQuantile(flat[lower])
+  higher = (flat > 0.5) & (flat < 1)
+  result[higher] = -_lowerQuantile(1.-flat[higher])
+  if upper :
+    result = -result
+  return _asResult(result.reshape(p.shape))
+
+def pToZ(p,excess=True,twoSided=False) :
+  '''Significance of p-values: the number of Gaussian standard
+  deviations with the same tail probability. Positive for small p
+  with excess, negative otherwise.'''
+
+  p = np.asarray(p,dtype=np.float64)
+  if twoSided :
+    p = 0.5*p
+  z = np.asarray(normalQuantile(p,upper=True))
+  if not excess :
+    z = -z
+  return _asResult(z)
+
+def zToP(z,twoSided=False) :
+  '''p-values of significances: the upper-tail probability of z, or
+  of |z| in both tails if twoSided. The inverse of pToZ with excess.'''
+
+  z = np.asarray(z,dtype=np.float64)
+  if twoSided :
+    p = _erfc(np.abs(z)/math.sqrt(2.))
+  else :
+    p = 0.5*_erfc(z/math.sqrt(2.))
+  return _asResult(p)
+
+## ----------------------------------------------------
+## Poisson tail probabilities
+
+_logFactorialTableSize = 100000
+_logFactorialTable = None
+
+def logFactorial(n) :
+  '''log(n!) for arrays of non-negative integers: a table up to 1e5,
+  Stirling's series (exact to double precision) above.'''
+
+  global _logFactorialTable
+  if _logFactorialTable is None :
+    _logFactorialTable = np.concatenate(([0.],np.cumsum(np.log(np.arange(1.,_logFactorialTableSize)))))
+  n = np.asarray(n,dtype=np.float64)
+  small = n < _logFactorialTableSize
+  result = np.empty(n.shape)
+  result[small] = _logFactorialTable[n[small].astype(np.int64)]
+  m = n[~small]+1.
+  result[~small] = (m-0.5)*np.log(m)-m+0.5*math.log(2.*math.pi)+1./(12.*m)-1./(360.*m**3)
+  return _asResult(result)
+
+def _lowerGammaSeries(a,x) :
+  # Regularised lower incomplete gamma P(a,x) for integer a >= 1, x < a+1
+  # (Numerical Recipes' series), iterating only on the unconverged entries
+  total = 1./a
+  term = total.copy()
+  denominator = a.copy()
+  active = np.arange(len(a))
+  for iteration in range(100000) :
+    denominator[active] += 1.
+    term[active] *= x[active]/denominator[active]
+    total[active] += term[active]
+    active = active[np.abs(term[active]) > np.abs(total[active])*1e-16]
+    if len(active) == 0 :
+      break
+  return total*np.exp(-x+a*np.log(x)-logFactorial(a-1.))
+
+def _upperGammaFraction(a,x) :
+  # Regularised upper incomplete gamma Q(a,x) for x >= a+1, by the
+  # modified Lentz continued fraction
+  tiny = 1e-300
+  b = x+1.-a
+  c = np.full(len(a),1./tiny)
+  d = 1./b
+  h = d.copy()
+  active = np.arange(len(a))
+  for i in range(1,100000) :
+    an = -i*(i-a[active])
+    b[active] += 2.
+    d[active] = an*d[active]+b[active]
+    d[active] = np.where(np.abs(d[active]) < tiny,tiny,d[active])
+    c[active] = b[active]+an/c[active]
+    c[active] = np.where(np.abs(c[active]) < tiny,tiny,c[active])
+    d[active] = 1./d[active]
+    delta = d[active]*c[active]
+    h[active] *= delta
+    active = active[np.abs(delta-1.) > 1e-16]
+    if len(active) == 0 :
+      break
+  return np.exp(-x+a*np.log(x)-logFactorial(a-1.))*h
+
+def poissonPValue(observed,expected) :
+  '''P(N >= observed) for N Poisson with mean expected, for integer
+  observed counts: 1 for observed <= 0, the regularised lower
+  incomplete gamma P(observed,expected) otherwise.'''
+
+  observed, expected = np.broadcast_arrays(np.asarray(observed,dtype=np.float64),np.asarray(expected,dtype=np.float64))
+  shape = observed.shape
+  a = observed.ravel()
+  x = expected.ravel()
+  result = np.ones(len(a))
+  positive = (a > 0) & (x > 0)
+  result[(a > 0) & (x <= 0)] = 0.
+  series = positive & (x < a+1.)
+  if np.any(series) :
+    result[series] = _lowerGammaSeries(a[series],x[series])
+  fraction = positive & ~series
+  if np.any(fraction) :
+    result[fraction] = 1.-_upperGammaFraction(a[fraction],x[fraction])
+  return _asResult(np.clip(result,0.,1.).reshape(shape))
@@ -0,0 +1,68 @@
+# Survival function of a pseudo-experiment statistic histogram.
+#
+# The p-value of an observed statistic x is the fraction of
+# pseudo-experiments at or above it, Integral(FindBin(x),nbins) /
+# Integral() on the null-case histogram. Here the counts from each
+# bin to the last are summed once, so p-values and their errors for
+# any number of observed values cost one binary search.
+#
+# Conventions follow TH1: a value below the axis falls in the
+# underflow bin, whose contents then count as "at or above". A value
+# at or beyond the upper edge falls in the overflow, where TH1 turns
+# Integral(nbins+1,nbins) into Integral(nbins+1,nbins+1): it gets the
+# overflow contents. From any other bin the overflow is not counted.
+
+import numpy as np
+from art import histarrays
+
+class SurvivalFunction(object) :
+
+  def __init__(self,counts,edges) :
+
+    counts = np.asarray(counts,dtype=np.float64)
+    self.nbins = len(counts)-2
+    self.edges = np.asarray(edges,dtype=np.float64)
+    # rightOf[bin] = Integral(bin,nbins); the overflow contents for the overflow
+    self.rightOf = np.concatenate((np.cumsum(counts[:self.nbins+1][::-1])[::-1],counts[self.nbins+1:]))
+    self.total = float(np.sum(counts[1:self.nbins+1]))
+
+  @classmethod
+  def fromHist(cls,hist) :
+    return cls(histarrays.contents(hist),histarrays.edges(hist))
+
+  def _asArray(self,function,values) :
+    result = function(np.asarray(values,dtype=np.float64))
+    if result.ndim == 0 :
+      return float(result)
+    return result
+
+  def findBin(self,values) :
+    return np.searchsorted(self.edges,values,side="right")
+
+  def countAbove(self,values) :
+    '''Pseudo-experiments in the bin of each value and above.'''
+    return self._asArray(lambda x : self.rightOf[self.findBin(x)],values)
+
+  def pValue(self,values) :
+    return self._asArray(lambda x : self.rightOf[self.findBin(x)]/self.total,values)
+
+  def pValueErrors(self,values,pValues=None) :
+    '''Error on the p-values of values as getPValErrs has always
+    given it: p*sqrt(1/nRight + 1/nLeft), or 0 if either side is
+    empty. pValues default to the ones from this histogram.'''
+
+    def errors(x) :
+      nRight = self.rightOf[self.findBin(x)]
+      nLeft = self.total-nRight
+      p = nRight/self.total if pValues is None else np.asarray(pValues,dtype=np.float64)
+      valid = (nRight > 0) & (nLeft > 0)
+      with np.errstate(divide="ignore",invalid="ignore") :
+        return np.where(valid,p*np.sqrt(1./nRight+1./nLeft),0.)
+    return self._asArray(errors,values)
+
+  def binomialErrors(self,values) :
+    '''Binomial error sqrt(p(1-p)/N) on the p-values of values.'''
+    def errors(x) :
+      p = self.rightOf[self.findBin(x)]/self.total
+      return np.sqrt(p*(1.-p)/self.total)
+    return self._asArray(errors,values)
@@ -0,0 +1,77 @@
+# Chi2 of a spectrum with an exclusion window left out, for many
+# candidate windows at once.
+#
+# The per-bin terms (d - b)^2/(b + deltaB^2) and their cumulative
+# sum are computed once per spectrum. The chi2 of the remainder for
+# any window is then the total minus one difference of cumulative
+# sums, so hundreds of windows cost no more than a few array
+# operations. Conventions follow searchFileData.calculateRemainingChi2:
+# the sum runs from the first to the last bin with a non-zero
+# background, bins with no data are skipped, and a window is given
+# by the bins whose low and high edges match its ends to within
+# a tolerance.
+#
+# Arrays are indexed by ROOT bin number: 0 is the underflow and
+# nbins+1 the overflow.
+
+import numpy as np
+
+class RemainderChi2Scan(object) :
+
+  def __init__(self,data,background,backgroundErrors,lowEdges) :
+
+    data = np.asarray(data,dtype=np.float64)
+    background = np.asarray(background,dtype=np.float64)
+    backgroundErrors = np.asarray(backgroundErrors,dtype=np.float64)
+    self.nbins = len(data)-2
+    nbins = self.nbins
+
+    # First and last bins with background, scanning 1..nbins+1
+    filled = np.flatnonzero(background[1:nbins+2] > 0)+1
+    self.firstBin = filled[0] if len(filled) else nbins+1
+    self.lastBin = filled[-1] if len(filled) else 1
+
+    # Bin edges as TAxis reports them, overflow included
+    self.lowEdges = np.asarray(lowEdges,dtype=np.float64)
+    widths = np.diff(self.lowEdges[1:nbins+2])
+    widths = np.concatenate(([widths[0] if len(widths) else 0.],widths,[widths[-1] if len(widths) else 0.]))
+    self.highEdges = self.lowEdges+widths
+
+    # Per-bin chi2 terms, zero outside [firstBin,lastBin] and where there is no data
+    used = np.zeros(nbins+2,dtype=bool)
+    used[self.firstBin:self.lastBin+1] = True
+    used &= data != 0
+    with np.errstate(divide="ignore",invalid="ignore") :
+      terms = np.square(data-background)/(background+np.square(backgroundErrors))
+    self.terms = np.where(used,terms,0.)
+    self.cumulative = np.concatenate(([0.],np.cumsum(self.terms)))
+    self.total = self.cumulative[-1]
+
+  def windowBins(self,lowEdges,highEdges,tolerance=0.1) :
+    '''First and last bin of each window [lowEdge,highEdge]: the last
+    bin whose low (high) edge is within tolerance of it, or 0 if none.'''
+
+    lowEdges = np.atleast_1d(np.asarray(lowEdges,dtype=np.float64))
+    highEdges = np.atleast_1d(np.asarray(highEdges,dtype=np.float64))
+    bins = np.arange(1,self.nbins+2)
+    def lastMatch(edges,targets) :
+      matches = np.abs(edges[bins][np.newaxis,:]-targets[:,np.newaxis]) < tolerance
+      found = matches.any(axis=1)
+      last = bins[len(bins)-1-np.argmax(matches[:,::-1],axis=1)]
+      return np.where(found,last,0)
+    return lastMatch(self.lowEdges,lowEdges), lastMatch(self.highEdges,highEdges)
+
+  def remainderChi2ForBins(self,firstWindowBins,lastWindowBins) :
+    '''Chi2 of the spectrum leaving out bins firstWindowBin..lastWindowBin
+    of each window.'''
+
+    first = np.asarray(firstWindowBins,dtype=np.int64)
+    last = np.asarray(lastWindowBins,dtype=np.int64)
+    excluded = np.where(last >= first,\
+                        self.cumulative[np.clip(last+1,0,self.nbins+2)]-self.cumulative[np.clip(first,0,self.nbins+2)],0.)
+    return self.total-excluded
+
+  def remainderChi2(self,lowEdges,highEdges,tolerance=0.1) :
+    '''Chi2 of the spectrum outside each window [lowEdge,highEdge].'''
+    first, last = self.windowBins(lowEdges,highEdges,tolerance)
+    return self.remainderChi2ForBins(first,last)
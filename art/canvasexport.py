@@ -0,0 +1,172 @@
+# Multi-format canvas export with a background writer.
+#
+# The canvas is painted once on the plotting thread and each
+# requested format is produced from that painted canvas into a
+# local staging area (/dev/shm where available). Moving the
+# files to their destination, which is usually a slow shared
+# disk, happens on a writer thread fed by a bounded queue, so
+# the next draw call can start straight away.
+#
+# ROOT's graphics drivers are not thread safe, so the
+# per-format output itself has to stay on the plotting thread:
+# vector formats (eps, pdf, svg) go through TCanvas.Print,
+# png is grabbed from the painted pad with TImage, C is
+# written with SaveSource and root with SaveAs. Each file is
+# staged under its final name in a directory of its own, since
+# SaveSource names the macro's function after the file.
+
+import os
+import sys
+import time
+import shutil
+import atexit
+import tempfile
+import threading
+try :
+  import queue
+except ImportError :
+  import Queue as queue
+
+supportedFormats = ["eps","pdf","svg","png","C","root"]
+
+class CanvasExporter(object) :
+
+  def __init__(self,maxQueued=16,stagingDir=None) :
+
+    if stagingDir is None :
+      if os.path.isdir("/dev/shm") and os.access("/dev/shm",os.W_OK) :
+        stagingDir = "/dev/shm"
+    self.stagingDir = tempfile.mkdtemp(prefix="morisot_export_",dir=stagingDir)
+
+    self.queue = queue.Queue(maxQueued)
+    self.lock = threading.Lock()
+    self.stats = {}
+    self.errors = []
+    self.nStaged = 0
+
+    # Callables told about every list of exported files
+    self.listeners = []
+
+    self.writer = threading.Thread(target=self._writeLoop,name="CanvasExporter")
+    self.writer.daemon = True
+    self.writer.start()
+    self.closed = False
+    atexit.register(self.close)
+
+  ## ----------------------------------------------------
+  ## User-accessible functions
+
+  def export(self,canvas,outputnames) :
+    '''Write canvas to every file in outputnames. The format
+    is taken from each file extension. Returns once ROOT is
+    done with the canvas; files land on disk asynchronously.'''
+
+    canvas.Modified()
+    canvas.Update()
+    for listener in self.listeners :
+      listener(outputnames)
+
+    for outputname in outputnames :
+      outputformat = outputname.rsplit(".",1)[-1]
+      if outputformat not in supportedFormats :
+        raise ValueError("Unsupported output format {0} for {1}".format(outputformat,outputname))
+      self.nStaged += 1
+      stagedDir = os.path.join(self.stagingDir,str(self.nStaged))
+      os.mkdir(stagedDir)
+      staged = os.path.join(stagedDir,os.path.basename(outputname))
+      start = time.time()
+      self._stage(canvas,staged,outputformat)
+      # Blocks if the writer has fallen too far behind
+      self.queue.put((staged,outputname,outputformat,start,time.time()-start))
+
+  def flush(self) :
+    '''Wait until everything queued so far is on disk.
+    Raises IOError if any write failed.'''
+
+    self.queue.join()
+    with self.lock :
+      errors = self.errors
+      self.errors = []
+    if errors :
+      raise IOError("Failed to write: "+"; ".join(errors))
+
+  def close(self) :
+
+    if self.closed :
+      return
+    self.closed = True
+    self.queue.join()
+    self.queue.put(None)
+    self.writer.join()
+    shutil.rmtree(self.stagingDir,True)
+    # Nobody is left to raise these to, so at least say so
+    with self.lock :
+      errors = self.errors
+      self.errors = []
+    for error in errors :
+      sys.stderr.write("CanvasExporter: failed to write {0}\n".format(error))
+
+  def report(self) :
+    '''Per-format number of files, bytes written, time spent
+    producing the file in ROOT, time spent writing it out and
+    latency from export call to the file being in place.'''
+
+    with self.lock :
+      return dict((item,dict(self.stats[item])) for item in self.stats)
+
+  def summary(self) :
+
+    lines = ["{0:<6}{1:>7}{2:>14}{3:>12}{4:>12}{5:>12}".format("format","files","bytes","render s","write s","latency s")]
+    report = self.report()
+    for item in sorted(report.keys()) :
+      entry = report[item]
+      lines.append("{0:<6}{1:>7}{2:>14}{3:>12.3f}{4:>12.3f}{5:>12.3f}".format(item,entry["files"],\
+                   entry["bytes"],entry["renderSeconds"],entry["writeSeconds"],entry["latencySeconds"]))
+    return "\n".join(lines)
+
+  ## ----------------------------------------------------
+  ## Internal functions
+
+  def _stage(self,canvas,staged,outputformat) :
+
+    import ROOT
+    if outputformat == "png" :
+      image = ROOT.TImage.Create()
+      image.FromPad(canvas)
+      image.WriteImage(staged)
+    elif outputformat == "C" :
+      canvas.SaveSource(staged)
+    elif outputformat == "root" :
+      canvas.SaveAs(staged)
+    else :
+      canvas.Print(staged,outputformat)
+
+  def _writeLoop(self) :
+
+    while True :
+      item = self.queue.get()
+      if item is None :
+        self.queue.task_done()
+        return
+      staged, outputname, outputformat, start, renderTime = item
+      writeStart = time.time()
+      try :
+        nbytes = os.path.getsize(staged)
+        outputdir = os.path.dirname(outputname)
+        if outputdir and not os.path.isdir(outputdir) :
+          os.makedirs(outputdir)
+        shutil.move(staged,outputname)
+        done = time.time()
+        with self.lock :
+          entry = self.stats.setdefault(outputformat,{"files" : 0, "bytes" : 0, "renderSeconds" : 0.,\
+                                                       "writeSeconds" : 0., "latencySeconds" : 0.})
+          entry["files"] += 1
+          entry["bytes"] += nbytes
+          entry["renderSeconds"] += renderTime
+          entry["writeSeconds"] += done - writeStart
+          entry["latencySeconds"] += done - start
+      except Exception as error :
+        with self.lock :
+          self.errors.append("{0} ({1})".format(outputname,error))
+      shutil.rmtree(os.path.dirname(staged),True)
+      self.queue.task_done()
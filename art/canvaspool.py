@@ -0,0 +1,249 @@
+# Pool of reusable canvases and pad layouts.
+#
+# Building a fresh TCanvas and TPads for every plot is slow in
+# long batch sessions, and because the pads always carry the
+# same names ("extpad", "pad1", "pad2") old objects pile up in
+# gROOT and make name lookups ambiguous. The pool hands out
+# cleared canvases instead, and keeps one set of pads per
+# canvas and layout which is cleared and redrawn on reuse.
+# Pads are renamed after their canvas so names stay unique.
+#
+# The pool keeps at most maxCanvases canvases. A canvas in use
+# is never taken back: when more are held at once the pool grows,
+# and shrinks back to the limit as they are released. Idle
+# canvases of other sizes are retired first to make room.
+#
+# Pads are only kept for canvases the pool made. layoutPads on any
+# other canvas builds fresh (but still uniquely named) pads.
+#
+# Canvases are given back by release(), or on leaving a
+# "with pool.canvas(...)" or "with pool.releasing()" block however
+# it is left. attach(painter) runs every draw method of a painter
+# inside releasing(), so a draw method that returns early or raises
+# before saving its canvas does not keep it.
+
+import inspect
+import contextlib
+
+# Pad layouts: name -> list of (pad name, xlow, ylow, xup, yup, settings)
+# where settings are (setter, value) pairs applied on every reuse.
+padLayouts = {
+  # Morisot: main plot over significance/residual panel
+  "twopad" : [
+    ("extpad",0,0,1,1,[("SetFillStyle",4000)]),
+    ("pad1",0,0.27,1,1,[("SetBottomMargin",0.00001),("SetBorderMode",0),("SetLogy",1)]),
+    ("pad2",0,0,1,0.27,[("SetTopMargin",0.00001),("SetBottomMargin",0.35),("SetBorderMode",0)]),
+  ],
+  # Morisot_2p0: main plot over ratio panel
+  "ratio" : [
+    ("extpad",0,0,1,1,[("SetFillStyle",4000)]),
+    ("pad1",0,0.27,1,1,[("SetBottomMargin",0.01),("SetBorderMode",0),("SetLogy",1)]),
+    ("pad2",0,0,1,0.27,[("SetTopMargin",0.04),("SetBottomMargin",0.4),("SetBorderMode",0),("SetLogy",0)]),
+  ],
+  # Morisot: plot with the legend in a panel to its right
+  "legendRight" : [
+    ("extpad",0,0,1,1,[("SetFillStyle",4000)]),
+    ("pad1",0,0,0.66,1,[("SetBorderMode",0)]),
+    ("pad2",0.66,0,1,1,[("SetBorderMode",0)]),
+  ],
+  "legendRightWide" : [
+    ("extpad",0,0,1,1,[("SetFillStyle",4000)]),
+    ("pad1",0,0,0.5,1,[("SetBorderMode",0)]),
+    ("pad2",0.5,0,1,1,[("SetBorderMode",0)]),
+  ],
+  # Morisot: main plot over two residual panels
+  "threepad" : [
+    ("extpad",0,0,1,1,[("SetFillStyle",4000)]),
+    ("pad1",0,0.4,1,1,[("SetBorderMode",0),("SetLogy",1),("SetLeftMargin",0.1),("SetBottomMargin",0.00001)]),
+    ("pad2",0,0.25,1,0.4,[("SetLeftMargin",0.1),("SetTopMargin",0.00001),("SetBottomMargin",0.00001),("SetBorderMode",0)]),
+    ("pad3",0,0,1,0.25,[("SetLeftMargin",0.1),("SetTopMargin",0.00001),("SetBottomMargin",0.4),("SetBorderMode",0)]),
+  ],
+  # Morisot: main plot over one residual panel
+  "residual" : [
+    ("extpad",0,0,1,1,[("SetFillStyle",4000)]),
+    ("pad1",0,0.3,1,1,[("SetBottomMargin",0.00001),("SetBorderMode",0),("SetLogy",1)]),
+    ("pad3",0,0,1,0.30,[("SetTopMargin",0.00001),("SetBottomMargin",0.43),("SetBorderMode",0)]),
+  ],
+}
+
+def _argNames(function) :
+  try :
+    return inspect.getfullargspec(function).args
+  except AttributeError :
+    return inspect.getargspec(function).args
+
+class CanvasPool(object) :
+
+  def __init__(self,maxCanvases=8) :
+
+    self.maxCanvases = maxCanvases
+    self.idle = {}     # (width,height) -> [canvas, ...]
+    self.inUse = []    # oldest first
+    self.pads = {}     # (id(canvas),layout) -> [pad, ...], pool canvases only
+    self.sizes = {}    # id(canvas) -> (width,height)
+    self.owned = {}    # id(canvas) -> canvas, for the canvases the pool made
+    self.nCreated = 0
+    self.nReused = 0
+
+  ## ----------------------------------------------------
+  ## User-accessible functions
+
+  def acquire(self,canvasname,width,height) :
+    '''Get a clean canvas of the given size named canvasname.'''
+
+    idle = self.idle.get((width,height),[])
+    if idle :
+      canvas = idle.pop()
+      self.nReused += 1
+    else :
+      # Nothing idle of this size: retire an idle canvas of another
+      # size if at the limit. With none idle the pool grows.
+      if self._nCanvases() >= self.maxCanvases :
+        retired = self._popAnyIdle()
+        if retired is not None :
+          self._destroy(retired)
+      canvas = self._create(width,height)
+
+    canvas.SetName(canvasname)
+    canvas.SetTitle('')
+    canvas.UseCurrentStyle()
+    canvas.SetGridx(0)
+    canvas.SetGridy(0)
+    canvas.SetLogx(0)
+    canvas.SetLogy(0)
+    canvas.SetLogz(0)
+    canvas.cd()
+    self.inUse.append(canvas)
+    return canvas
+
+  def release(self,canvas) :
+    '''Give a canvas back. Its contents are cleared straight away.'''
+
+    for item in self.inUse :
+      if item is canvas :
+        self.inUse.remove(item)
+        break
+    else :
+      return
+    if self._nCanvases() >= self.maxCanvases :
+      # Over the limit after a burst: shrink back
+      self._destroy(canvas)
+      return
+    canvas.Clear()
+    self.idle.setdefault(self.sizes[id(canvas)],[]).append(canvas)
+
+  def releaseAll(self) :
+    for canvas in list(self.inUse) :
+      self.release(canvas)
+
+  @contextlib.contextmanager
+  def canvas(self,canvasname,width,height) :
+    '''acquire() for a with block: the canvas is released on leaving it.'''
+    canvas = self.acquire(canvasname,width,height)
+    try :
+      yield canvas
+    finally :
+      self.release(canvas)
+
+  @contextlib.contextmanager
+  def releasing(self) :
+    '''Release the canvases acquired inside the with block that are
+    still held when it is left.'''
+    held = set(id(canvas) for canvas in self.inUse)
+    try :
+      yield
+    finally :
+      for canvas in [canvas for canvas in self.inUse if id(canvas) not in held] :
+        self.release(canvas)
+
+  def attach(self,painter) :
+    '''Run every draw method of painter that writes an output file
+    (has an outputname or plotname argument) inside releasing().'''
+
+    for item in dir(painter.__class__) :
+      method = getattr(painter.__class__,item)
+      if item.startswith("_") or not (hasattr(method,"__code__") or hasattr(method,"__func__")) :
+        continue
+      argnames = _argNames(method)
+      if "outputname" in argnames or "plotname" in argnames :
+        setattr(painter,item,self._wrap(getattr(painter,item)))
+
+  def layoutPads(self,canvas,layout,specs=None) :
+    '''Draw the pads of a layout on canvas and return them,
+    reusing the pads from an earlier plot where possible. specs,
+    if given, are the pads in the form of padLayouts, for layouts
+    built on the fly; layout then only names them.'''
+
+    if specs is None :
+      specs = padLayouts[layout]
+    key = (id(canvas),layout)
+    pads = self.pads.get(key) if self._owns(canvas) else None
+    if pads is None or len(pads) != len(specs) :
+      import ROOT
+      pads = []
+      for name, xlow, ylow, xup, yup, settings in specs :
+        pad = ROOT.TPad(name,name,xlow,ylow,xup,yup)
+        pads.append(pad)
+      if self._owns(canvas) :
+        self.pads[key] = pads
+
+    canvas.cd()
+    for pad, (name, xlow, ylow, xup, yup, settings) in zip(pads,specs) :
+      padname = "{0}_{1}".format(canvas.GetName(),name)
+      pad.Clear()
+      pad.SetPad(xlow,ylow,xup,yup)
+      pad.SetName(padname)
+      pad.SetTitle(padname)
+      pad.UseCurrentStyle()
+      pad.SetLogx(0)
+      pad.SetLogy(0)
+      for setter, value in settings :
+        getattr(pad,setter)(value)
+    # Drawing order matters: outer pad goes on top
+    for pad in pads[1:]+pads[:1] :
+      pad.Draw()
+    return list(pads)
+
+  def summary(self) :
+    return "Canvas pool: {0} canvases created, {1} reuses, {2} in use, {3} idle".format(\
+           self.nCreated,self.nReused,len(self.inUse),self._nCanvases()-len(self.inUse))
+
+  ## ----------------------------------------------------
+  ## Internal functions
+
+  def _wrap(self,method) :
+
+    def releasingDraw(*args,**kwargs) :
+      with self.releasing() :
+        return method(*args,**kwargs)
+
+    releasingDraw.__name__ = getattr(method,"__name__","releasingDraw")
+    releasingDraw.__wrapped__ = method
+    return releasingDraw
+
+  def _create(self,width,height) :
+    import ROOT
+    self.nCreated += 1
+    canvas = ROOT.TCanvas("canvaspool_{0}".format(self.nCreated),'',0,0,width,height)
+    self.sizes[id(canvas)] = (width,height)
+    self.owned[id(canvas)] = canvas
+    return canvas
+
+  def _owns(self,canvas) :
+    return self.owned.get(id(canvas)) is canvas
+
+  def _nCanvases(self) :
+    return len(self.inUse)+sum(len(idle) for idle in self.idle.values())
+
+  def _popAnyIdle(self) :
+    for size in self.idle :
+      if self.idle[size] :
+        return self.idle[size].pop()
+
+  def _destroy(self,canvas) :
+    for key in list(self.pads.keys()) :
+      if key[0] == id(canvas) :
+        del self.pads[key]
+    del self.sizes[id(canvas)]
+    del self.owned[id(canvas)]
+    canvas.Close()
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import ROOT
+from art.lazyroot import ROOT
 
 class ColourPalette(object) :
 
@@ -12,12 +12,24 @@ class ColourPalette(object) :
     self.dataPointColor = ROOT.kBlack
     self.dataFillColor = ROOT.kWhite
     self.palette = None
+    self.pendingPalette = None
+    self.paletteApplied = False
 
   ## ----------------------------------------------------
   ## User-accessible functions
 
   def setColourPalette(self, colourPalette) :
+    # Palettes allocate TColors, so the first one is only built
+    # when one of its colours is asked for (see __getattr__)
     self.palette = colourPalette
+    if self.paletteApplied :
+      self.applyColourPalette()
+    else :
+      self.pendingPalette = colourPalette
+
+  def applyColourPalette(self) :
+    self.pendingPalette = None
+    self.paletteApplied = True
     if self.palette == "ATLAS" :
       self.setATLASColours()
     elif self.palette == "Oxford" :
@@ -32,6 +44,13 @@ class ColourPalette(object) :
   def getColourPalette(self) :
     return self.palette
 
+  def __getattr__(self, name) :
+    # Only called for attributes not set yet: build a pending palette
+    if name.startswith("__") or self.__dict__.get("pendingPalette") is None :
+      raise AttributeError(name)
+    self.applyColourPalette()
+    return getattr(self,name)
+
   ## ----------------------------------------------------
   ## Individual palette definitions
 
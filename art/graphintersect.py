@@ -0,0 +1,166 @@
+# Crossing points of piecewise linear or log-linear curves.
+#
+# Mass limits come from where a theory cross-section curve crosses
+# an observed or expected limit curve. Instead of bisecting each
+# bracketing interval with repeated TGraph.Eval calls, the knots of
+# both curves are merged so that on every sub-interval each curve is
+# a single straight segment, either in y or in log(y). Sign changes
+# of the difference are found over all sub-intervals at once, and
+# the crossing is solved exactly where both curves are of the same
+# kind (the difference is then linear in y or in log(y)). Only
+# sub-intervals mixing a linear and a log-linear curve are bisected,
+# and those are bisected together as one array.
+#
+# Many pairs of curves can be handed over in one call: their
+# sub-intervals are stacked and solved in the same pass.
+
+import numpy as np
+from art import histarrays
+from art import loginterp
+
+# Bisection steps for mixed linear/log-linear sub-intervals:
+# enough to shrink any interval to double precision.
+_bisectionSteps = 64
+
+def _sorted(x,y) :
+  x = np.asarray(x,dtype=np.float64)
+  y = np.asarray(y,dtype=np.float64)
+  order = np.argsort(x,kind="mergesort")
+  return x[order], y[order]
+
+def _segmentAt(xs,x) :
+  # Index of the segment [xs[i],xs[i+1]] containing x
+  return np.clip(np.searchsorted(xs,x,side="right")-1,0,len(xs)-2)
+
+def _evaluate(x,x0,y0,x1,y1,log) :
+  # Straight line through (x0,y0),(x1,y1), in log(y) if log
+  if log :
+    return loginterp.logLinear(x,x0,y0,x1,y1)
+  return y0+(x-x0)/(x1-x0)*(y1-y0)
+
+def _curve(x,y,log) :
+  if log :
+    return loginterp.LogLinearInterpolator(x,y,extrapolate="nan")
+  return lambda at : np.interp(at,x,y)
+
+def _intervals(x1,y1,x2,y2,log1,log2) :
+  '''Sub-intervals holding the crossing of curve 1 with curve 2.
+
+  As the bisection in Morisot always did, at most one crossing is
+  kept per segment of curve 1: the segment has to lie inside the
+  range of curve 2, both curves have to be positive at its left
+  edge, and curve 1 has to be above curve 2 at exactly one of its
+  ends. The first sub-interval within it where that changes is
+  returned, described by its ends and the segment of each curve.'''
+
+  empty = [np.zeros(0)]*10
+  if len(x1) < 2 or len(x2) < 2 :
+    return empty
+
+  # Merge the knots of both curves over their overlap
+  inside = (x2 > x1[0]) & (x2 < x1[-1])
+  knots = np.unique(np.concatenate((x1,x2[inside])))
+  low = knots[:-1]
+  high = knots[1:]
+  middle = 0.5*(low+high)
+  segment1 = _segmentAt(x1,middle)
+  segment2 = _segmentAt(x2,middle)
+
+  # Per sub-interval ends of the segment of each curve
+  a1, b1 = x1[segment1], x1[segment1+1]
+  ya1, yb1 = y1[segment1], y1[segment1+1]
+  a2, b2 = x2[segment2], x2[segment2+1]
+  ya2, yb2 = y2[segment2], y2[segment2+1]
+
+  curve1 = _curve(x1,y1,log1)
+  curve2 = _curve(x2,y2,log2)
+  with np.errstate(invalid="ignore") :
+    aboveLow = curve1(low) > curve2(low)
+    aboveHigh = curve1(high) > curve2(high)
+
+  # Which segments of curve 1 qualify
+  segmentLow = x1[:-1]
+  segmentHigh = x1[1:]
+  at = np.clip(segmentLow,x2[0],x2[-1])
+  curve2AtLow = np.interp(at,x2,y2)
+  usable = (segmentHigh > segmentLow) & (x2[0] <= segmentLow) & (segmentHigh <= x2[-1]) \
+           & (y1[:-1] > 0) & (curve2AtLow > 0)
+  if log1 :
+    usable &= (y1[:-1] > 0) & (y1[1:] > 0)
+  if log2 :
+    # Every knot of curve 2 under the segment has to be positive
+    positive = np.concatenate(([0],np.cumsum(y2 <= 0)))
+    first = _segmentAt(x2,segmentLow)
+    last = _segmentAt(x2,segmentHigh)+1
+    usable &= positive[last+1]-positive[first] == 0
+
+  # First and last sub-interval of every segment of curve 1
+  segments = np.arange(len(x1)-1)
+  first = np.searchsorted(segment1,segments,side="left")
+  last = np.searchsorted(segment1,segments,side="right")-1
+  usable &= last >= first
+  segments = segments[usable]
+  first = first[usable]
+  last = last[usable]
+  crossing = aboveLow[first] != aboveHigh[last]
+  segments = segments[crossing]
+  first = first[crossing]
+
+  # First sub-interval with a change within each crossing segment
+  changes = np.flatnonzero(aboveLow != aboveHigh)
+  chosen = changes[np.searchsorted(changes,first)]
+  return [low[chosen],high[chosen],a1[chosen],ya1[chosen],b1[chosen],yb1[chosen],\
+          a2[chosen],ya2[chosen],b2[chosen],yb2[chosen]]
+
+def _solve(low,high,a1,ya1,b1,yb1,a2,ya2,b2,yb2,log1,log2) :
+  # Exact where both curves are straight in the same variable
+  if log1 == log2 :
+    transform = np.log if log1 else (lambda y : y)
+    def line(x,a,ya,b,yb) :
+      return transform(ya)+(x-a)/(b-a)*(transform(yb)-transform(ya))
+    atLow = line(low,a1,ya1,b1,yb1)-line(low,a2,ya2,b2,yb2)
+    atHigh = line(high,a1,ya1,b1,yb1)-line(high,a2,ya2,b2,yb2)
+    with np.errstate(invalid="ignore",divide="ignore") :
+      crossing = low+(high-low)*atLow/(atLow-atHigh)
+    return np.where(atLow == atHigh,0.5*(low+high),crossing)
+
+  # Otherwise bisect all intervals together
+  def aboveAt(x) :
+    return _evaluate(x,a1,ya1,b1,yb1,log1) > _evaluate(x,a2,ya2,b2,yb2,log2)
+  left = low.copy()
+  right = high.copy()
+  aboveLeft = aboveAt(left)
+  for step in range(_bisectionSteps) :
+    middle = 0.5*(left+right)
+    sameAsLeft = aboveAt(middle) == aboveLeft
+    left = np.where(sameAsLeft,middle,left)
+    right = np.where(sameAsLeft,right,middle)
+  return 0.5*(left+right)
+
+def findCrossings(curves,log1=False,log2=False) :
+  '''Crossings of many pairs of curves.
+
+  curves is a list of (x1,y1,x2,y2) arrays; log1 and log2 say
+  whether curves 1 and 2 are interpolated linearly in log(y).
+  Returns one sorted list of crossing x values per pair.'''
+
+  pieces = []
+  counts = []
+  for x1, y1, x2, y2 in curves :
+    x1, y1 = _sorted(x1,y1)
+    x2, y2 = _sorted(x2,y2)
+    intervals = _intervals(x1,y1,x2,y2,log1,log2)
+    pieces.append(intervals)
+    counts.append(len(intervals[0]))
+  if sum(counts) == 0 :
+    return [[] for count in counts]
+
+  stacked = [np.concatenate([piece[i] for piece in pieces]) for i in range(10)]
+  crossings = _solve(*(stacked+[log1,log2]))
+  return [list(chunk) for chunk in np.split(crossings,np.cumsum(counts)[:-1])]
+
+def findGraphCrossings(graphPairs,log1=False,log2=False) :
+  '''findCrossings for a list of (graph1,graph2) TGraph pairs.'''
+  curves = [(histarrays.graphX(graph1),histarrays.graphY(graph1),\
+             histarrays.graphX(graph2),histarrays.graphY(graph2)) for graph1, graph2 in graphPairs]
+  return findCrossings(curves,log1,log2)
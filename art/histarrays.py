@@ -0,0 +1,138 @@
+# NumPy views of ROOT histogram and graph buffers.
+#
+# Walking a histogram with GetBinContent/GetBinError costs one
+# PyROOT call per bin. The functions here instead wrap the
+# storage ROOT already holds (TH1::GetArray, TH1::GetSumw2,
+# TGraph::GetX/GetY, variable axis bins) in NumPy arrays without
+# copying, so whole-histogram operations run at NumPy speed and
+# writes to a view go straight into the histogram.
+#
+# Views stay valid as long as the object is alive and is not
+# rebinned or resized. Index 0 is the underflow bin and index
+# nbins+1 the overflow, exactly as in ROOT's bin numbering.
+#
+# Only numpy is needed at import time; ROOT is never imported
+# here, the functions just use the objects handed to them.
+
+import numpy as np
+
+# Histogram storage classes and the matching NumPy types
+_storageTypes = [("TArrayD",np.float64),("TArrayF",np.float32),("TArrayI",np.int32),\
+                 ("TArrayS",np.int16),("TArrayC",np.int8),("TArrayL64",np.int64)]
+
+def bufferView(buffer,count,dtype) :
+  '''NumPy view of count elements of a PyROOT buffer.'''
+  # Newer PyROOT hands back a LowLevelView that has to be told its
+  # length, older versions a PyDoubleBuffer with SetSize.
+  if count == 0 :
+    return np.zeros(0,dtype)
+  if hasattr(buffer,"reshape") :
+    buffer.reshape((count,))
+  elif hasattr(buffer,"SetSize") :
+    buffer.SetSize(count)
+  return np.frombuffer(buffer,dtype=dtype,count=count)
+
+def storageType(hist) :
+  for arrayclass, dtype in _storageTypes :
+    if hist.InheritsFrom(arrayclass) :
+      return dtype
+  raise TypeError("Cannot view storage of {0}".format(hist.ClassName()))
+
+def nCells(hist) :
+  if hasattr(hist,"GetNcells") :
+    return hist.GetNcells()
+  return hist.GetSize()
+
+def _shape(hist,array) :
+  # TH2/TH3 global bin = binx + (nx+2)*(biny + (ny+2)*binz):
+  # reshape and transpose so that view[binx,biny] matches ROOT.
+  dimension = hist.GetDimension()
+  if dimension == 1 :
+    return array
+  nx = hist.GetNbinsX()+2
+  ny = hist.GetNbinsY()+2
+  if dimension == 2 :
+    return array.reshape(ny,nx).T
+  nz = hist.GetNbinsZ()+2
+  return array.reshape(nz,ny,nx).T
+
+def contents(hist) :
+  '''Writable view of all bin contents, including under/overflow.'''
+  return _shape(hist,bufferView(hist.GetArray(),nCells(hist),storageType(hist)))
+
+def sumw2(hist) :
+  '''Writable view of the sum of squared weights, or None
+  if the histogram does not store them.'''
+  if hist.GetSumw2N() == 0 :
+    return None
+  return _shape(hist,bufferView(hist.GetSumw2().GetArray(),nCells(hist),np.float64))
+
+def errors(hist) :
+  '''Bin errors as TH1::GetBinError gives them for the default
+  (normal) error option. This is necessarily a new array.'''
+  if hist.InheritsFrom("TProfile") or hist.GetBinErrorOption() != 0 :
+    return _shape(hist,np.array([hist.GetBinError(i) for i in range(nCells(hist))]))
+  weights = sumw2(hist)
+  if weights is None :
+    return np.sqrt(np.abs(contents(hist).astype(np.float64)))
+  return np.sqrt(weights)
+
+def setContents(hist,values,binErrors=None) :
+  '''Fill all cells (including under/overflow) in one go.'''
+  contents(hist)[...] = values
+  if binErrors is not None :
+    if hist.GetSumw2N() == 0 :
+      hist.Sumw2()
+    sumw2(hist)[...] = np.square(binErrors)
+
+def edges(hist,axis="x") :
+  '''The nbins+1 bin edges of an axis. A view for variable
+  binning, a new array for fixed binning.'''
+  histaxis = {"x" : hist.GetXaxis, "y" : hist.GetYaxis, "z" : hist.GetZaxis}[axis]()
+  xbins = histaxis.GetXbins()
+  if xbins.GetSize() > 0 :
+    return bufferView(xbins.GetArray(),xbins.GetSize(),np.float64)
+  return np.linspace(histaxis.GetXmin(),histaxis.GetXmax(),histaxis.GetNbins()+1)
+
+def binLowEdges(hist,axis="x") :
+  '''GetBinLowEdge for every bin from 0 to nbins+1, using the
+  same convention as TAxis for underflow and overflow.'''
+  binEdges = edges(hist,axis)
+  averageWidth = (binEdges[-1]-binEdges[0])/float(len(binEdges)-1)
+  return np.concatenate(([binEdges[0]-averageWidth],binEdges))
+
+def binWidths(hist,axis="x") :
+  return np.diff(edges(hist,axis))
+
+def binCentres(hist,axis="x") :
+  binEdges = edges(hist,axis)
+  return 0.5*(binEdges[1:]+binEdges[:-1])
+
+def graphX(graph) :
+  return bufferView(graph.GetX(),graph.GetN(),np.float64)
+
+def graphY(graph) :
+  return bufferView(graph.GetY(),graph.GetN(),np.float64)
+
+def graphErrors(graph) :
+  '''Views of the low and high y errors of a graph (the same
+  array twice for symmetric errors), or None if it has none.'''
+  for low, high in [("GetEYlow","GetEYhigh"),("GetEY","GetEY")] :
+    if hasattr(graph,low) and getattr(graph,low)() :
+      return bufferView(getattr(graph,low)(),graph.GetN(),np.float64),\
+             bufferView(getattr(graph,high)(),graph.GetN(),np.float64)
+  return None
+
+def firstAndLastFilledBins(values) :
+  '''Vectorised form of the bin range scan used for axis ranges:
+  returns the bin just below the first non-zero bin and the bin
+  just above the last one, falling back to (1,nbins) if the
+  histogram is empty. values includes under/overflow.'''
+  nbins = len(values)-2
+  filled = np.flatnonzero(values[1:nbins+1])
+  firstBin = filled[0] if len(filled) else nbins
+  filled = np.flatnonzero(values[0:nbins+1])
+  lastBin = filled[-1]+1 if len(filled) else 0
+  if firstBin > lastBin :
+    return 1, nbins
+  return int(firstBin), int(lastBin)
@@ -0,0 +1,153 @@
+# Cached per-histogram summaries for axis-range decisions.
+#
+# The range helpers in Morisot and Morisot_2p0 used to rescan a
+# histogram bin by bin every time they were called, often several
+# times per plot and again for each plot reusing the histogram.
+# summarise(hist) computes everything they need in one vectorised
+# pass over the histogram's buffers and caches the result.
+#
+# Cache entries are checked against a checksum of the bin contents
+# and errors, so filling, scaling or SetBinContent on a histogram
+# invalidates its summary automatically.
+
+import zlib
+from collections import OrderedDict
+import numpy as np
+from art import histarrays
+
+maxCachedSummaries = 512
+_summaries = OrderedDict()
+
+def _checksum(array) :
+  array = np.ascontiguousarray(array)
+  try :
+    return zlib.adler32(memoryview(array))
+  except TypeError :
+    return zlib.adler32(array.tobytes())
+
+def _fingerprint(values,weights,hist) :
+  return (hist.GetName(),len(values),histarrays.binLowEdges(hist)[1],\
+          _checksum(values),_checksum(weights) if weights is not None else None)
+
+def summarise(hist) :
+  '''HistSummary of a 1D histogram, from the cache if the
+  histogram is unchanged since it was last summarised.'''
+
+  values = histarrays.contents(hist)
+  weights = histarrays.sumw2(hist)
+  fingerprint = _fingerprint(values,weights,hist)
+  key = id(hist)
+  summary = _summaries.get(key)
+  if summary is not None and summary.fingerprint == fingerprint :
+    _summaries.pop(key)
+    _summaries[key] = summary
+    return summary
+
+  summary = HistSummary(values,histarrays.errors(hist),histarrays.binLowEdges(hist))
+  summary.fingerprint = fingerprint
+  _summaries.pop(key,None)
+  _summaries[key] = summary
+  while len(_summaries) > maxCachedSummaries :
+    _summaries.popitem(False)
+  return summary
+
+def clearCache() :
+  _summaries.clear()
+
+def _scanExtreme(values,shifted,start,below) :
+  # The running value is compared with raw contents but set to a
+  # shifted one, which lies beyond the content. So it never passes
+  # the running extreme of the contents, and only bins setting a new
+  # strict extreme can change it: just those are walked in order.
+  if len(values) == 0 :
+    return start
+  if below :
+    records = values < np.minimum.accumulate(np.concatenate(([start],values)))[:-1]
+  else :
+    records = values > np.maximum.accumulate(np.concatenate(([start],values)))[:-1]
+  running = start
+  for value, result in zip(values[records].tolist(),shifted[records].tolist()) :
+    if (value < running) if below else (value > running) :
+      running = result
+  return running
+
+class HistSummary(object) :
+  '''Summary of a 1D histogram. All per-bin arrays are indexed by
+  ROOT bin number, 0 being the underflow and nbins+1 the overflow.'''
+
+  def __init__(self,values,errors,lowEdges) :
+
+    values = np.array(values,dtype=np.float64)
+    self.nbins = len(values)-2
+    self.lowEdges = np.array(lowEdges,dtype=np.float64)
+    self.values = values
+    self.lowWithErrors = values-errors
+    self.highWithErrors = values+errors
+    self.cumulative = np.cumsum(values)
+
+    nbins = self.nbins
+    regular = values[1:nbins+1]
+    nonZero = regular[regular > 0]
+    self.minimum = regular.min() if nbins else 0.
+    self.maximum = regular.max() if nbins else 0.
+    self.nonZeroMinimum = nonZero.min() if len(nonZero) else None
+    self.integral = self.cumulative[nbins]-self.cumulative[0]
+
+    # Bin just below the first filled bin and just above the last
+    # one, as the original bin-by-bin scans in Morisot found them.
+    self.rangeBins = histarrays.firstAndLastFilledBins(values)
+    # Morisot_2p0 lets the first bin run up to the overflow.
+    filled = np.flatnonzero(values[1:nbins+2])
+    firstBin = filled[0] if len(filled) else nbins+1
+    lastBin = self._lastBin(values)
+    self.rangeBinsToOverflow = (1,nbins) if firstBin > lastBin else (int(firstBin),int(lastBin))
+
+  def _lastBin(self,values) :
+    filled = np.flatnonzero(values[0:self.nbins+1])
+    return filled[-1]+1 if len(filled) else 0
+
+  def integralBetween(self,firstBin,lastBin) :
+    '''TH1::Integral(firstBin,lastBin) from the cumulative sums.'''
+    firstBin = max(firstBin,0)
+    lastBin = min(lastBin,self.nbins+1)
+    if lastBin < firstBin :
+      return 0.
+    return self.cumulative[lastBin]-(self.cumulative[firstBin-1] if firstBin > 0 else 0.)
+
+  def yRange(self,lowbin,highbin,xLow=None,xHigh=None) :
+    '''Low, low non-zero and high y values over bins [lowbin,highbin),
+    skipping bins entirely outside [xLow,xHigh], exactly as Morisot's
+    bin-by-bin scan found them: a bin whose content is below (above)
+    the running value sets it to its content minus (plus) its error.'''
+
+    use = np.ones(max(highbin-lowbin,0),dtype=bool)
+    if xLow :
+      use &= xLow <= self.lowEdges[lowbin+1:highbin+1]
+    if xHigh :
+      use &= xHigh >= self.lowEdges[lowbin:highbin]
+    values = self.values[lowbin:highbin][use]
+    lowyval = _scanExtreme(values,self.lowWithErrors[lowbin:highbin][use],1E10,True)
+    highyval = _scanExtreme(values,self.highWithErrors[lowbin:highbin][use],-1E10,False)
+    nonZero = values > 0
+    lownonzero = _scanExtreme(values[nonZero],self.lowWithErrors[lowbin:highbin][use][nonZero],1E10,True)
+    return lowyval,lownonzero,highyval
+
+  def contentRange(self,lowbin,highbin) :
+    '''Smallest non-zero and largest content over [lowbin,highbin)
+    the way Morisot_2p0 has always picked them: a bin that raises
+    the running maximum is not considered for the minimum.'''
+
+    values = self.values[lowbin:highbin]
+    actualMin = 1E10
+    actualMax = 0
+    if len(values) == 0 :
+      return actualMin, actualMax
+    runningMax = np.maximum.accumulate(np.concatenate(([0.],values)))[:-1]
+    newMax = values > runningMax
+    candidates = values[~newMax & (values != 0)]
+    candidates = candidates[candidates < actualMin]
+    if newMax.any() :
+      actualMax = values.max()
+    if len(candidates) :
+      actualMin = candidates.min()
+    return actualMin, actualMax
@@ -0,0 +1,179 @@
+# Catalogue of the keys in a ROOT file, built once and kept.
+#
+# Listing keys used to mean cd-ing into a directory and walking
+# gDirectory.GetListOfKeys() on every call, one directory at a time.
+# A KeyIndex walks the whole file once, subdirectories included, and
+# records the path, name, class and cycle of every key. It is kept in
+# memory for the rest of the process.
+#
+# Indexes can also be kept across processes in a sidecar next to the
+# file, <file>.keys.json, which records the file's size and
+# modification time and is only trusted while they are unchanged. So
+# checking which of thousands of files hold an object costs one stat
+# and one small JSON read per file after the first pass. Writing
+# sidecars is opt-in (writeSidecars, or writeSidecar per call), since
+# it leaves files in data directories that may be shared; sidecars
+# already there are always used.
+#
+# Files open for writing are always listed live: their keys can change
+# without the file on disk doing so.
+#
+# Usage:
+#   index = keyindex.indexFile("search.root")
+#   index.names()                          # keys at the top level
+#   index.find("*StatHist*",className="TH1*")
+#   index.has("dir/sub/hist")
+
+import os
+import json
+import fnmatch
+from art.lazyroot import ROOT
+
+indexVersion = 1
+
+# Write a sidecar for every file indexed
+writeSidecars = False
+
+# (path, size, mtime) -> KeyIndex, for this process
+_indexes = {}
+_directoryClasses = {}
+
+def sidecarName(filename) :
+  return filename+".keys.json"
+
+def _fileStamp(filename) :
+  status = os.stat(filename)
+  return {"size" : status.st_size, "mtime" : status.st_mtime}
+
+def _isDirectoryClass(className) :
+  if className not in _directoryClasses :
+    rootClass = ROOT.TClass.GetClass(className)
+    _directoryClasses[className] = bool(rootClass) and bool(rootClass.InheritsFrom("TDirectory"))
+  return _directoryClasses[className]
+
+def _walk(directory,prefix,entries) :
+  subdirectories = []
+  for key in directory.GetListOfKeys() :
+    name = key.GetName()
+    className = key.GetClassName()
+    isDirectory = _isDirectoryClass(className)
+    entries.append([prefix,name,className,key.GetCycle(),isDirectory])
+    if isDirectory and name not in subdirectories :
+      subdirectories.append(name)
+  for name in subdirectories :
+    subdirectory = directory.GetDirectory(name)
+    if subdirectory :
+      _walk(subdirectory,prefix+name+"/",entries)
+  return entries
+
+class KeyIndex(object) :
+
+  def __init__(self,entries) :
+
+    # Each entry: [directory ("" or "a/b/"), name, class, cycle, is a directory]
+    self.entries = entries
+    self._byDirectory = {}
+    for entry in entries :
+      self._byDirectory.setdefault(entry[0],[]).append(entry)
+    self._paths = frozenset(entry[0]+entry[1] for entry in entries)
+
+  @classmethod
+  def fromDirectory(cls,directory) :
+    '''Index of a live TFile or TDirectory.'''
+    return cls(_walk(directory,"",[]))
+
+  def _directoryEntries(self,directory) :
+    directory = directory.strip("/")
+    return self._byDirectory.get(directory+"/" if directory else "",[])
+
+  def keys(self,directory="") :
+    '''Entries of one directory, in the order ROOT lists them (every
+    cycle of a key included).'''
+    return list(self._directoryEntries(directory))
+
+  def names(self,directory="") :
+    return [entry[1] for entry in self._directoryEntries(directory)]
+
+  def namesAndClasses(self,directory="") :
+    return [[entry[1],entry[2]] for entry in self._directoryEntries(directory)]
+
+  def directories(self) :
+    return sorted(set(entry[0]+entry[1] for entry in self.entries if entry[4]))
+
+  def has(self,path) :
+    return path.strip("/") in self._paths
+
+  def find(self,pattern="*",className=None,directory=None) :
+    '''Paths of keys anywhere in the file whose path or name matches
+    the glob pattern and, if given, whose class matches the glob
+    className. directory limits the search to one directory.'''
+
+    found = []
+    for entry in self.entries if directory is None else self._directoryEntries(directory) :
+      path = entry[0]+entry[1]
+      if not (fnmatch.fnmatchcase(path,pattern) or fnmatch.fnmatchcase(entry[1],pattern)) :
+        continue
+      if className is not None and not fnmatch.fnmatchcase(entry[2],className) :
+        continue
+      if path not in found :
+        found.append(path)
+    return found
+
+def _readSidecar(filename,stamp) :
+  try :
+    with open(sidecarName(filename)) as infile :
+      stored = json.load(infile)
+  except (IOError,OSError,ValueError) :
+    return None
+  if stored.get("version") != indexVersion or stored.get("source") != stamp :
+    return None
+  return KeyIndex(stored["entries"])
+
+def _writeSidecar(filename,stamp,index) :
+  # Best effort: the index is still used if the directory is read-only
+  temporary = sidecarName(filename)+".tmp{0}".format(os.getpid())
+  try :
+    with open(temporary,"w") as outfile :
+      json.dump({"version" : indexVersion, "source" : stamp, "entries" : index.entries},outfile)
+    os.rename(temporary,sidecarName(filename))
+  except (IOError,OSError) :
+    if os.path.exists(temporary) :
+      os.remove(temporary)
+
+def indexFile(filename,openFile=None,writeSidecar=None) :
+  '''KeyIndex of the file on disk. openFile, if given, is an open
+  TFile of it to read the keys from rather than opening it again.
+  writeSidecar defaults to writeSidecars.'''
+
+  filename = os.path.abspath(filename)
+  stamp = _fileStamp(filename)
+  cacheKey = (filename,stamp["size"],stamp["mtime"])
+  if cacheKey in _indexes :
+    return _indexes[cacheKey]
+
+  index = _readSidecar(filename,stamp)
+  if index is None :
+    tfile = openFile if openFile is not None else ROOT.TFile.Open(filename,"READ")
+    if not tfile or tfile.IsZombie() :
+      raise IOError("Cannot open {0}".format(filename))
+    try :
+      index = KeyIndex.fromDirectory(tfile)
+    finally :
+      if openFile is None :
+        tfile.Close()
+    if writeSidecar or (writeSidecar is None and writeSidecars) :
+      _writeSidecar(filename,stamp,index)
+  _indexes[cacheKey] = index
+  return index
+
+def indexOpenFile(tfile) :
+  '''KeyIndex of an open TFile: cached if it is read-only and on
+  disk, listed live otherwise.'''
+
+  filename = tfile.GetName()
+  if tfile.IsWritable() or not os.path.isfile(filename) :
+    return KeyIndex.fromDirectory(tfile)
+  return indexFile(filename,tfile)
+
+def clearCache() :
+  _indexes.clear()
@@ -0,0 +1,94 @@
+# Deferred loading of ROOT and the ATLAS style.
+#
+# Importing ROOT and setting up the style takes seconds, which
+# used to be paid by every script importing the painters even if
+# it never drew anything. Modules here use the ROOT proxy below
+# instead of "import ROOT": the real module is only imported the
+# first time something other than a colour constant is looked up
+# on it, and ensureStyle() sets the style once per process.
+#
+# Painters call requestStyle() when they are built. If ROOT is
+# already loaded the style is applied there and then, as it always
+# was; otherwise it is applied as soon as ROOT is loaded through the
+# proxy, and in any case before a painter makes its first canvas.
+# Only a script that imports ROOT itself after building a painter
+# and draws on its own canvases without touching the painter needs
+# to call ensureStyle() first.
+
+import sys
+
+# EColor values from Rtypes.h, so that colour constants in default
+# arguments and colour lists do not force ROOT to be loaded.
+colours = {
+  "kWhite" : 0, "kBlack" : 1, "kGray" : 920,
+  "kRed" : 632, "kGreen" : 416, "kBlue" : 600, "kYellow" : 400,
+  "kMagenta" : 616, "kCyan" : 432, "kOrange" : 800, "kSpring" : 820,
+  "kTeal" : 840, "kAzure" : 860, "kViolet" : 880, "kPink" : 900,
+}
+
+_styleApplied = False
+_styleRequested = False
+
+def load() :
+  '''The real ROOT module, imported on first use.'''
+  import ROOT as root
+  return root
+
+def isLoaded() :
+  return "ROOT" in sys.modules
+
+def ensureStyle() :
+  '''Apply the ATLAS style and force it on drawn objects,
+  once per process.'''
+
+  global _styleApplied
+  if _styleApplied :
+    return
+  root = load()
+  # Python AtlasStyle module if there is one, else the ROOT-side macro
+  try :
+    import AtlasStyle
+    setStyle = getattr(AtlasStyle,"SetAtlasStyle",root.SetAtlasStyle)
+  except ImportError :
+    setStyle = root.SetAtlasStyle
+  setStyle()
+  root.gROOT.ForceStyle()
+  _styleApplied = True
+
+def requestStyle() :
+  '''Have the style applied once ROOT is loaded, or now if it is.'''
+
+  global _styleRequested
+  _styleRequested = True
+  if isLoaded() :
+    ensureStyle()
+
+class _ROOTProxy(object) :
+  '''Stands in for the ROOT module until it is really needed.'''
+
+  def __getattr__(self,name) :
+    if name in colours and not isLoaded() :
+      return colours[name]
+    root = load()
+    if _styleRequested and not _styleApplied :
+      ensureStyle()
+    return getattr(root,name)
+
+ROOT = _ROOTProxy()
+
+class lazyAttribute(object) :
+  '''Decorator for an instance attribute built on first access,
+  for ROOT objects a painter may never need. The result is stored
+  on the instance, so later lookups and assignments are ordinary.'''
+
+  def __init__(self,function) :
+    self.function = function
+    self.name = function.__name__
+    self.__doc__ = function.__doc__
+
+  def __get__(self,instance,owner) :
+    if instance is None :
+      return self
+    value = self.function(instance)
+    instance.__dict__[self.name] = value
+    return value
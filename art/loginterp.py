@@ -0,0 +1,75 @@
+# Interpolation linear in log(y), as used for cross-section and
+# limit curves that fall exponentially with mass.
+#
+# An interpolator is built once per curve: the knots are sorted
+# and log(y) and the slope of every segment are computed up front,
+# so evaluating it at any number of points is one binary search
+# and a few array operations.
+
+import numpy as np
+from art import histarrays
+
+# What to do with x outside the knots:
+#   "raise"    : ValueError
+#   "nan"      : return nan
+#   "constant" : the y value of the nearest end knot
+#   "extend"   : carry on the first or last segment
+extrapolations = ["raise","nan","constant","extend"]
+
+def logLinear(x,x0,y0,x1,y1) :
+  '''Straight line in log(y) through (x0,y0),(x1,y1), evaluated at x.
+  Works element-wise on arrays.'''
+  with np.errstate(divide="ignore",invalid="ignore") :
+    logy0 = np.log(y0)
+    return np.exp(logy0+(x-x0)/(x1-x0)*(np.log(y1)-logy0))
+
+class LogLinearInterpolator(object) :
+
+  def __init__(self,x,y,extrapolate="raise") :
+
+    if extrapolate not in extrapolations :
+      raise ValueError("Unknown extrapolation {0}; choose from {1}".format(extrapolate,extrapolations))
+    x = np.array(x,dtype=np.float64)
+    y = np.array(y,dtype=np.float64)
+    if len(x) < 2 or len(x) != len(y) :
+      raise ValueError("Need at least two points with matching x and y")
+    order = np.argsort(x,kind="mergesort")
+    self.x = x[order]
+    self.y = y[order]
+    self.extrapolate = extrapolate
+    with np.errstate(divide="ignore",invalid="ignore") :
+      self.logY = np.log(self.y)
+      self.slopes = np.diff(self.logY)/np.diff(self.x)
+    # Unsorted input as given, to check against later
+    self.inputX = x
+    self.inputY = y
+
+  @classmethod
+  def fromGraph(cls,graph,extrapolate="raise") :
+    return cls(histarrays.graphX(graph),histarrays.graphY(graph),extrapolate)
+
+  def represents(self,x,y) :
+    '''True if this interpolator was built from exactly these points.'''
+    return np.array_equal(self.inputX,x) and np.array_equal(self.inputY,y)
+
+  def __call__(self,x) :
+    '''y at x, for a single number or an array of them.'''
+
+    values = np.asarray(x,dtype=np.float64)
+    segment = np.clip(np.searchsorted(self.x,values,side="right")-1,0,len(self.x)-2)
+    with np.errstate(invalid="ignore",over="ignore") :
+      result = np.exp(self.logY[segment]+self.slopes[segment]*(values-self.x[segment]))
+
+    below = values < self.x[0]
+    above = values > self.x[-1]
+    if self.extrapolate != "extend" and (below.any() or above.any()) :
+      if self.extrapolate == "raise" :
+        raise ValueError("x outside the interpolation range [{0},{1}]".format(self.x[0],self.x[-1]))
+      elif self.extrapolate == "nan" :
+        result = np.where(below | above,np.nan,result)
+      else :
+        result = np.where(below,self.y[0],np.where(above,self.y[-1],result))
+
+    if result.ndim == 0 :
+      return float(result)
+    return result
@@ -5,13 +5,20 @@
 # and comparable plots.
 
 import sys
-import ROOT
-import AtlasStyle
 #import AtlasUtils
 import math
 import time
 from array import array
 from colourPalette import ColourPalette
+from art.lazyroot import ROOT, lazyAttribute, ensureStyle, requestStyle
+from art.canvasexport import CanvasExporter
+from art.plotcache import PlotCache
+from art.canvaspool import CanvasPool
+from art import histarrays
+from art import ratios
+from art import histsummary
+from art import graphintersect
+from art import loginterp
 from collections import Iterable
 
 def colorInterpolate(col1, col2,  w = 0.5):
@@ -30,9 +37,8 @@ class Morisot(object) :
 
   def __init__(self) :
 
-    # Set up ATLAS style
-    AtlasStyle.SetAtlasStyle()
-    ROOT.gROOT.ForceStyle()
+    # ATLAS style: applied now if ROOT is loaded, else when it is (see lazyroot)
+    requestStyle()
 
     # Values for luminosity and CME:
     # Will be same for all your plots so just set
@@ -53,6 +59,18 @@ class Morisot(object) :
     self.saveCFile = False
     self.saveRootFile = False
     self.savePDFFile = False
+    self.savePNGFile = False
+    self.saveSVGFile = False
+
+    # Files are written out by a background thread;
+    # call flushOutput() to wait for them.
+    self.exporter = None
+
+    # Canvases and pads are reused from plot to plot, and given
+    # back when a draw method returns or raises
+    self.canvasPool = CanvasPool()
+    self.canvasPool.attach(self)
+    self.logInterpolators = {}
 
     # Plot general styling
     self.doRectangular = False
@@ -75,24 +93,8 @@ class Morisot(object) :
                      ROOT.kRed,ROOT.kRed+1,ROOT.kRed+2,ROOT.kOrange+9,ROOT.kOrange+10,\
                      ROOT.kOrange+7,ROOT.kOrange,ROOT.kYellow]
 
-    self.myLatex = ROOT.TLatex()
-    self.myLatex.SetTextColor(ROOT.kBlack)
-    self.myLatex.SetNDC()
-
-    self.myLatex2 = ROOT.TLatex()
-    self.myLatex2.SetTextColor(ROOT.kBlack)
-    self.myLatex2.SetNDC()
-
-    self.whitebox = ROOT.TPaveText()
-    self.whitebox.SetFillColor(0)
-    self.whitebox.SetFillStyle(1001)
-    self.whitebox.SetTextColor(ROOT.kBlack)
-    self.whitebox.SetTextFont(42)
-    self.whitebox.SetTextAlign(11)
-    self.whitebox.SetBorderSize(0)
-
-    self.line = ROOT.TLine()
-    self.line2 = ROOT.TLine()
+    # myLatex, myLatex2, whitebox, line and line2 are
+    # made when first used: see below
 
     self.labeltype = 2 # ATLAS internal
     
@@ -115,6 +117,39 @@ class Morisot(object) :
 
     self.doAxisTeV = False # Use histogram's natural units
 
+  @lazyAttribute
+  def myLatex(self) :
+    return self.makeNDCLatex()
+
+  @lazyAttribute
+  def myLatex2(self) :
+    return self.makeNDCLatex()
+
+  @lazyAttribute
+  def whitebox(self) :
+    whitebox = ROOT.TPaveText()
+    whitebox.SetFillColor(0)
+    whitebox.SetFillStyle(1001)
+    whitebox.SetTextColor(ROOT.kBlack)
+    whitebox.SetTextFont(42)
+    whitebox.SetTextAlign(11)
+    whitebox.SetBorderSize(0)
+    return whitebox
+
+  @lazyAttribute
+  def line(self) :
+    return ROOT.TLine()
+
+  @lazyAttribute
+  def line2(self) :
+    return ROOT.TLine()
+
+  def makeNDCLatex(self) :
+    latex = ROOT.TLatex()
+    latex.SetTextColor(ROOT.kBlack)
+    latex.SetNDC()
+    return latex
+
   def setColourPalette(self,palette) :
     self.colourpalette.setColourPalette(palette)
 
@@ -168,24 +203,13 @@ class Morisot(object) :
   def createRatio(self,hist_num,histlist_denom) :
     # Error is just bin error of hist 1 divided by hist 2
     # unless otherwise specified.
-    ratio = hist_num.Clone()
-    ratio.SetName(hist_num.GetName()+"_ratioplot")
-    ratio.SetDirectory(0)
-    ratio.Reset()
-    total_hist = hist_num.Clone()
-    total_hist.SetName(hist_num.GetName()+"_stackForDenominator")
-    total_hist.SetDirectory(0)
-    total_hist.Reset()
-    for hist_denom in histlist_denom :
-      total_hist.Add(hist_denom)
-    for bin in range (0,ratio.GetNbinsX()+2) : 
-      if total_hist.GetBinContent(bin) != 0 :
-        ratio.SetBinContent(bin,hist_num.GetBinContent(bin)/total_hist.GetBinContent(bin))
-        ratio.SetBinError(bin,hist_num.GetBinError(bin)/total_hist.GetBinContent(bin))
-      else :
-        ratio.SetBinContent(bin,0)
-        ratio.SetBinError(bin,0)
-    return ratio
+    return ratios.createRatios([hist_num],histlist_denom)[0]
+
+  def createRatios(self,hists_num,histlist_denom,errorMode="numerator") :
+    # Many numerators against one stack (or one stack each),
+    # summing each stack only once. errorMode is "numerator",
+    # "poisson" or "binomial": see art/ratios.py.
+    return ratios.createRatios(hists_num,histlist_denom,errorMode)
 
   def drawBasicDataPlot(self,dataHist,xname,yname,legendlines,outputname,binlow=-1,binhigh=-1,doLogY=False,doLogX=False) :
 
@@ -774,23 +798,14 @@ class Morisot(object) :
       c = self.makeCanvas(canvasname,doLogX,doLogY)
 
     if doLegendOutsidePlot :
-      outpad = ROOT.TPad("extpad","extpad",0,0,1,1) # For marking outermost dimensions
+      # Outer pad marks outermost dimensions, pad1 holds the main
+      # histo and pad2 the legend: see "legendRight" in canvaspool.
       if len(histograms) > 12 :
-        pad1 = ROOT.TPad("pad1","pad1",0,0,0.5,1) # For main histo
-        pad2 = ROOT.TPad("pad2","pad2",0.5,0,1,1) # For signal significance histo
+        outpad,pad1,pad2 = self.canvasPool.layoutPads(c,"legendRightWide")
       else :
-        pad1 = ROOT.TPad("pad1","pad1",0,0,0.66,1) # For main histo
-        pad2 = ROOT.TPad("pad2","pad2",0.66,0,1,1) # For signal significance histo
-
-      # Set up to draw in right orientations
-      outpad.SetFillStyle(4000) #transparent
-      pad1.SetBorderMode(0)
+        outpad,pad1,pad2 = self.canvasPool.layoutPads(c,"legendRight")
       pad1.SetLogy(doLogY)
       pad1.SetLogx(doLogX)
-      pad2.SetBorderMode(0)
-      pad1.Draw()
-      pad2.Draw()
-      outpad.Draw()
 
       pad1.cd()
 
@@ -1391,34 +1406,12 @@ class Morisot(object) :
     c = self.makeCanvas(canvasname,doLogX,True)
     self.doRectangular = saveDoRectangular
 
-    # Make pads
-    # Dimensions: xlow, ylow, xup, yup
-    outpad = ROOT.TPad("extpad","extpad",0,0,1,1) # For marking outermost dimensions
-    pad1 = ROOT.TPad("pad1","pad1",0,0.4,1,1) # For main histo
-    pad2 = ROOT.TPad("pad2","pad2",0,0.25,1,0.4) # For residuals histo
-    pad3 = ROOT.TPad("pad2","pad2",0,0,1,0.25) # For residuals histo    
-
-    # Set up pads to draw with right spacings
-    outpad.SetFillStyle(4000) #transparent
-    pad1.SetBorderMode(0)
-    pad1.SetLogy(1)
+    # Make pads: main histo over two residuals histos,
+    # see "threepad" in canvaspool
+    outpad,pad1,pad2,pad3 = self.canvasPool.layoutPads(c,"threepad")
     pad1.SetLogx(doLogX)
-    pad1.SetLeftMargin(0.1)
-    pad1.SetBottomMargin(0.00001)
-    pad2.SetLeftMargin(0.1)
-    pad2.SetTopMargin(0.00001)
-    pad2.SetBottomMargin(0.00001)
-    pad2.SetBorderMode(0)
-    pad2.SetLogx(doLogX)    
-    pad3.SetLeftMargin(0.1)
-    pad3.SetTopMargin(0.00001)
-    pad3.SetBottomMargin(0.4)
-    pad3.SetBorderMode(0)
+    pad2.SetLogx(doLogX)
     pad3.SetLogx(doLogX)
-    pad1.Draw()
-    pad2.Draw()
-    pad3.Draw()
-    outpad.Draw()
     
     # Define a few common items
     leftOfLegend1 = 0.13
@@ -1573,6 +1566,7 @@ class Morisot(object) :
       if saveEfile:
         c.SaveAs(Eoutputname)
         c.SaveAs(EPSoutputname)
+      self.canvasPool.release(c)
       
       return
       
@@ -2150,39 +2144,17 @@ class Morisot(object) :
     if not mcHist==None :
       drawMC=True
 
-    # Dimensions: xlow, ylow, xup, yup
-    outpad = ROOT.TPad("extpad","extpad",0,0,1,1) # For marking outermost dimensions
-    pad1 = ROOT.TPad("pad1","pad1",0,0.3,1,1) # For main histo
-    #pad2 = ROOT.TPad("pad2","pad2",0,0.23,1,0.36) # For signal significance histo
-    #pad3 = ROOT.TPad("pad3","pad3",0,0,1,0.23) # For residuals histo
-    pad3 = ROOT.TPad("pad3","pad3",0,0,1,0.30) # For residuals histo
-
-    # Set up to draw in right orientations
-    outpad.SetFillStyle(4000) #transparent
-    pad1.SetBottomMargin(0.00001)
-    pad1.SetBorderMode(0)
-    pad1.SetLogy(1)
+    # Main histo over residuals histo: see "residual" in canvaspool
+    outpad,pad1,pad3 = self.canvasPool.layoutPads(c,"residual")
     pad1.SetLogx(doLogX)
-    #pad2.SetTopMargin(0.00001)
-    #pad2.SetBottomMargin(0.00001)
-    #pad2.SetBorderMode(0)
-    #pad2.SetLogx(doLogX)
-    pad3.SetTopMargin(0.00001)
-    pad3.SetBottomMargin(0.43)
-    pad3.SetBorderMode(0)
     pad3.SetLogx(doLogX)
-    pad1.Draw()
-    #pad2.Draw()
-    pad3.Draw()
 
     # Publication-friendly margins
     pad1.SetLeftMargin(0.1)
-#    pad2.SetLeftMargin(0.2)
     pad3.SetLeftMargin(0.1)
     pad1.SetTopMargin(0.02)
     pad1.SetRightMargin(0.02)
     pad3.SetRightMargin(0.02)
-    outpad.Draw()
 
     # Use bin range within which bkgPlot has entries,
     # plus one empty on either side if available
@@ -2374,9 +2346,9 @@ class Morisot(object) :
     canvasname = outputname+'_cv'
     c = self.makeCanvas(canvasname,doLogX,doLogY)
 
-    # Dimensions: xlow, ylow, xup, yup
-    outpad = ROOT.TPad("extpad","extpad",0,0,1,1) # For marking outermost dimensions
-    pads = []
+    # Dimensions: xlow, ylow, xup, yup. The outer pad marks the
+    # outermost dimensions; pads come from the canvas pool.
+    specs = [("extpad",0,0,1,1,[("SetFillStyle",4000)])]
     if len(residualList) == 1 :
       padsize = 0.2
     elif len(residualList) == 2 :
@@ -2389,29 +2361,21 @@ class Morisot(object) :
     for ipad in range(len(residualList)+1) :
       padname = "pad_{0}".format(ipad)
       if ipad == 0 :
-        pad = ROOT.TPad(padname,padname,0,topOfSubplots,1,1) # for main histo
+        # for main histo
+        specs.append((padname,0,topOfSubplots,1,1,[("SetBorderMode",0),("SetBottomMargin",0.00001)]))
       elif ipad!= len(residualList) :
-        pad = ROOT.TPad(padname,padname,0,topOfSubplots - ipad*padsize, 1, topOfSubplots - (ipad-1)*padsize)
+        specs.append((padname,0,topOfSubplots - ipad*padsize, 1, topOfSubplots - (ipad-1)*padsize,\
+                      [("SetBorderMode",0),("SetTopMargin",0.00001),("SetBottomMargin",0.00001)]))
       else :
-        pad = ROOT.TPad(padname,padname,0, 0, 1, topOfSubplots - (ipad-1)*padsize)
-      pads.append(pad)
+        specs.append((padname,0, 0, 1, topOfSubplots - (ipad-1)*padsize,\
+                      [("SetBorderMode",0),("SetTopMargin",0.00001),("SetBottomMargin",0.1/(0.1+padsize))]))
 
     # Set up to draw pads in the right places
-    outpad.SetFillStyle(4000) #transparent
+    pads = self.canvasPool.layoutPads(c,"ratios{0}".format(len(residualList)),specs)
+    outpad = pads.pop(0)
     for pad in pads :
-      pad.SetBorderMode(0)
       pad.SetLogx(doLogX)
-      if pads.index(pad)==0 :
-        pad.SetBottomMargin(0.00001)
-        pad.SetLogy(doLogY)
-      elif pads.index(pad)==len(pads)-1 :
-        pad.SetTopMargin(0.00001)
-        pad.SetBottomMargin(0.1/(0.1+padsize))
-      else :
-        pad.SetTopMargin(0.00001)
-        pad.SetBottomMargin(0.00001)
-      pad.Draw()
-    outpad.Draw()
+    pads[0].SetLogy(doLogY)
 
     # Use range within which bkgPlot has entries,
     # plus one empty bin on either side if available
@@ -2727,17 +2691,14 @@ class Morisot(object) :
 
     if len(signals)==0:
       return
-    elif len(signals)==1:
-      signal = signals[0]
-      obsLimits = self.calculateIntersectionOfGraphs(signal,observed,True,True)
-      expLimits = self.calculateIntersectionOfGraphs(signal,expected1sigma,True,True)
-      return [obsLimits,expLimits]
+    pairs = []
+    for signal in signals :
+      pairs += [(signal,observed),(signal,expected1sigma)]
+    limits = self.calculateIntersectionsOfGraphs(pairs,True,True)
+    output = [[limits[i],limits[i+1]] for i in range(0,len(limits),2)]
+    if len(signals)==1:
+      return output[0]
     else :
-      output = []
-      for signal in signals :
-        obsLimits = self.calculateIntersectionOfGraphs(signal,observed,True,True)
-        expLimits = self.calculateIntersectionOfGraphs(signal,expected1sigma,True,True)
-        output.append([obsLimits,expLimits])
       return output
 
   def draw2DHist(self,hist,outputname,xAxisName,xlow,xhigh,yAxisName,ylow,yhigh,zAxisName,makeCanvas=True) :
@@ -3585,11 +3546,13 @@ class Morisot(object) :
 
   def makeCanvas(self,canvasname,doLogX=False,doLogY=False,scaleX=1.0,scaleY=1.0) :
 
+    ensureStyle()
+
     if self.doRectangular :
       dim = int(800*scaleX),int(600*scaleY)
     else :
       dim = int(600*scaleX),int(600*scaleY)
-    canvas = ROOT.TCanvas(canvasname,'',0,0,dim[0],dim[1])
+    canvas = self.canvasPool.acquire(canvasname,dim[0],dim[1])
     canvas.SetGridx(0)
     canvas.SetGridy(0)
     canvas.SetLogx(doLogX)
@@ -3597,14 +3560,37 @@ class Morisot(object) :
     return canvas
 
   def saveCanvas(self, canvas, outputname) :
+    outputnames = []
     if self.saveEPSFile :
-      canvas.SaveAs(outputname+".eps")
+      outputnames.append(outputname+".eps")
     if self.saveCFile : 
-      canvas.SaveSource(outputname+".C")
+      outputnames.append(outputname+".C")
     if self.saveRootFile : 
-      canvas.SaveSource(outputname+".root")
+      outputnames.append(outputname+".root")
     if self.savePDFFile:
-      canvas.SaveAs(outputname+".pdf")
+      outputnames.append(outputname+".pdf")
+    if self.savePNGFile :
+      outputnames.append(outputname+".png")
+    if self.saveSVGFile :
+      outputnames.append(outputname+".svg")
+    self.getExporter().export(canvas,outputnames)
+    self.canvasPool.release(canvas)
+
+  def getExporter(self) :
+    if self.exporter is None :
+      self.exporter = CanvasExporter()
+    return self.exporter
+
+  def flushOutput(self) :
+    if self.exporter is not None :
+      self.exporter.flush()
+
+  def usePlotCache(self,cachedir,maxBytes=2*1024**3) :
+    # Skip re-rendering plots whose inputs and settings are unchanged.
+    # Call self.plotCache.close() at the end to store the last plots.
+    self.plotCache = PlotCache(cachedir,maxBytes)
+    self.plotCache.attach(self)
+    return self.plotCache
 
   def makeLegend(self,legX1,legY1,legX2,legY2,fontSize = 0.04) :
 
@@ -3621,47 +3607,18 @@ class Morisot(object) :
 
   def getAxisRangeFromHist(self,hist) :
     # Axis range should be decided by data hist
-    firstBin =0
-    while (hist.GetBinContent(firstBin+1)==0 and firstBin < hist.GetNbinsX()) :
-      firstBin+=1
-    lastBin = hist.GetNbinsX()+1
-    while (hist.GetBinContent(lastBin-1)==0 and lastBin > 0) :
-      lastBin-=1
-    if (firstBin > lastBin) :
-      firstBin=1
-      lastBin = hist.GetNbinsX()
+    firstBin,lastBin = self.getAxisRangeFromHist_Bins(hist)
     return hist.GetBinLowEdge(firstBin),hist.GetBinLowEdge(lastBin+1)
 
   def getAxisRangeFromHist_Bins(self,hist) :
     # Axis range should be decided by data hist
-    firstBin =0
-    while (hist.GetBinContent(firstBin+1)==0 and firstBin < hist.GetNbinsX()) :
-      firstBin+=1
-    lastBin = hist.GetNbinsX()+1
-    while (hist.GetBinContent(lastBin-1)==0 and lastBin > 0) :
-      lastBin-=1
-    if (firstBin > lastBin) :
-      firstBin=1
-      lastBin = hist.GetNbinsX()
-    return firstBin,lastBin    
+    return histsummary.summarise(hist).rangeBins
 
   def getYRangeFromHist(self,hist,xLow=None,xHigh=None) :
-    lowyval = 1E10
-    lownonzero = 1E10
-    highyval = -1E10
-    lowbin,highbin = self.getAxisRangeFromHist_Bins(hist)
     # Add size of error in each bin so that if we're drawing them we still have room
-    for bin in range(lowbin,highbin) :
-      if xLow and xLow > hist.GetBinLowEdge(bin+1) :
-        continue
-      if xHigh and xHigh < hist.GetBinLowEdge(bin) : continue
-      if hist.GetBinContent(bin) < lowyval :
-        lowyval = hist.GetBinContent(bin)-hist.GetBinError(bin)
-      if hist.GetBinContent(bin) < lownonzero and hist.GetBinContent(bin) > 0 :
-        lownonzero = hist.GetBinContent(bin)-hist.GetBinError(bin)
-      if hist.GetBinContent(bin) > highyval :
-        highyval = hist.GetBinContent(bin)+hist.GetBinError(bin)
-    return lowyval,lownonzero,highyval
+    summary = histsummary.summarise(hist)
+    lowbin,highbin = summary.rangeBins
+    return summary.yRange(lowbin,highbin,xLow,xHigh)
 
   def getGoodColours(self, ncolours) :
     if ncolours < 4 :
@@ -3825,22 +3782,9 @@ class Morisot(object) :
 
   def setStandardTwoPads(self) :
   
-    # Dimensions: xlow, ylow, xup, yup
-    outpad = ROOT.TPad("extpad","extpad",0,0,1,1) # For marking outermost dimensions
-    pad1 = ROOT.TPad("pad1","pad1",0,0.27,1,1) # For main histo
-    pad2 = ROOT.TPad("pad2","pad2",0,0,1,0.27) # For residuals histo
-
-    # Set up to draw in right orientations
-    outpad.SetFillStyle(4000) #transparent
-    pad1.SetBottomMargin(0.00001)
-    pad1.SetBorderMode(0)
-    pad1.SetLogy(1)
-    pad2.SetTopMargin(0.00001)
-    pad2.SetBottomMargin(0.35) # 0.3
-    pad2.SetBorderMode(0)
-    pad1.Draw()
-    pad2.Draw()
-    outpad.Draw()
+    # Outer pad marks outermost dimensions, pad1 holds the main
+    # histo and pad2 the residuals: see "twopad" in canvaspool.
+    outpad,pad1,pad2 = self.canvasPool.layoutPads(ROOT.gPad.GetCanvas(),"twopad")
     return outpad,pad1,pad2
 
   # drawStyle dictates how prediction is displayed.
@@ -4156,87 +4100,29 @@ class Morisot(object) :
     return flat_list
 
   def calculateIntersectionOfGraphs(self, graph1, graph2, doLogGraph1=False, doLogGraph2=False) :
+    # x values where graph1 crosses graph2, at most one per segment of graph1.
+    # doLogGraph* interpolate that graph linearly in log(y).
+    return self.calculateIntersectionsOfGraphs([(graph1,graph2)],doLogGraph1,doLogGraph2)[0]
 
-    crossings = []
-
-    for point in range(graph1.GetN()-1) :
-      graph1HigherAtLeft=False
-      graph1HigherAtRight=False
-      thisX1 = graph1.GetX()[point]
-      thisX2 = graph1.GetX()[point+1]
-
-      if graph1.Eval(thisX1) <= 0 or graph2.Eval(thisX1) <= 0 \
-           or graph2.GetX()[0] > thisX1 or graph2.GetX()[graph2.GetN()-1] < thisX2 :
-        continue
-
-      graph1y1 = graph1.GetY()[point]
-      graph1y2 = graph1.GetY()[point+1]
-      if doLogGraph2 :
-        graph2y1 = self.getGraphAtXWithLog(graph2,thisX1)
-        graph2y2 = self.getGraphAtXWithLog(graph2,thisX2)
-      else :
-        graph2y1 = graph2.Eval(thisX1)
-        graph2y2 = graph2.Eval(thisX2)
-
-      if (graph1y1 > graph2y1) :
-        graph1HigherAtLeft = True
-      if (graph1y2 > graph2y2) :
-        graph1HigherAtRight = True
-
-      # If no crossing in this interval carry on
-      if (graph1HigherAtLeft == graph1HigherAtRight) :
-        continue
-
-      # Otherwise, figure out where and keep it
-      xtest = 0.5*(thisX1+thisX2)
-      while(abs(thisX1-thisX2) > 0.001) :
-
-        if doLogGraph1 :
-          graph1y1 = self.getGraphAtXWithLog(graph1,thisX1)
-          graph1y2 = self.getGraphAtXWithLog(graph1,thisX2)
-          graph1ytest = self.getGraphAtXWithLog(graph1,xtest)
-        else :
-          graph1y1 = graph1.Eval(thisX1)
-          graph1y2 = graph1.Eval(thisX2)
-          graph1ytest = graph1.Eval(xtest)
-        if doLogGraph2 :
-          graph2y1 = self.getGraphAtXWithLog(graph2,thisX1)
-          graph2y2 = self.getGraphAtXWithLog(graph2,thisX2)
-          graph2ytest = self.getGraphAtXWithLog(graph2,xtest)
-        else :
-          graph2y1 = graph2.Eval(thisX1)
-          graph2y2 = graph2.Eval(thisX2)
-          graph2ytest = graph2.Eval(xtest)
-
-        if ((graph1y1 >= graph2y1) and (graph1y2 <= graph2y2)) :
-          if graph1ytest > graph2ytest :
-            thisX1 = xtest
-          else :
-            thisX2 = xtest
-
-        elif ((graph1y1 <= graph2y1) and (graph1y2 >= graph2y2)) :
-          if graph1ytest > graph2ytest :
-            thisX2 = xtest
-          else :
-            thisX1 = xtest
-        xtest = 0.5*(thisX1+thisX2)
-
-      crossings.append(xtest)
-
-    return crossings
+  def calculateIntersectionsOfGraphs(self, graphPairs, doLogGraph1=False, doLogGraph2=False) :
+    # Same for a list of (graph1,graph2) pairs, all solved together
+    return graphintersect.findGraphCrossings(graphPairs,doLogGraph1,doLogGraph2)
 
   def getGraphAtXWithLog(self, graph, x) :
-
-    for point in range(graph.GetN()-1) :
-      thisX1 = graph.GetX()[point]
-      thisX2 = graph.GetX()[point+1]
-      if thisX1 > x or thisX2 < x :
-        continue
-      thisY1 = graph.GetY()[point]
-      thisY2 = graph.GetY()[point+1]
-      m = (math.log(thisY2) - math.log(thisY1))/(thisX2 - thisX1)
-      lny = math.log(thisY1) + m*(x-thisX1)
-    return math.exp(lny)
+    # Value of graph at x (a number or an array), interpolating linearly in log(y)
+    return self.getLogInterpolator(graph)(x)
+
+  def getLogInterpolator(self, graph, extrapolate="raise") :
+    # Interpolators are kept per graph and rebuilt if its points change
+    key = (id(graph),extrapolate)
+    cached = self.logInterpolators.get(key)
+    if cached is None or cached[0] is not graph or \
+        not cached[1].represents(histarrays.graphX(graph),histarrays.graphY(graph)) :
+      if len(self.logInterpolators) >= 256 :
+        self.logInterpolators.clear()
+      cached = (graph, loginterp.LogLinearInterpolator.fromGraph(graph,extrapolate))
+      self.logInterpolators[key] = cached
+    return cached[1]
 
   def fixTheBloodyTickMarks(self, pad, hist, x1, x2, y1, y2, override = False) :
 
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 
 #import sys
-import ROOT
-import AtlasStyle
 import math
 from array import array
+from art.lazyroot import ROOT, lazyAttribute, ensureStyle, requestStyle
 from art.colourPalette import ColourPalette
+from art.canvasexport import CanvasExporter
+from art.plotcache import PlotCache
+from art.canvaspool import CanvasPool
+from art import ratios
+from art import histsummary
+from art import keyindex
 
 class Morisot_2p0(object) :
 
@@ -14,14 +19,24 @@ class Morisot_2p0(object) :
 
   def __init__(self) :
 
-    # Set up style
-    ROOT.SetAtlasStyle()
-    ROOT.gROOT.ForceStyle()
+    # ATLAS style: applied now if ROOT is loaded, else when it is (see lazyroot)
+    requestStyle()
 
     # Alternate output formats if requested
     self.saveCFile=False
     self.saveRootFile=False
     self.savePDF=False
+    self.savePNG=False
+    self.saveSVG=False
+
+    # Files are written out by a background thread;
+    # call flushOutput() to wait for them.
+    self.exporter = None
+
+    # Canvases and pads are reused from plot to plot, and given
+    # back when a draw method returns or raises
+    self.canvasPool = CanvasPool()
+    self.canvasPool.attach(self)
 
     # Colours
     self.colourpalette = ColourPalette()
@@ -44,29 +59,33 @@ class Morisot_2p0(object) :
     # 5 "Simulation"
     # 6 "Work in Progress"
 
-    # For internal use
-    self.myLatex = ROOT.TLatex()
-    self.myLatex.SetTextColor(ROOT.kBlack)
-    self.myLatex.SetNDC()
+  # For internal use, made when first needed
+  @lazyAttribute
+  def myLatex(self) :
+    latex = ROOT.TLatex()
+    latex.SetTextColor(ROOT.kBlack)
+    latex.SetNDC()
+    return latex
 
   ###------------------------------------------------###
   ### Helpful utilities
 
   def getFileKeys(self,open_rootfile,dir="") :
     open_rootfile.cd(dir)
-    return sorted([key.GetName() for key in ROOT.gDirectory.GetListOfKeys()])
+    return sorted(keyindex.indexOpenFile(open_rootfile).names(dir))
 
   ###------------------------------------------------###
   ### Support functions
 
   # Make a canvas
   def makeCanvas(self,name,logx=False,logy=True,doRectangular=False,scaleX=1.0,scaleY=1.0) :
+    ensureStyle()
     canvasname = name+'_cv'
     if doRectangular :
       dim = int(800*scaleX),int(600*scaleY)
     else :
       dim = int(600*scaleX),int(600*scaleY)
-    canvas = ROOT.TCanvas(canvasname,'',0,0,dim[0],dim[1])
+    canvas = self.canvasPool.acquire(canvasname,dim[0],dim[1])
     canvas.SetLogx(logx)
     canvas.SetLogy(logy)
     # Set a few helpful margins
@@ -77,33 +96,42 @@ class Morisot_2p0(object) :
   def saveCanvas(self,canvas,outputname) :
     canvas.RedrawAxis()
     canvas.Update()
-    canvas.SaveAs(outputname+".eps")
+    outputnames = [outputname+".eps"]
     simpleName = outputname.split(".")[0]
     if self.saveCFile:
-      canvas.SaveSource(simpleName+".C")
+      outputnames.append(simpleName+".C")
     if self.saveRootFile:
-      canvas.SaveSource(simpleName+".root")
+      outputnames.append(simpleName+".root")
     if self.savePDF:
-      canvas.SaveAs(simpleName+".pdf")
+      outputnames.append(simpleName+".pdf")
+    if self.savePNG:
+      outputnames.append(simpleName+".png")
+    if self.saveSVG:
+      outputnames.append(simpleName+".svg")
+    self.getExporter().export(canvas,outputnames)
+    self.canvasPool.release(canvas)
+
+  def getExporter(self) :
+    if self.exporter is None :
+      self.exporter = CanvasExporter()
+    return self.exporter
+
+  def flushOutput(self) :
+    if self.exporter is not None :
+      self.exporter.flush()
+
+  def usePlotCache(self,cachedir,maxBytes=2*1024**3) :
+    # Skip re-rendering plots whose inputs and settings are unchanged.
+    # Call self.plotCache.close() at the end to store the last plots.
+    self.plotCache = PlotCache(cachedir,maxBytes)
+    self.plotCache.attach(self)
+    return self.plotCache
 
   def setStandardTwoPads(self,logx=False,logy=False) :
       
-    # Dimensions: xlow, ylow, xup, yup
-    outpad = ROOT.TPad("extpad","extpad",0,0,1,1) # For marking outermost dimensions
-    pad1 = ROOT.TPad("pad1","pad1",0,0.27,1,1) # For main histo
-    pad2 = ROOT.TPad("pad2","pad2",0,0,1,0.27) # For residuals histo
-
-    # Set up to draw in right orientations
-    outpad.SetFillStyle(4000) #transparent
-    pad1.SetBottomMargin(0.01)
-    pad1.SetBorderMode(0)
-    pad1.SetLogy(1)
-    pad2.SetTopMargin(0.04)
-    pad2.SetBottomMargin(0.4) # 0.3
-    pad2.SetBorderMode(0)
-    pad1.Draw()
-    pad2.Draw()
-    outpad.Draw()
+    # Outer pad marks outermost dimensions, pad1 holds the main
+    # histo and pad2 the ratio: see "ratio" in canvaspool.
+    outpad,pad1,pad2 = self.canvasPool.layoutPads(ROOT.gPad.GetCanvas(),"ratio")
     pad1.SetLogx(logx)
     pad2.SetLogx(logx)
     pad1.SetLogy(logy)
@@ -168,24 +196,11 @@ class Morisot_2p0(object) :
 
   def getAxisRangesFromHist(self,hist) :
 
+    summary = histsummary.summarise(hist)
     # Get x axis limits
-    firstBin =0
-    while (hist.GetBinContent(firstBin+1)==0 and firstBin < hist.GetNbinsX()+1) :
-      firstBin+=1
-    lastBin = hist.GetNbinsX()+1
-    while (hist.GetBinContent(lastBin-1)==0 and lastBin > 0) :
-      lastBin-=1
-    if (firstBin > lastBin) :
-      firstBin=1
-      lastBin = hist.GetNbinsX()
-
+    firstBin,lastBin = summary.rangeBinsToOverflow
     # Get y axis limits
-    actualMin = 1E10
-    actualMax = 0
-    for bin in range(firstBin,lastBin) :
-      if hist.GetBinContent(bin) > actualMax : actualMax = hist.GetBinContent(bin)
-      elif hist.GetBinContent(bin) < actualMin and hist.GetBinContent(bin) != 0 : 
-        actualMin = hist.GetBinContent(bin)  
+    actualMin,actualMax = summary.contentRange(firstBin,lastBin)
 
     return hist.GetBinLowEdge(firstBin), hist.GetBinLowEdge(lastBin)+hist.GetBinWidth(lastBin), hist.GetBinLowEdge(firstBin), hist.GetBinLowEdge(lastBin), actualMin, actualMax
 
@@ -232,9 +247,11 @@ class Morisot_2p0(object) :
         if xht > maxXTrue : maxXTrue = xht
     # Now all are at their most extreme values.
     # Will use the "adjusted" min and max unless requested otherwise
+    xl = minXLoose
+    xh = maxXLoose
     if useTrueEdges :
-      xl = xlt
-      xh = xht
+      xl = minXTrue
+      xh = maxXTrue
     # And overwrite with user values if either of them is real
     if userXL is not None :
       xl = userXL
@@ -246,24 +263,13 @@ class Morisot_2p0(object) :
   def createRatio(self,hist_num,histlist_denom) :
     # Error is just bin error of hist 1 divided by hist 2
     # unless otherwise specified.
-    ratio = hist_num.Clone()
-    ratio.SetName(hist_num.GetName()+"_ratioplot")
-    ratio.SetDirectory(0)
-    ratio.Reset()
-    total_hist = hist_num.Clone()
-    total_hist.SetName(hist_num.GetName()+"_stackForDenominator")
-    total_hist.SetDirectory(0)
-    total_hist.Reset()
-    for hist_denom in histlist_denom :
-      total_hist.Add(hist_denom)
-    for bin in range (0,ratio.GetNbinsX()+2) : 
-      if total_hist.GetBinContent(bin) != 0 :
-        ratio.SetBinContent(bin,hist_num.GetBinContent(bin)/total_hist.GetBinContent(bin))
-        ratio.SetBinError(bin,hist_num.GetBinError(bin)/total_hist.GetBinContent(bin))
-      else :
-        ratio.SetBinContent(bin,0)
-        ratio.SetBinError(bin,0)
-    return ratio
+    return ratios.createRatios([hist_num],histlist_denom)[0]
+
+  def createRatios(self,hists_num,histlist_denom,errorMode="numerator") :
+    # Many numerators against one stack (or one stack each),
+    # summing each stack only once. errorMode is "numerator",
+    # "poisson" or "binomial": see art/ratios.py.
+    return ratios.createRatios(hists_num,histlist_denom,errorMode)
 
   def formatForPad2(self,hist,low=None,high=None) :
     hist.GetYaxis().SetTitleSize(0.15)
@@ -627,13 +633,14 @@ class Morisot_2p0(object) :
 
   def drawOverlaidTGraphs(self,graphs_list,names_list,xlabel="",ylabel="",plotname="",logx=False,logy=True,xmin=None,xmax=None,ymin=None,ymax=None,addHorizontalLines=[],extraLines=[]) :
 
+    if not graphs_list :
+      return
+
     c = self.makeCanvas(plotname,logx,logy)    
 
     # Set automatic axis range from graphs.
     xVals = []
     yVals = []
-    if not graphs_list :
-      return
 
     for thisgraph in graphs_list :
       thisxmin,thisxmax,thisymin,thisymax = self.getAxisRangesFromGraph(thisgraph)
@@ -0,0 +1,372 @@
+# Content-addressed cache in front of the painter draw methods.
+#
+# A draw call is identified by a hash of everything that can
+# change the picture: the numbers inside every histogram, graph
+# or function passed in, every other argument, the code of the
+# draw method and all plain settings on the painter
+# (luminosity, CME, labeltype, colour palette, output formats...).
+# If an identical call was rendered before and its output files
+# are still in place, rendering is skipped. If the outputs have
+# since been overwritten or deleted they are restored from the
+# cache store instead of being re-rendered. What the draw method
+# returned (e.g. the mass limits of drawLimitSettingPlot2Sigma) is
+# stored with the outputs and returned on a hit; calls returning
+# anything but numbers, strings, None, or lists and tuples of them
+# are always rendered.
+#
+# The store lives in cachedir/objects and is described by
+# cachedir/manifest.json. Least recently used entries are
+# evicted once the store grows beyond maxBytes.
+#
+# Usage:
+#   myPainter.usePlotCache("plotcache")
+#   ... draw as usual ...
+#   print myPainter.plotCache.summary()
+
+import os
+import json
+import time
+import atexit
+import shutil
+import hashlib
+import inspect
+from array import array
+import numpy as np
+from art import histarrays
+
+try :
+  _plainTypes = (bool,int,long,float,str,unicode)
+except NameError :
+  _plainTypes = (bool,int,float,str)
+
+# Painter attributes that hold machinery rather than settings
+_ignoredSettings = ["exporter","plotCache","savegraphs","saveplots","logInterpolators"]
+
+# Style getters folded into the hash of ROOT objects
+_styleGetters = ["GetLineColor","GetLineStyle","GetLineWidth","GetFillColor","GetFillStyle",\
+                 "GetMarkerColor","GetMarkerStyle","GetMarkerSize"]
+
+def _argNames(function) :
+  try :
+    return inspect.getfullargspec(function).args
+  except AttributeError :
+    return inspect.getargspec(function).args
+
+def _updateNumbers(digest,values) :
+  numbers = array('d',values)
+  digest.update(numbers.tobytes() if hasattr(numbers,"tobytes") else numbers.tostring())
+
+def _updateArray(digest,values) :
+  digest.update(np.ascontiguousarray(values,dtype=np.float64).tobytes())
+
+def _updateString(digest,value) :
+  digest.update(str(value).encode("utf-8"))
+
+def _updateRootObject(digest,obj) :
+
+  _updateString(digest,"{0}|{1}|{2}".format(obj.ClassName(),obj.GetName(),obj.GetTitle()))
+  _updateNumbers(digest,[getattr(obj,getter)() for getter in _styleGetters if hasattr(obj,getter)])
+
+  if obj.InheritsFrom("TH1") :
+    for axis in [obj.GetXaxis(),obj.GetYaxis(),obj.GetZaxis()] :
+      _updateString(digest,axis.GetTitle())
+      _updateNumbers(digest,[axis.GetNbins(),axis.GetXmin(),axis.GetXmax(),axis.GetFirst(),axis.GetLast()])
+      xbins = axis.GetXbins()
+      _updateNumbers(digest,[xbins.At(i) for i in range(xbins.GetSize())])
+    _updateArray(digest,histarrays.contents(obj))
+    _updateArray(digest,histarrays.errors(obj))
+    _updateNumbers(digest,[obj.GetMinimum(),obj.GetMaximum()])
+
+  elif obj.InheritsFrom("TGraph") :
+    npoints = obj.GetN()
+    _updateNumbers(digest,[npoints])
+    for getter in ["GetX","GetY","GetEX","GetEY","GetEXlow","GetEXhigh","GetEYlow","GetEYhigh"] :
+      if not hasattr(obj,getter) :
+        continue
+      values = getattr(obj,getter)()
+      if values :
+        _updateArray(digest,histarrays.bufferView(values,npoints,np.float64))
+
+  elif obj.InheritsFrom("TF1") :
+    _updateString(digest,obj.GetExpFormula())
+    _updateNumbers(digest,[obj.GetParameter(i) for i in range(obj.GetNpar())])
+    _updateNumbers(digest,[obj.GetXmin(),obj.GetXmax(),obj.GetNpx()])
+
+  else :
+    import ROOT
+    _updateString(digest,ROOT.TBufferJSON.ConvertToJSON(obj))
+
+def _updateValue(digest,value) :
+
+  if value is None or isinstance(value,_plainTypes) :
+    _updateString(digest,"{0}:{1!r}".format(type(value).__name__,value))
+  elif isinstance(value,(list,tuple)) :
+    _updateString(digest,"[{0}".format(len(value)))
+    for item in value :
+      _updateValue(digest,item)
+    _updateString(digest,"]")
+  elif isinstance(value,dict) :
+    _updateString(digest,"{{{0}".format(len(value)))
+    for item in sorted(value.keys()) :
+      _updateValue(digest,item)
+      _updateValue(digest,value[item])
+    _updateString(digest,"}")
+  elif hasattr(value,"InheritsFrom") :
+    _updateRootObject(digest,value)
+  else :
+    _updateString(digest,repr(value))
+
+def _isPlainSetting(value) :
+  if value is None or isinstance(value,_plainTypes) :
+    return True
+  if isinstance(value,(list,tuple)) :
+    return all(_isPlainSetting(item) for item in value)
+  if isinstance(value,dict) :
+    return all(_isPlainSetting(item) for item in value.values())
+  return False
+
+def painterSettings(painter) :
+  '''Plain (non-ROOT) attributes of a painter, which between
+  them hold every setting that changes what gets drawn.'''
+
+  settings = {}
+  for item in painter.__dict__ :
+    if item.startswith("_") or item in _ignoredSettings :
+      continue
+    value = painter.__dict__[item]
+    if _isPlainSetting(value) :
+      settings[item] = value
+  palette = getattr(painter,"colourpalette",None)
+  if palette is not None :
+    settings["colourpalette"] = palette.getColourPalette()
+  return settings
+
+def _encodeResult(value) :
+  # Return values of draw methods, in a form JSON keeps exactly;
+  # _unstorable for anything else
+  if value is None or isinstance(value,_plainTypes) :
+    return value
+  if isinstance(value,(list,tuple)) :
+    items = [_encodeResult(item) for item in value]
+    if any(item is _unstorable for item in items) :
+      return _unstorable
+    return {"tuple" : items} if isinstance(value,tuple) else {"list" : items}
+  return _unstorable
+
+def _decodeResult(value) :
+  if isinstance(value,dict) :
+    items = [_decodeResult(item) for item in value.get("tuple",value.get("list"))]
+    return tuple(items) if "tuple" in value else items
+  return value
+
+_unstorable = object()
+
+def fileDigest(filename) :
+  digest = hashlib.sha1()
+  with open(filename,"rb") as infile :
+    for block in iter(lambda : infile.read(1<<20),b"") :
+      digest.update(block)
+  return digest.hexdigest()
+
+def contentKey(method,callargs,settings) :
+  '''Hash of a draw method, its arguments and painter settings.'''
+
+  digest = hashlib.sha1()
+  # Hash the draw method itself, not wrappers around it (see canvaspool)
+  while hasattr(method,"__wrapped__") :
+    method = method.__wrapped__
+  function = getattr(method,"__func__",method)
+  _updateString(digest,function.__name__)
+  digest.update(function.__code__.co_code)
+  _updateValue(digest,function.__defaults__)
+  _updateValue(digest,callargs)
+  _updateValue(digest,settings)
+  return digest.hexdigest()
+
+class PlotCache(object) :
+
+  def __init__(self,cachedir,maxBytes=2*1024**3,ingestEvery=16) :
+
+    self.cachedir = cachedir
+    self.objectdir = os.path.join(cachedir,"objects")
+    self.manifestname = os.path.join(cachedir,"manifest.json")
+    self.maxBytes = maxBytes
+    self.ingestEvery = ingestEvery
+
+    if not os.path.isdir(self.objectdir) :
+      os.makedirs(self.objectdir)
+    self.manifest = {}
+    if os.path.exists(self.manifestname) :
+      with open(self.manifestname) as infile :
+        self.manifest = json.load(infile)
+
+    self.stats = {"hits" : 0, "restored" : 0, "misses" : 0, "stored" : 0, "evicted" : 0, "uncached" : 0}
+    self.pending = []
+    self.painter = None
+    self.active = False
+    atexit.register(self.close)
+
+  ## ----------------------------------------------------
+  ## User-accessible functions
+
+  def attach(self,painter) :
+    '''Route every draw method of painter that writes an output
+    file (has an outputname or plotname argument) through the cache.'''
+
+    self.painter = painter
+    for item in dir(painter.__class__) :
+      method = getattr(painter.__class__,item)
+      if item.startswith("_") or not (hasattr(method,"__code__") or hasattr(method,"__func__")) :
+        continue
+      argnames = _argNames(method)
+      for outputarg in ["outputname","plotname"] :
+        if outputarg in argnames :
+          setattr(painter,item,self._wrap(getattr(painter,item),argnames[1:],outputarg))
+          break
+
+  def lookup(self,key) :
+    '''Return True if the outputs stored under key are in place,
+    restoring them from the store if needed.'''
+
+    if key in [pending[0] for pending in self.pending] :
+      return True
+    entry = self.manifest.get(key)
+    if entry is None or "result" not in entry :
+      return False
+    for output in entry["outputs"] :
+      if os.path.exists(output["path"]) and os.path.getsize(output["path"]) == output["bytes"] \
+           and fileDigest(output["path"]) == output["sha1"] :
+        continue
+      stored = os.path.join(self.objectdir,output["stored"])
+      if not os.path.exists(stored) :
+        self._drop(key)
+        return False
+      outputdir = os.path.dirname(output["path"])
+      if outputdir and not os.path.isdir(outputdir) :
+        os.makedirs(outputdir)
+      shutil.copyfile(stored,output["path"])
+      self.stats["restored"] += 1
+    entry["lastUsed"] = time.time()
+    return True
+
+  def close(self) :
+    '''Store everything rendered so far and write the manifest.'''
+
+    self._ingestPending()
+    self._writeManifest()
+
+  def summary(self) :
+
+    lookups = self.stats["hits"]+self.stats["misses"]
+    return "Plot cache {0}: {1} hits, {2} misses ({3:.0f}% hit rate), {4} files restored, "\
+           "{5} stored, {6} evicted, {7} uncached calls; {8} entries, {9:.1f} MB".format(\
+           self.cachedir,self.stats["hits"],self.stats["misses"],\
+           100.*self.stats["hits"]/lookups if lookups else 0.,self.stats["restored"],\
+           self.stats["stored"],self.stats["evicted"],self.stats["uncached"],\
+           len(self.manifest),self._storeBytes()/1024.**2)
+
+  ## ----------------------------------------------------
+  ## Internal functions
+
+  def _wrap(self,method,argnames,outputarg) :
+
+    def cachedDraw(*args,**kwargs) :
+
+      # Draw methods calling other draw methods go straight through
+      if self.active :
+        return method(*args,**kwargs)
+
+      callargs = dict(zip(argnames,args))
+      callargs.update(kwargs)
+      if not callargs.get(outputarg) :
+        self.stats["uncached"] += 1
+        return method(*args,**kwargs)
+
+      key = contentKey(method,callargs,painterSettings(self.painter))
+      if self.lookup(key) :
+        self.stats["hits"] += 1
+        return self._cachedResult(key)
+      self.stats["misses"] += 1
+
+      exported = []
+      exporter = self.painter.getExporter()
+      exporter.listeners.append(exported.extend)
+      self.active = True
+      try :
+        result = method(*args,**kwargs)
+      finally :
+        self.active = False
+        exporter.listeners.remove(exported.extend)
+
+      # Calls whose result cannot be stored are always rendered
+      encoded = _encodeResult(result)
+      if exported and encoded is not _unstorable :
+        self.pending.append((key,exported,encoded))
+        if len(self.pending) >= self.ingestEvery :
+          self._ingestPending()
+      else :
+        self.stats["uncached"] += 1
+      return result
+
+    cachedDraw.__name__ = getattr(method,"__name__","cachedDraw")
+    cachedDraw.__doc__ = getattr(method,"__doc__",None)
+    return cachedDraw
+
+  def _cachedResult(self,key) :
+    for pending in self.pending :
+      if pending[0] == key :
+        return _decodeResult(pending[2])
+    return _decodeResult(self.manifest[key].get("result"))
+
+  def _ingestPending(self) :
+
+    if not self.pending :
+      return
+    # Outputs are written asynchronously: wait for them first
+    self.painter.flushOutput()
+    for key, outputnames, result in self.pending :
+      self._drop(key)
+      outputs = []
+      for outputname in outputnames :
+        if not os.path.exists(outputname) :
+          break
+        stored = os.path.join(key[:2],key,os.path.basename(outputname))
+        storedpath = os.path.join(self.objectdir,stored)
+        if not os.path.isdir(os.path.dirname(storedpath)) :
+          os.makedirs(os.path.dirname(storedpath))
+        shutil.copyfile(outputname,storedpath)
+        outputs.append({"path" : outputname, "stored" : stored, "bytes" : os.path.getsize(outputname),\
+                        "sha1" : fileDigest(outputname)})
+      else :
+        self.manifest[key] = {"outputs" : outputs, "lastUsed" : time.time(), "result" : result,\
+                              "bytes" : sum(output["bytes"] for output in outputs)}
+        self.stats["stored"] += 1
+    self.pending = []
+    self._evict()
+    self._writeManifest()
+
+  def _storeBytes(self) :
+    return sum(entry["bytes"] for entry in self.manifest.values())
+
+  def _evict(self) :
+
+    total = self._storeBytes()
+    if total <= self.maxBytes :
+      return
+    for key in sorted(self.manifest.keys(),key=lambda key : self.manifest[key]["lastUsed"]) :
+      if total <= self.maxBytes :
+        break
+      total -= self.manifest[key]["bytes"]
+      self._drop(key)
+      self.stats["evicted"] += 1
+
+  def _drop(self,key) :
+    if key in self.manifest :
+      del self.manifest[key]
+    shutil.rmtree(os.path.join(self.objectdir,key[:2],key),True)
+
+  def _writeManifest(self) :
+    temporary = self.manifestname+".tmp"
+    with open(temporary,"w") as outfile :
+      json.dump(self.manifest,outfile)
+    os.rename(temporary,self.manifestname)
@@ -0,0 +1,173 @@
+# Render farm for Morisot plots.
+#
+# Takes a manifest of draw calls and spreads them over a
+# pool of worker processes. Each worker sets up ATLAS style
+# once, keeps its painters and input files open between
+# plots, and reports back timing and failures per plot.
+#
+# A manifest is a JSON file holding a list of entries like
+#
+#   {"name" : "figure1",
+#    "painter" : "Morisot",
+#    "settings" : {"luminosity" : 37000, "labeltype" : 1},
+#    "method" : "drawPseudoExperimentsWithObservedStat",
+#    "args" : [{"file" : "search.root", "key" : "chi2StatHistNullCase"},
+#              12.3, 0.45, 0, "#chi^{2}", "Pseudo-experiments", "plots/chi2"],
+#    "kwargs" : {}}
+#
+# Any argument given as a {"file" : ..., "key" : ...} dictionary
+# (also inside lists) is read from that ROOT file in the worker.
+# "painter" may be "Morisot" (default) or "Morisot_2p0" and
+# "settings" are set as attributes on the painter before drawing.
+#
+# Usage: python -m art.plotfarm manifest.json [-j nWorkers]
+
+import sys
+import json
+import time
+import traceback
+import multiprocessing
+from art import lazyroot
+
+# Per-process state, filled by initialiseWorker
+_painters = {}
+_openFiles = {}
+
+def initialiseWorker() :
+
+  import ROOT
+  ROOT.gROOT.SetBatch(True)
+  lazyroot.ensureStyle()
+
+def makePainter(painterName) :
+
+  if painterName == "Morisot_2p0" :
+    from art.morisot_2p0 import Morisot_2p0
+    return Morisot_2p0()
+  elif painterName == "Morisot" :
+    from art.morisot import Morisot
+    return Morisot()
+  raise ValueError("Unknown painter {0}".format(painterName))
+
+def getPainter(painterName,settings) :
+
+  # One painter per distinct set of settings so that
+  # attributes never leak from one plot into the next
+  tag = (painterName,json.dumps(settings,sort_keys=True))
+  if tag not in _painters :
+    painter = makePainter(painterName)
+    for item in sorted(settings.keys()) :
+      setattr(painter,item,settings[item])
+    if "luminosity" in settings and hasattr(painter,"lumInFb") :
+      painter.lumInFb = round(float(painter.luminosity)/float(1000),painter.nLumiSigFigs)
+    _painters[tag] = painter
+  return _painters[tag]
+
+def getObject(filename,key) :
+
+  import ROOT
+  if filename not in _openFiles :
+    infile = ROOT.TFile.Open(filename,"READ")
+    if not infile or infile.IsZombie() :
+      raise IOError("Could not open {0}".format(filename))
+    _openFiles[filename] = infile
+  obj = _openFiles[filename].Get(key)
+  if not obj :
+    raise KeyError("No object {0} in {1}".format(key,filename))
+  if hasattr(obj,"SetDirectory") :
+    obj.SetDirectory(0)
+  return obj
+
+def resolveArgument(arg) :
+
+  if isinstance(arg,dict) :
+    if "file" in arg and "key" in arg :
+      return getObject(arg["file"],arg["key"])
+    return dict((item,resolveArgument(arg[item])) for item in arg)
+  if isinstance(arg,list) :
+    return [resolveArgument(item) for item in arg]
+  return arg
+
+def renderEntry(indexAndEntry) :
+
+  index, entry = indexAndEntry
+  result = {"index" : index,
+            "name" : entry.get("name",entry["method"]),
+            "method" : entry["method"],
+            "ok" : False,
+            "seconds" : 0.,
+            "error" : None}
+  start = time.time()
+  try :
+    painter = getPainter(entry.get("painter","Morisot"),entry.get("settings",{}))
+    args = resolveArgument(entry.get("args",[]))
+    kwargs = resolveArgument(entry.get("kwargs",{}))
+    getattr(painter,entry["method"])(*args,**kwargs)
+    # Make sure the files are really there before reporting success
+    painter.flushOutput()
+    result["ok"] = True
+  except Exception :
+    result["error"] = traceback.format_exc()
+  result["seconds"] = time.time() - start
+  return result
+
+def readManifest(manifestname) :
+
+  with open(manifestname) as infile :
+    manifest = json.load(infile)
+  if isinstance(manifest,dict) :
+    manifest = manifest["plots"]
+  return manifest
+
+def runManifest(manifest,nWorkers=None) :
+  '''Render every entry of a manifest (a list of entries or
+  the name of a JSON file holding one). Returns one result
+  dictionary per entry, in manifest order.'''
+
+  if not isinstance(manifest,list) :
+    manifest = readManifest(manifest)
+  if not nWorkers :
+    nWorkers = multiprocessing.cpu_count()
+  nWorkers = max(1,min(nWorkers,len(manifest)))
+
+  # Plots differ wildly in cost, so hand them out one at a time
+  # and let idle workers pick up the next one.
+  results = []
+  pool = multiprocessing.Pool(nWorkers,initialiseWorker)
+  try :
+    for result in pool.imap_unordered(renderEntry,enumerate(manifest),1) :
+      results.append(result)
+  finally :
+    pool.close()
+    pool.join()
+
+  return sorted(results,key=lambda result : result["index"])
+
+def summariseResults(results,wallTime=None) :
+
+  lines = []
+  failed = [result for result in results if not result["ok"]]
+  renderTime = sum(result["seconds"] for result in results)
+  for result in results :
+    status = "ok" if result["ok"] else "FAILED"
+    lines.append("{0:>5} {1:<50} {2:>8.2f} s  {3}".format(result["index"],result["name"],result["seconds"],status))
+  lines.append("Rendered {0} plots, {1} failed, {2:.1f} s of rendering".format(len(results),len(failed),renderTime))
+  if wallTime :
+    lines.append("Wall time {0:.1f} s (speedup {1:.2f})".format(wallTime,renderTime/wallTime if wallTime > 0 else 0.))
+  for result in failed :
+    lines.append("---- {0} ({1}):".format(result["name"],result["index"]))
+    lines.append(result["error"])
+  return "\n".join(lines)
+
+if __name__ == "__main__" :
+
+  import argparse
+  parser = argparse.ArgumentParser(description="Render a manifest of Morisot plots in parallel.")
+  parser.add_argument("manifest",help="JSON manifest of draw calls")
+  parser.add_argument("-j","--jobs",type=int,default=None,help="number of worker processes (default: all cores)")
+  options = parser.parse_args()
+
+  start = time.time()
+  results = runManifest(options.manifest,options.jobs)
+  print(summariseResults(results,time.time()-start))
+  sys.exit(0 if all(result["ok"] for result in results) else 1)
@@ -0,0 +1,129 @@
+# Batched ratio histograms.
+#
+# Systematic-variation plots divide dozens of numerators by the
+# same stack of backgrounds. Here every stack is summed once and
+# all ratios and their errors come out of a single vectorised
+# pass over (numerators x bins) arrays.
+#
+# Error modes:
+#   "numerator" : error of the numerator divided by the denominator
+#                 (what createRatio has always done)
+#   "poisson"   : numerator and denominator errors added in quadrature
+#                 as for independent Poisson counts
+#   "binomial"  : numerator is a subset of the denominator, as in
+#                 TH1::Divide with option "B"
+#
+# Relative differences (variation - nominal)/nominal, as drawn for
+# fit uncertainties, are done the same way for any number of
+# variations of one nominal histogram.
+
+import numpy as np
+from art import histarrays
+
+errorModes = ["numerator","poisson","binomial"]
+
+def sumStack(hists) :
+  '''Contents and squared errors of a list of histograms added together.'''
+  total = np.zeros(histarrays.nCells(hists[0]))
+  totalSumw2 = np.zeros(histarrays.nCells(hists[0]))
+  for hist in hists :
+    total += histarrays.contents(hist).ravel()
+    totalSumw2 += np.square(histarrays.errors(hist).ravel())
+  return total, totalSumw2
+
+def ratioArrays(numerators,numErrors,denominator,denomErrors,errorMode="numerator") :
+  '''Ratios and errors for arrays of numerators against denominators
+  that broadcast against them. Bins with an empty denominator get 0.'''
+
+  if errorMode not in errorModes :
+    raise ValueError("Unknown error mode {0}; choose from {1}".format(errorMode,errorModes))
+  filled = denominator != 0
+  safe = np.where(filled, denominator, 1.)
+  ratio = np.where(filled, numerators/safe, 0.)
+  if errorMode == "numerator" :
+    error = numErrors/np.abs(safe)
+  elif errorMode == "poisson" :
+    error = np.sqrt(np.square(numErrors) + np.square(ratio*denomErrors))/np.abs(safe)
+  else :
+    error = np.sqrt(np.abs((1.-2.*ratio)*np.square(numErrors) + np.square(ratio*denomErrors)))/np.abs(safe)
+  return ratio, np.where(filled, error, 0.)
+
+def createRatios(hists_num,denominators,errorMode="numerator") :
+  '''Ratio histograms for every histogram in hists_num.
+
+  denominators is either one list of histograms, stacked and used
+  for every numerator, or one such list per numerator. Stacks made of
+  the same histograms are only summed once.'''
+
+  if len(hists_num) == 0 :
+    return []
+  if len(denominators) and isinstance(denominators[0],(list,tuple)) :
+    if len(denominators) != len(hists_num) :
+      raise ValueError("Need one denominator stack per numerator")
+    stacks = [list(stack) for stack in denominators]
+  else :
+    stacks = [list(denominators)]*len(hists_num)
+
+  # Sum each distinct stack once
+  summed = {}
+  stackIndex = []
+  for stack in stacks :
+    key = tuple(id(hist) for hist in stack)
+    if key not in summed :
+      summed[key] = (len(summed),sumStack(stack))
+    stackIndex.append(summed[key][0])
+  totals = np.zeros((len(summed),histarrays.nCells(hists_num[0])))
+  totalErrors = np.zeros(totals.shape)
+  for index, (total, totalSumw2) in summed.values() :
+    totals[index] = total
+    totalErrors[index] = np.sqrt(totalSumw2)
+
+  numerators = np.array([histarrays.contents(hist).ravel() for hist in hists_num],dtype=np.float64)
+  numErrors = np.array([histarrays.errors(hist).ravel() for hist in hists_num])
+  ratio, error = ratioArrays(numerators,numErrors,totals[stackIndex],totalErrors[stackIndex],errorMode)
+
+  ratios = []
+  for index, hist_num in enumerate(hists_num) :
+    ratioHist = hist_num.Clone()
+    ratioHist.SetName(hist_num.GetName()+"_ratioplot")
+    ratioHist.SetDirectory(0)
+    ratioHist.Reset()
+    shape = histarrays.contents(ratioHist).shape
+    histarrays.setContents(ratioHist,ratio[index].reshape(shape),error[index].reshape(shape))
+    ratios.append(ratioHist)
+  return ratios
+
+def relativeDifferenceArrays(nominal,variations) :
+  '''(variation - nominal)/nominal for an array of variations against
+  one nominal array. Bins where the nominal is 0 get 0.'''
+
+  nominal = np.asarray(nominal,dtype=np.float64)
+  variations = np.asarray(variations,dtype=np.float64)
+  filled = nominal != 0
+  safe = np.where(filled, nominal, 1.)
+  return np.where(filled, (variations-nominal)/safe, 0.)
+
+def createRelativeDifferences(nominal,variations,names,templates=None,includeOverflow=False) :
+  '''Histograms of (variation - nominal)/nominal for every histogram
+  in variations, named after names. Each result is an empty clone of
+  the matching histogram in templates (default: the variation itself).
+  The overflow bin is left at 0 unless includeOverflow is set.'''
+
+  if len(variations) != len(names) :
+    raise ValueError("Need one name per variation")
+  if templates is None :
+    templates = variations
+  last = None if includeOverflow else -1
+  nominalValues = histarrays.contents(nominal)[:last]
+  values = np.array([histarrays.contents(hist)[:last] for hist in variations],dtype=np.float64)
+  differences = relativeDifferenceArrays(nominalValues,values)
+
+  results = []
+  for index, template in enumerate(templates) :
+    result = template.Clone()
+    result.SetName(names[index])
+    result.Reset()
+    result.SetDirectory(0)
+    histarrays.contents(result)[:last] = differences[index]
+    results.append(result)
+  return results
@@ -0,0 +1,81 @@
+# Compare a fresh TCanvas and TPads per plot with art.canvaspool
+# over a long run of plots: setup time, resident memory and the
+# number of canvases alive at the end. Every tenth plot raises
+# before it is saved, to check that attach() still gives its
+# canvas back.
+#
+# Usage: PYTHONPATH=. python benchmarks/bench_canvaspool.py [nPlots]
+# (run from the top of this repository)
+
+import sys
+import time
+import ROOT
+from art.canvaspool import CanvasPool, padLayouts
+
+ROOT.gROOT.SetBatch(True)
+
+def residentMB() :
+  # Current, not peak, resident size where /proc is available
+  try :
+    with open("/proc/self/statm") as statm :
+      return int(statm.read().split()[1])*4096/1024.**2
+  except (IOError,OSError) :
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+
+class FreshPainter(object) :
+
+  def drawPlot(self,hist,outputname,fail=False) :
+    canvas = ROOT.TCanvas(outputname+"_cv",'',0,0,800,600)
+    pads = [ROOT.TPad(name,name,xlow,ylow,xup,yup) for name, xlow, ylow, xup, yup, settings in padLayouts["twopad"]]
+    for pad in pads[1:]+pads[:1] :
+      pad.Draw()
+    pads[1].cd()
+    hist.Draw("HIST")
+    if fail :
+      raise RuntimeError("draw failed")
+    canvas.Update()
+
+class PooledPainter(object) :
+
+  def __init__(self) :
+    self.canvasPool = CanvasPool()
+    self.canvasPool.attach(self)
+
+  def drawPlot(self,hist,outputname,fail=False) :
+    canvas = self.canvasPool.acquire(outputname+"_cv",800,600)
+    pads = self.canvasPool.layoutPads(canvas,"twopad")
+    pads[1].cd()
+    hist.Draw("HIST")
+    if fail :
+      raise RuntimeError("draw failed")
+    canvas.Update()
+    self.canvasPool.release(canvas)
+
+def run(painter,hist,nPlots) :
+  before = residentMB()
+  start = time.time()
+  for plot in range(nPlots) :
+    try :
+      painter.drawPlot(hist,"bench_{0}".format(plot),fail=(plot%10 == 9))
+    except RuntimeError :
+      pass
+  return time.time()-start, residentMB()-before, ROOT.gROOT.GetListOfCanvases().GetSize()
+
+if __name__ == "__main__" :
+
+  nPlots = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+  hist = ROOT.TH1D("bench_hist","",100,0,100)
+  hist.SetDirectory(0)
+  hist.FillRandom("gaus",10000)
+
+  freshTime, freshMemory, freshCanvases = run(FreshPainter(),hist,nPlots)
+  pooled = PooledPainter()
+  pooledTime, pooledMemory, pooledCanvases = run(pooled,hist,nPlots)
+  assert not pooled.canvasPool.inUse
+  assert pooled.canvasPool._nCanvases() <= pooled.canvasPool.maxCanvases
+
+  print("{0} plots: fresh {1:.3f} s, +{2:.1f} MB, {3} canvases alive".format(nPlots,freshTime,freshMemory,freshCanvases))
+  print("{0} plots: pooled {1:.3f} s, +{2:.1f} MB, {3} canvases alive".format(nPlots,pooledTime,pooledMemory,pooledCanvases))
+  print("setup speedup {0:.1f}".format(freshTime/max(pooledTime,1e-9)))
+  print(pooled.canvasPool.summary())
@@ -0,0 +1,67 @@
+# Compare the old bisection in Morisot.calculateIntersectionOfGraphs
+# (with its linear-scan log interpolation) against art.graphintersect
+# for a campaign's worth of limit/theory curve pairs.
+#
+# Usage: PYTHONPATH=. python benchmarks/bench_graphintersect.py [nModels] [nPoints]
+# (run from the top of this repository)
+
+import sys
+import math
+import time
+import numpy as np
+from art import graphintersect
+
+def makeCurves(nModels,nPoints,seed) :
+  random = np.random.RandomState(seed)
+  masses = np.linspace(1000.,8000.,nPoints)
+  limit = np.exp(-masses/1500.)*(1.+0.3*random.randn(nPoints)**2)
+  curves = []
+  for model in range(nModels) :
+    theory = np.exp(2.-masses/(1000.+40.*model))
+    curves.append((masses,theory,masses,limit))
+  return curves
+
+def logAt(xs,ys,x) :
+  for point in range(len(xs)-1) :
+    if xs[point] > x or xs[point+1] < x :
+      continue
+    m = (math.log(ys[point+1])-math.log(ys[point]))/(xs[point+1]-xs[point])
+    lny = math.log(ys[point])+m*(x-xs[point])
+  return math.exp(lny)
+
+def bisectionLoop(x1,y1,x2,y2) :
+  crossings = []
+  for point in range(len(x1)-1) :
+    low, high = x1[point], x1[point+1]
+    if (y1[point] > logAt(x2,y2,low)) == (y1[point+1] > logAt(x2,y2,high)) :
+      continue
+    test = 0.5*(low+high)
+    while abs(high-low) > 0.001 :
+      aboveLow = logAt(x1,y1,low) > logAt(x2,y2,low)
+      if (logAt(x1,y1,test) > logAt(x2,y2,test)) == aboveLow :
+        low = test
+      else :
+        high = test
+      test = 0.5*(low+high)
+    crossings.append(test)
+  return crossings
+
+if __name__ == "__main__" :
+
+  nModels = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+  nPoints = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+  curves = makeCurves(nModels,nPoints,1)
+
+  start = time.time()
+  loopCrossings = [bisectionLoop(*curve) for curve in curves]
+  loopTime = time.time()-start
+
+  start = time.time()
+  batchCrossings = graphintersect.findCrossings(curves,True,True)
+  batchTime = time.time()-start
+
+  for old, new in zip(loopCrossings,batchCrossings) :
+    assert len(old) == len(new)
+    assert np.allclose(old,new,atol=0.002)
+  print("{0} pairs of {1} points: loop {2:.3f} s, batched {3:.5f} s, speedup {4:.0f}".format(\
+        nModels,nPoints,loopTime,batchTime,loopTime/max(batchTime,1e-9)))
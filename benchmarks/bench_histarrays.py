@@ -0,0 +1,81 @@
+# Compare per-bin PyROOT access with the NumPy views in
+# art.histarrays for histograms of 10^3 to 10^6 bins.
+#
+# Usage: PYTHONPATH=. python benchmarks/bench_histarrays.py [maxPower]
+# (run from the top of this repository)
+
+import sys
+import time
+import ROOT
+import numpy as np
+from art import histarrays
+
+ROOT.gROOT.SetBatch(True)
+
+def makeHist(nbins,seed) :
+  hist = ROOT.TH1D("bench_{0}_{1}".format(nbins,seed),"",nbins,0,nbins)
+  hist.SetDirectory(0)
+  hist.Sumw2()
+  values = np.random.RandomState(seed).exponential(100.,nbins+2)
+  values[values < 20] = 0
+  histarrays.setContents(hist,values,np.sqrt(values))
+  return hist
+
+def yRangeLoop(hist) :
+  lowyval = 1E10
+  highyval = -1E10
+  for bin in range(1,hist.GetNbinsX()+1) :
+    if hist.GetBinContent(bin)-hist.GetBinError(bin) < lowyval :
+      lowyval = hist.GetBinContent(bin)-hist.GetBinError(bin)
+    if hist.GetBinContent(bin)+hist.GetBinError(bin) > highyval :
+      highyval = hist.GetBinContent(bin)+hist.GetBinError(bin)
+  return lowyval,highyval
+
+def yRangeViews(hist) :
+  values = histarrays.contents(hist)[1:-1]
+  errors = histarrays.errors(hist)[1:-1]
+  return np.min(values-errors),np.max(values+errors)
+
+def ratioLoop(num,denom) :
+  ratio = num.Clone("ratioLoop")
+  ratio.Reset()
+  for bin in range(0,ratio.GetNbinsX()+2) :
+    if denom.GetBinContent(bin) != 0 :
+      ratio.SetBinContent(bin,num.GetBinContent(bin)/denom.GetBinContent(bin))
+      ratio.SetBinError(bin,num.GetBinError(bin)/denom.GetBinContent(bin))
+  return ratio
+
+def ratioViews(num,denom) :
+  ratio = num.Clone("ratioViews")
+  ratio.Reset()
+  total = histarrays.contents(denom)
+  safe = np.where(total != 0, total, 1.)
+  histarrays.setContents(ratio,np.where(total != 0, histarrays.contents(num)/safe, 0.),\
+                         np.where(total != 0, histarrays.errors(num)/safe, 0.))
+  return ratio
+
+def timeIt(function,*args) :
+  start = time.time()
+  result = function(*args)
+  return time.time()-start, result
+
+if __name__ == "__main__" :
+
+  maxPower = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+  print("{0:>10}{1:>14}{2:>14}{3:>10}{4:>14}{5:>14}{6:>10}".format(\
+        "nbins","yrange loop","yrange numpy","speedup","ratio loop","ratio numpy","speedup"))
+  for power in range(3,maxPower+1) :
+    nbins = 10**power
+    hist = makeHist(nbins,1)
+    denom = makeHist(nbins,2)
+
+    loopTime, loopRange = timeIt(yRangeLoop,hist)
+    viewTime, viewRange = timeIt(yRangeViews,hist)
+    assert np.allclose(loopRange,viewRange)
+    loopRatioTime, loopRatio = timeIt(ratioLoop,hist,denom)
+    viewRatioTime, viewRatio = timeIt(ratioViews,hist,denom)
+    assert np.allclose(histarrays.contents(loopRatio),histarrays.contents(viewRatio))
+
+    print("{0:>10}{1:>14.5f}{2:>14.5f}{3:>10.0f}{4:>14.5f}{5:>14.5f}{6:>10.0f}".format(\
+          nbins,loopTime,viewTime,loopTime/max(viewTime,1e-9),\
+          loopRatioTime,viewRatioTime,loopRatioTime/max(viewRatioTime,1e-9)))
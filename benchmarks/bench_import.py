@@ -0,0 +1,37 @@
+# Time importing the painters and making a painter, each in a
+# fresh interpreter, and check that neither loads ROOT.
+#
+# Usage: PYTHONPATH=. python benchmarks/bench_import.py [nRepeats] [module:Class ...]
+# (run from the top of this repository; defaults to art.morisot_2p0:Morisot_2p0)
+
+import sys
+import json
+import subprocess
+
+_probe = '''
+import sys, time, json
+start = time.time()
+module = __import__("{module}", fromlist=["{cls}"])
+imported = time.time()
+painter = getattr(module, "{cls}")()
+made = time.time()
+print(json.dumps({{"import" : imported-start, "construct" : made-imported,
+                   "rootLoaded" : "ROOT" in sys.modules}}))
+'''
+
+def measure(module,cls) :
+  output = subprocess.check_output([sys.executable,"-c",_probe.format(module=module,cls=cls)])
+  return json.loads(output.decode().strip().splitlines()[-1])
+
+if __name__ == "__main__" :
+
+  nRepeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+  targets = sys.argv[2:] if len(sys.argv) > 2 else ["art.morisot_2p0:Morisot_2p0"]
+  print("{0:>32}{1:>12}{2:>12}{3:>12}".format("painter","import [s]","init [s]","ROOT"))
+  for target in targets :
+    module, cls = target.split(":")
+    results = [measure(module,cls) for repeat in range(nRepeats)]
+    print("{0:>32}{1:>12.4f}{2:>12.4f}{3:>12}".format(target,\
+          min(result["import"] for result in results),\
+          min(result["construct"] for result in results),\
+          "loaded" if any(result["rootLoaded"] for result in results) else "not loaded"))